@@ -0,0 +1,277 @@
+import os, sys, json, time, argparse, statistics, tempfile
+from pathlib import Path
+from datetime import datetime, timezone
+
+# Lets `python benchmarks/history_scale.py` import the repo packages.
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+"""
+History At Scale
+
+Grows a proxy DB and a local DB with synthetic history (synthetic_history.py)
+through several sizes, and at each size times the history reads and writes
+and checks the query plans SQLite picks for them:
+
+    python benchmarks/history_scale.py --sizes 1000000,10000000,50000000
+
+    proxy  _db_fetch_history   newest rows                  ORDER BY id DESC, no sort
+    proxy  _db_search          LIKE on city/name/desc       scan in id order, no sort
+    proxy  rows_since          /history/since export        rowid range
+    proxy  _db_log             one /weather insert
+    local  fetch_history       newest rows                  ORDER BY id DESC, no sort
+    local  search_history      n-gram index                 index seeks only
+    local  fetch_cached        freshness cache              idx_wh_lookup
+    local  trend_columns       one location's trend         covering idx_wh_trends
+    local  log_weather         queued insert + flush
+
+Plans are read from the statements the functions actually run (traced), so
+a changed query is checked as it is. Exits 1 when a plan check fails, or an
+indexed read is slower than --max-ms at any size; _db_search is a LIKE scan
+whose worst case grows with the table, so it's reported against --max-scan-ms.
+"""
+
+SIZES = (100000, 1000000)
+REPEAT = 5
+INSERT_ROWS = 200
+
+# Queries for both searches: popular city, rare city, description (en/ja), and no match.
+SEARCHES = ("london", "sapporo", "rain", "小雨", "zzzz")
+
+
+def _plans(conn, statements: list[str]) -> list[list[str]]:
+    # EXPLAIN QUERY PLAN of each statement, each distinct plan once.
+
+    plans = (tuple(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql)) for sql in statements)
+    return [list(p) for p in dict.fromkeys(plans)]
+
+
+class _Trace:
+    # Collects the SELECTs run on connections it's attached to (with bound values inlined).
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, sql: str):
+        if sql.lstrip().upper().startswith("SELECT"):
+            self.statements.append(sql)
+
+    def attach(self, conn):
+        conn.set_trace_callback(self)
+        return conn
+
+
+# op -> (plan text that must appear in some statement, plan text no statement may contain)
+PLAN_RULES = {
+    "proxy.fetch_history": ((), ("USE TEMP B-TREE",)),
+    "proxy.search": ((), ("USE TEMP B-TREE",)),
+    "proxy.rows_since": (("USING INTEGER PRIMARY KEY",), ("USE TEMP B-TREE", "SCAN weather_history")),
+    "local.fetch_history": ((), ("USE TEMP B-TREE",)),
+    "local.search_history": ((), ("USE TEMP B-TREE", "SCAN weather_history", "SCAN postings", "SCAN grams")),
+    "local.fetch_cached": (("idx_wh_lookup",), ("USE TEMP B-TREE", "SCAN weather_history")),
+    "local.trend_columns": (("COVERING INDEX idx_wh_trends",), ("USE TEMP B-TREE",)),
+}
+
+# Expected to grow with the table (see --max-scan-ms).
+SCANS = ("proxy.search",)
+
+
+def check_plan(op: str, plans: list[list[str]]) -> list[str]:
+    # Problems with the plans of one op's statements (empty when fine).
+
+    need, forbid = PLAN_RULES.get(op, ((), ()))
+    lines = [line for plan in plans for line in plan]
+
+    problems = [f"{op}: plan lacks {text!r}" for text in need if not any(text in line for line in lines)]
+    problems += [f"{op}: plan has {line!r}" for text in forbid for line in lines if text in line]
+    return problems
+
+
+def _timed(fn, repeat: int = REPEAT) -> float:
+    # Median milliseconds of fn() over `repeat` runs (after one warm-up).
+
+    fn()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) * 1000.0)
+    return round(statistics.median(runs), 3)
+
+
+def measure_proxy(gen, rows: int) -> dict:
+    # Timings and plans for the proxy DB (WEATHER_DB_PATH) at its current size.
+
+    from proxy import server, history_sync
+
+    trace = _Trace()
+    connect = server._db_connect
+    server._db_connect = lambda: trace.attach(connect())
+    try:
+        ops = {}
+
+        trace.statements.clear()
+        ops["proxy.fetch_history"] = (_timed(lambda: server._db_fetch_history(25)), list(trace.statements))
+
+        for q in SEARCHES:
+            trace.statements.clear()
+            ops[f"proxy.search:{q}"] = (_timed(lambda: server._db_search(q, 25)), list(trace.statements))
+
+        def since():
+            conn = connect()
+            try:
+                trace.attach(conn)
+                history_sync.rows_since(conn, max(0, rows - 1000), 500, None)
+            finally:
+                conn.close()
+
+        trace.statements.clear()
+        ops["proxy.rows_since"] = (_timed(since), list(trace.statements))
+
+        # Inserts as /weather does them: one connection and commit per row.
+        sample = list(gen.proxy_rows(rows, rows + INSERT_ROWS))
+        start = time.perf_counter()
+        for r in sample:
+            server._db_log(
+                query_type=r[1], city=r[2], postal=r[3], country=r[4], units=r[5],
+                data=json.loads(r[11]), location_id=r[12], lang=r[13],
+            )
+        insert_ms = (time.perf_counter() - start) * 1000.0 / len(sample)
+        ops["proxy.insert"] = (round(insert_ms, 3), [])
+    finally:
+        server._db_connect = connect
+
+    conn = connect()
+    try:
+        return {op: {"ms": ms, "plan": _plans(conn, sqls)} for op, (ms, sqls) in ops.items()}
+    finally:
+        conn.close()
+
+
+def measure_local(gen, rows: int) -> dict:
+    # Timings and plans for the local DB (LOCALAPPDATA) at its current size.
+
+    from src.data import local_history, search_index
+    from benchmarks.synthetic_history import START_UTC, STEP_SEC
+
+    trace = _Trace()
+    local_history.init_db()
+    conn = trace.attach(local_history._conn)
+
+    ops = {}
+
+    # New rows are indexed by the first search after they're written (timed on its own).
+    start = time.perf_counter()
+    with local_history._lock, conn:
+        search_index.index_new_rows(conn)
+    index_ms = round((time.perf_counter() - start) * 1000.0, 1)
+
+    trace.statements.clear()
+    ops["local.fetch_history"] = (_timed(lambda: local_history.fetch_history(25)), list(trace.statements))
+
+    for q in SEARCHES:
+        trace.statements.clear()
+        ops[f"local.search_history:{q}"] = (_timed(lambda: local_history.search_history(q, 25)),
+                                            list(trace.statements))
+
+    london = gen.locations[0]
+    trace.statements.clear()
+    ops["local.fetch_cached"] = (
+        _timed(lambda: local_history.fetch_cached("city", london.name, london.country, "metric", "en", 600)),
+        list(trace.statements),
+    )
+
+    # The last week of the most popular location.
+    key = local_history.location_key("city", london.name, london.country)
+    since = datetime.fromtimestamp(START_UTC + rows * STEP_SEC - 7 * 86400, timezone.utc)
+    trace.statements.clear()
+    ops["local.trend_columns"] = (
+        _timed(lambda: local_history.trend_columns(key, since=since)),
+        list(trace.statements),
+    )
+
+    sample = list(gen.local_rows(rows, rows + INSERT_ROWS))
+    start = time.perf_counter()
+    for r in sample:
+        local_history.log_weather(
+            query_type=r[1], city=r[2], postal=r[3], country=r[4], units=r[5], lang=r[6],
+            data=json.loads(r[12])["data"],
+        )
+    local_history.flush()
+    ops["local.insert"] = (round((time.perf_counter() - start) * 1000.0 / len(sample), 3), [])
+
+    conn.set_trace_callback(None)
+    with local_history._lock:
+        result = {op: {"ms": ms, "plan": _plans(conn, sqls)} for op, (ms, sqls) in ops.items()}
+    result["local.index_new_rows"] = {"ms": index_ms, "plan": []}
+    return result
+
+
+def run(sizes=SIZES, max_ms: float = 50.0, max_scan_ms: float | None = None, seed: int = 1) -> dict:
+    # Grows both DBs through `sizes` and measures at each. Returns
+    # {"sizes": {rows: {op: {"ms", "plan"}}}, "problems": [...]}.
+
+    from benchmarks.synthetic_history import Generator, fill_proxy, fill_local
+
+    gen = Generator(seed)
+    results, problems = {}, []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proxy_db = Path(tmp) / "proxy.sqlite"
+        os.environ["WEATHER_DB_PATH"] = str(proxy_db)
+        os.environ["LOCALAPPDATA"] = str(Path(tmp) / "appdata")
+
+        from src.data import local_history
+
+        try:
+            done = 0
+            for size in sorted(sizes):
+                # Each size's own inserts (INSERT_ROWS per DB) are counted in the next fill's start.
+                local_history.close_db()
+                fill_proxy(proxy_db, size - done, start=done, gen=gen, raw_json=True)
+                fill_local(local_history.db_path(), size - done, start=done, gen=gen, raw_json=True)
+
+                ops = measure_proxy(gen, size)
+                ops.update(measure_local(gen, size))
+                done = size + INSERT_ROWS
+
+                for op, r in ops.items():
+                    base = op.split(":")[0]
+                    problems += [f"{size:,} rows: {p}" for p in check_plan(base, r["plan"])]
+
+                    limit = max_scan_ms if base in SCANS else max_ms
+                    if limit is not None and base in PLAN_RULES and r["ms"] > limit:
+                        problems.append(f"{size:,} rows: {op} took {r['ms']} ms (limit {limit} ms)")
+
+                results[size] = ops
+        finally:
+            local_history.close_db()
+
+    return {"sizes": results, "problems": problems}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Time history queries and check their plans at several DB sizes.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SIZES),
+                        help="Comma-separated row counts, e.g. 1000000,10000000,50000000")
+    parser.add_argument("--max-ms", type=float, default=50.0, help="Limit for indexed reads, at every size")
+    parser.add_argument("--max-scan-ms", type=float, default=None, help="Limit for _db_search (a LIKE scan)")
+    parser.add_argument("--plans", action="store_true", help="Include query plans in the output")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    result = run(sizes, args.max_ms, args.max_scan_ms)
+
+    for size, ops in result["sizes"].items():
+        out = {op: (r if args.plans else r["ms"]) for op, r in ops.items()}
+        print(json.dumps({"rows": size, "ms": out}, ensure_ascii=False))
+    for problem in result["problems"]:
+        print(problem, file=sys.stderr)
+
+    return 1 if result["problems"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
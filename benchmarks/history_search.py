@@ -0,0 +1,87 @@
+import os, sys, json, time, random, sqlite3, argparse, tempfile
+from pathlib import Path
+
+# Lets `python benchmarks/history_search.py` import the repo packages.
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+"""
+History Search Latency
+
+Fills a fresh local history DB with N synthetic rows, builds the n-gram search
+index, then times search_history() for a mix of queries (Latin + Japanese,
+exact, prefix and substring).
+
+    python benchmarks/history_search.py --rows 1000000 --max-ms 20
+
+Exits 1 when the slowest query takes longer than --max-ms.
+"""
+
+_CITIES = ["London", "Tokyo", "Paris", "Austin", "Osaka", "Berlin", "New York", "San Francisco", "東京", "大阪"]
+_DESCRIPTIONS = ["clear sky", "few clouds", "light rain", "overcast clouds", "snow", "mist",
+                 "快晴", "小雨", "雷雨（小雨）", "曇天", "晴れ（雲が少ない）"]
+QUERIES = ["london", "lon", "ondo", "rain", "clouds", "雨", "小雨", "晴れ", "new y", "zzz"]
+
+
+def fill(db: Path, rows: int, seed: int = 1) -> None:
+    # Writes rows straight into the table (much faster than log_weather for setup).
+
+    from src.data import local_history
+
+    local_history.init_db()
+    rng = random.Random(seed)
+
+    batch = []
+    for i in range(rows):
+        city = rng.choice(_CITIES)
+        batch.append((
+            f"2025-01-01T00:00:{i % 60:02d}+00:00", "city", city, None, "US", "metric", "en",
+            city, rng.choice(_DESCRIPTIONS), 10.0, 50, 1.0, None, None, None, 0, 0,
+        ))
+
+    conn = sqlite3.connect(db)
+    with conn:
+        conn.executemany(local_history._INSERT_SQL, batch)
+    conn.close()
+
+
+def run(rows: int, limit: int = 25) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["LOCALAPPDATA"] = tmp
+
+        from src.data import local_history
+
+        try:
+            fill(local_history.db_path(), rows)
+
+            start = time.perf_counter()
+            local_history.search_history("warm-up", limit=limit)
+            index_sec = time.perf_counter() - start
+
+            timings = {}
+            for q in QUERIES:
+                start = time.perf_counter()
+                local_history.search_history(q, limit=limit)
+                timings[q] = round((time.perf_counter() - start) * 1000.0, 3)
+        finally:
+            local_history.close_db()
+
+    return {"rows": rows, "index_sec": round(index_sec, 2), "query_ms": timings, "max_ms": max(timings.values())}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark local history search.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--max-ms", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    result = run(args.rows)
+    print(json.dumps(result, ensure_ascii=False))
+
+    return 0 if result["max_ms"] <= args.max_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
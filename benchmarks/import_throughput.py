@@ -0,0 +1,80 @@
+import io, os, sys, json, random, argparse, tempfile
+from pathlib import Path
+
+# Lets `python benchmarks/import_throughput.py` import the repo packages.
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+"""
+History Import Throughput
+
+Generates N synthetic NDJSON observations in memory and imports them into a
+fresh proxy DB with HistoryImporter (no HTTP), then reports rows/second.
+
+    python benchmarks/import_throughput.py --rows 200000 --min-rows-per-sec 100000
+
+Exits 1 when the measured rate is below --min-rows-per-sec.
+"""
+
+_CITIES = [("London", "GB"), ("Tokyo", "JP"), ("Paris", "FR"), ("Austin", "US"), ("Osaka", "JP"), ("Berlin", "DE")]
+_DESCRIPTIONS = ["clear sky", "few clouds", "light rain", "overcast clouds", "snow", "mist"]
+
+
+def make_ndjson(rows: int, seed: int = 1) -> bytes:
+    rng = random.Random(seed)
+    out = []
+
+    for i in range(rows):
+        city, country = rng.choice(_CITIES)
+        out.append(json.dumps({
+            "created_utc": f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00+00:00",
+            "city": city,
+            "country": country,
+            "units": "metric",
+            "name": city,
+            "description": rng.choice(_DESCRIPTIONS),
+            "temp": round(rng.uniform(-10, 35), 2),
+            "humidity": rng.randint(5, 100),
+            "wind_speed": round(rng.uniform(0, 20), 1),
+        }))
+
+    return ("\n".join(out) + "\n").encode("utf-8")
+
+
+def run(rows: int, defer_indexes: bool = True, batch_rows: int = 50000) -> dict:
+    # Returns the importer's final result (includes rows_per_sec).
+
+    body = make_ndjson(rows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["WEATHER_DB_PATH"] = str(Path(tmp) / "bench.sqlite")
+
+        from proxy.server import _db_connect
+        from proxy.history_import import HistoryImporter
+
+        conn = _db_connect()
+        try:
+            importer = HistoryImporter(conn, batch_rows=batch_rows, defer_indexes=defer_indexes)
+            return importer.run(io.BytesIO(body))
+        finally:
+            conn.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark /history/import throughput.")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch-rows", type=int, default=50000)
+    parser.add_argument("--keep-indexes", action="store_true", help="Maintain indexes during the import")
+    parser.add_argument("--min-rows-per-sec", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    result = run(args.rows, defer_indexes=not args.keep_indexes, batch_rows=args.batch_rows)
+    print(json.dumps({k: result[k] for k in ("imported", "rejected", "rows_per_sec")}))
+
+    return 0 if result["rows_per_sec"] >= args.min_rows_per_sec else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
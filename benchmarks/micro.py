@@ -0,0 +1,405 @@
+import os, sys, json, time, argparse, platform, tempfile, contextlib
+from pathlib import Path
+from datetime import datetime, timezone
+
+# Lets `python benchmarks/micro.py` import the repo packages.
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+"""
+Microbenchmarks
+
+Times the client's and proxy's hot paths one call at a time, saves the
+results as a JSON baseline, and compares later runs against it:
+
+    python benchmarks/micro.py run --save                 # writes benchmarks/micro_baseline.json
+    ... change something ...
+    python benchmarks/micro.py compare --threshold 0.10   # exits 1 on a >10% regression
+    python benchmarks/micro.py compare country proxy      # just some (name prefixes)
+
+    country.*     resolve_country: alpha-2, alpha-3, exact (English/Japanese), fuzzy
+    describe.*    _extract_description (en/ja), jp_description_from_weather
+    history.*     log_weather (queued + committed), fetch_history, search_history
+    proxy.*       _enforce_rate_limit over many keys, _enforce_daily_limit
+                  (single worker, and shared through SQLite like PROXY_WORKERS > 1)
+
+Everything runs offline against temp DBs, the same isolation the tests use:
+no proxy URL, no API key, nothing read from or written to the real history.
+
+Each benchmark is calibrated to run at least --min-time seconds per repeat;
+the result is the best (min) time per call over --repeat repeats, the usual
+choice for microbenchmarks since noise only ever adds time. Baselines are
+machine-specific: save one on the machine that will run the comparison.
+Anything that looks slower is measured again (--confirm) before it's
+reported, since one busy moment can easily cost a microbenchmark 30%.
+"""
+
+BASELINE = Path(__file__).resolve().parent / "micro_baseline.json"
+FORMAT = 1
+
+REPEAT = 5
+MIN_TIME = 0.1
+THRESHOLD = 0.10
+
+# compare re-measures apparent regressions this many times before reporting them.
+CONFIRM = 2
+
+# Rows in the history DB the read benchmarks run against.
+HISTORY_ROWS = 20000
+
+# Distinct callers for the rate limit benchmarks.
+RATE_KEYS = 10000
+
+_WEATHER = {
+    "coord": {"lat": 51.51, "lon": -0.13},
+    "weather": [{"id": 803, "main": "Clouds", "description": "broken clouds"}],
+    "main": {"temp": 11.2, "feels_like": 10.1, "pressure": 1012, "humidity": 81},
+    "wind": {"speed": 4.6, "deg": 250},
+    "dt": 1760000000,
+    "sys": {"country": "GB"},
+    "id": 2643743,
+    "name": "London",
+}
+
+
+@contextlib.contextmanager
+def offline_env():
+    # Temp DBs and no proxy settings for the duration, like tests/conftest.py.
+
+    keys = ("WEATHER_DB_PATH", "LOCALAPPDATA", "WEATHER_PROXY_URL", "WEATHER_PROXY_TOKEN", "OPENWEATHER_API_KEY")
+    saved = {k: os.environ.get(k) for k in keys}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for k in keys:
+            os.environ.pop(k, None)
+        os.environ["WEATHER_DB_PATH"] = str(Path(tmp) / "proxy.sqlite")
+        os.environ["LOCALAPPDATA"] = str(Path(tmp) / "appdata")
+        try:
+            yield Path(tmp)
+        finally:
+            local_history = sys.modules.get("src.data.local_history")
+            if local_history is not None:
+                local_history.flush()
+                local_history.close_db()
+
+            for k, v in saved.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+
+
+# Benchmarks: name -> setup() returning fn(loops), which makes `loops` calls.
+# Setup runs inside offline_env(); anything it builds isn't timed.
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _calls(fn, *args, **kwargs):
+    # fn(loops) calling fn(*args, **kwargs) `loops` times.
+
+    def run(loops):
+        for _ in range(loops):
+            fn(*args, **kwargs)
+    return run
+
+
+def _country(text: str, allow_fuzzy: bool = True):
+    from src.data.country_codes import resolve_country, load_countries
+
+    load_countries()
+    return _calls(resolve_country, text, allow_fuzzy=allow_fuzzy)
+
+
+benchmark("country.alpha2")(lambda: _country("jp"))
+benchmark("country.alpha3")(lambda: _country("JPN"))
+benchmark("country.exact")(lambda: _country("United Kingdom"))
+benchmark("country.exact_ja")(lambda: _country("日本"))
+benchmark("country.fuzzy")(lambda: _country("Untied Kingdm"))
+benchmark("country.miss")(lambda: _country("zzqxw"))
+
+
+@benchmark("describe.extract_en")
+def _describe_en():
+    from src.functions.get_weather import _extract_description
+    return _calls(_extract_description, _WEATHER, "en")
+
+
+@benchmark("describe.extract_ja")
+def _describe_ja():
+    from src.functions.get_weather import _extract_description
+    return _calls(_extract_description, _WEATHER, "ja")
+
+
+@benchmark("describe.jp_from_weather")
+def _describe_jp():
+    from src.data.i18n import jp_description_from_weather
+    return _calls(jp_description_from_weather, _WEATHER["weather"][0])
+
+
+def _history(rows: int = HISTORY_ROWS):
+    # Local history with `rows` synthetic rows, search index caught up.
+
+    from src.data import local_history
+    from benchmarks.synthetic_history import Generator, fill_local
+
+    if rows:
+        fill_local(local_history.db_path(), rows, gen=Generator(location_count=500))
+    local_history.search_history("")
+    return local_history
+
+
+@benchmark("history.log_weather")
+def _log_weather():
+    # Queued and committed: flush() is part of every run, so this is the real cost per row.
+
+    local_history = _history(0)
+
+    def run(loops):
+        for _ in range(loops):
+            local_history.log_weather(
+                query_type="city", city="London", postal=None, country="GB",
+                units="metric", lang="en", data=_WEATHER,
+            )
+        local_history.flush()
+    return run
+
+
+@benchmark("history.fetch_history")
+def _fetch_history():
+    return _calls(_history().fetch_history, 25)
+
+
+@benchmark("history.search_city")
+def _search_city():
+    return _calls(_history().search_history, "london", 25)
+
+
+@benchmark("history.search_substring")
+def _search_substring():
+    return _calls(_history().search_history, "rain", 25)
+
+
+def _proxy(workers: int = 1):
+    from proxy import server
+
+    server.PROXY_WORKERS = workers
+    if server._shared is not None:
+        server._shared.close()
+        server._shared = None
+    server._hits.clear()
+    server._usage_day, server._usage_count = None, 0
+    return server
+
+
+@benchmark("proxy.rate_limit")
+def _rate_limit():
+    server = _proxy()
+    keys = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(RATE_KEYS)]
+
+    def run(loops):
+        for i in range(loops):
+            server._enforce_rate_limit(keys[i % RATE_KEYS], 1 << 30)
+    return run
+
+
+@benchmark("proxy.rate_limit_shared")
+def _rate_limit_shared():
+    server = _proxy(workers=4)
+    keys = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(RATE_KEYS)]
+
+    def run(loops):
+        for i in range(loops):
+            server._enforce_rate_limit(keys[i % RATE_KEYS], 1 << 30)
+    return run
+
+
+@benchmark("proxy.daily_limit")
+def _daily_limit():
+    server = _proxy()
+    server.DAILY_LIMIT = 1 << 60
+    return _calls(server._enforce_daily_limit)
+
+
+@benchmark("proxy.daily_limit_shared")
+def _daily_limit_shared():
+    server = _proxy(workers=4)
+    server.DAILY_LIMIT = 1 << 60
+    return _calls(server._enforce_daily_limit)
+
+
+def _restore_proxy(saved: dict) -> None:
+    server = sys.modules.get("proxy.server")
+    if server is None:
+        return
+
+    if server._shared is not None:
+        server._shared.close()
+        server._shared = None
+    for k, v in saved.items():
+        setattr(server, k, v)
+    server._hits.clear()
+
+
+def measure(fn, repeat: int = REPEAT, min_time: float = MIN_TIME) -> dict:
+    # Calibrates loops so one repeat takes min_time, then times `repeat` repeats.
+
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        fn(loops)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 24:
+            break
+        loops *= 2 if elapsed < min_time / 10 else max(2, int(min_time / max(elapsed, 1e-9)) + 1)
+
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(loops)
+        runs.append((time.perf_counter() - start) / loops * 1e9)
+
+    runs.sort()
+    return {"ns": round(runs[0], 1), "median_ns": round(runs[len(runs) // 2], 1), "loops": loops, "repeat": repeat}
+
+
+def run(names=None, repeat: int = REPEAT, min_time: float = MIN_TIME, progress=None) -> dict:
+    # Runs the named benchmarks (default: all). Returns the baseline document.
+
+    names = list(names or BENCHMARKS)
+    results = {}
+
+    saved = {}
+    for name in names:
+        if name.startswith("proxy.") and not saved:
+            from proxy import server
+            saved = {k: getattr(server, k) for k in ("PROXY_WORKERS", "DAILY_LIMIT", "_usage_day", "_usage_count")}
+
+        with offline_env():
+            try:
+                results[name] = measure(BENCHMARKS[name](), repeat, min_time)
+            finally:
+                _restore_proxy(saved)
+        if progress:
+            progress(name, results[name])
+
+    return {
+        "format": FORMAT,
+        "created_utc": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = THRESHOLD) -> dict:
+    # Per benchmark ratio (current / baseline). Regressions are slower than 1 + threshold.
+
+    base, cur = baseline.get("results", {}), current.get("results", {})
+    rows = {}
+    for name in sorted(set(base) & set(cur)):
+        ratio = cur[name]["ns"] / base[name]["ns"] if base[name]["ns"] else float("inf")
+        status = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else "same"
+        rows[name] = {"baseline_ns": base[name]["ns"], "ns": cur[name]["ns"], "ratio": round(ratio, 3), "status": status}
+
+    return {
+        "threshold": threshold,
+        "benchmarks": rows,
+        "regressions": [n for n, r in rows.items() if r["status"] == "slower"],
+        "missing": sorted(set(base) - set(cur)),
+        "new": sorted(set(cur) - set(base)),
+    }
+
+
+def _select(patterns: list[str] | None) -> list[str]:
+    if not patterns:
+        return list(BENCHMARKS)
+
+    names = [n for n in BENCHMARKS if any(n.startswith(p) for p in patterns)]
+    if not names:
+        raise SystemExit(f"no benchmarks match {', '.join(patterns)} (have: {', '.join(BENCHMARKS)})")
+    return names
+
+
+def _print_result(name: str, r: dict) -> None:
+    print(f"  {name:<28} {r['ns'] / 1000.0:>10.2f} us/call", file=sys.stderr)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run microbenchmarks and compare them with a baseline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for command in ("run", "compare"):
+        p = sub.add_parser(command)
+        p.add_argument("only", nargs="*", help="Benchmark name prefixes (default: all), e.g. country proxy.rate")
+        p.add_argument("--repeat", type=int, default=REPEAT)
+        p.add_argument("--min-time", type=float, default=MIN_TIME, help="Seconds per repeat")
+
+    run_p, compare_p = sub.choices["run"], sub.choices["compare"]
+    run_p.add_argument("--save", nargs="?", const=BASELINE, type=Path, help=f"Write results (default {BASELINE.name})")
+
+    compare_p.add_argument("--baseline", type=Path, default=BASELINE)
+    compare_p.add_argument("--current", type=Path, help="Compare this saved run instead of running now")
+    compare_p.add_argument("--threshold", type=float, default=THRESHOLD, help="Allowed slowdown (0.10 = 10%%)")
+    compare_p.add_argument("--confirm", type=int, default=CONFIRM, help="Re-runs of apparent regressions")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        try:
+            baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            print(f"No baseline at {args.baseline}; make one with: python benchmarks/micro.py run --save",
+                  file=sys.stderr)
+            return 2
+
+    if args.command == "compare" and args.current:
+        current = json.loads(args.current.read_text(encoding="utf-8"))
+    else:
+        current = run(_select(args.only), args.repeat, args.min_time, progress=_print_result)
+
+    if args.command == "run":
+        if args.save:
+            args.save.write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
+            print(f"Saved {args.save}", file=sys.stderr)
+        else:
+            print(json.dumps(current, indent=2))
+        return 0
+
+    result = compare(baseline, current, args.threshold)
+
+    # A slow result may be a noisy moment: measure those again and keep the best.
+    for _ in range(0 if args.current else args.confirm):
+        if not result["regressions"]:
+            break
+        print(f"Re-running {', '.join(result['regressions'])}", file=sys.stderr)
+        again = run(result["regressions"], args.repeat, args.min_time, progress=_print_result)["results"]
+        for name, r in again.items():
+            if r["ns"] < current["results"][name]["ns"]:
+                current["results"][name] = r
+        result = compare(baseline, current, args.threshold)
+    for name, r in result["benchmarks"].items():
+        print(f"{name:<28} {r['baseline_ns'] / 1000.0:>10.2f} -> {r['ns'] / 1000.0:>10.2f} us  "
+              f"x{r['ratio']:<6} {r['status']}")
+    for name in result["missing"]:
+        print(f"{name:<28} not run")
+    for name in result["new"]:
+        print(f"{name:<28} new (no baseline)")
+
+    if result["regressions"]:
+        print(f"{len(result['regressions'])} regression(s) over {args.threshold:.0%}: "
+              f"{', '.join(result['regressions'])}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
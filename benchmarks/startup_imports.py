@@ -0,0 +1,80 @@
+import re, sys, json, argparse, statistics, subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+"""
+CLI Startup Import Time
+
+Runs `python -X importtime -c "import src.main"` a few times in fresh
+interpreters and reports how long the CLI module takes to import, i.e. the
+delay before the first prompt, plus the slowest modules it pulled in.
+
+    python benchmarks/startup_imports.py --runs 5 --max-ms 50
+
+Exits 1 when the median is over --max-ms, or when a module that should be
+loaded lazily (HEAVY) was imported at startup.
+"""
+
+# Must not be imported by `import src.main`; they load at first use instead.
+HEAVY = ("requests", "urllib3", "pycountry", "sqlite3", "numpy", "src.functions.get_weather", "src.data.local_history")
+
+# "import time:  self [us] | cumulative | imported package"
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str = "src.main") -> dict:
+    # One fresh interpreter. Returns {"total_us", "modules": {name: cumulative us}}.
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+
+    # Modules imported by `module` itself, not by interpreter startup (site etc.).
+    modules, total, current = {}, None, {}
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        cumulative, name = int(m.group(2)), m.group(4)
+        current[name] = cumulative
+        if name == module:
+            total, modules = cumulative, current
+        elif len(m.group(3)) == 1:
+            # A top-level import finished; anything before it wasn't ours.
+            current = {}
+
+    return {"total_us": total, "modules": modules}
+
+
+def run(runs: int = 5, module: str = "src.main") -> dict:
+    results = [measure(module) for _ in range(runs)]
+    median_us = statistics.median(r["total_us"] for r in results)
+
+    last = results[-1]["modules"]
+    slowest = sorted((n for n in last if n != module), key=last.get, reverse=True)[:8]
+
+    return {
+        "module": module,
+        "median_ms": round(median_us / 1000.0, 2),
+        "slowest_ms": {n: round(last[n] / 1000.0, 2) for n in slowest},
+        "heavy_imported": sorted(h for h in HEAVY if h in last),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure CLI startup import time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=50.0)
+    args = parser.parse_args(argv)
+
+    result = run(args.runs)
+    print(json.dumps(result, ensure_ascii=False))
+
+    return 0 if result["median_ms"] <= args.max_ms and not result["heavy_imported"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
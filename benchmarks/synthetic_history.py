@@ -0,0 +1,344 @@
+import os, sys, json, math, time, bisect, random, sqlite3, argparse
+from pathlib import Path
+from datetime import datetime, timezone
+
+# Lets `python benchmarks/synthetic_history.py` import the repo packages.
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+"""
+Synthetic History
+
+Fills the proxy DB and/or a client's local DB with realistic weather history,
+for checking queries, indexes and plans at production size:
+
+    python benchmarks/synthetic_history.py --rows 5000000 --proxy-db big.sqlite --local-db local/weather_history.sqlite
+
+Rows look like what /weather and the CLI write today: metric units, a few
+thousand locations with a long-tailed popularity (a handful of cities get
+most lookups), some postal queries, several languages (ja descriptions from
+the proxy's catalog, English for the rest), seasonal and latitude-dependent
+temperatures, and the raw observation JSON. Timestamps advance STEP_SEC per
+row, so rows are in id and time order like organically grown history.
+
+Generation is deterministic: row i is the same for a given seed no matter
+how many rows are written at once, so a DB can be grown in steps
+(--start 1000000 --rows 4000000 continues a 1M-row DB to 5M).
+
+Secondary indexes are dropped while filling and rebuilt at the end, like
+`history_import --defer-indexes`.
+"""
+
+LOCATIONS = 5000
+BATCH_ROWS = 50000
+
+# Rows drawn from one seeded random stream (seeding per row costs more than the row).
+BLOCK_ROWS = 4096
+
+# Seconds between rows: 50M rows span about 4.75 years.
+STEP_SEC = 3
+START_UTC = datetime(2021, 1, 1, tzinfo=timezone.utc).timestamp()
+
+# (city, alpha-2, lat, lon) of the most looked-up places; the rest are made up.
+_CITIES = [
+    ("London", "GB", 51.51, -0.13), ("Tokyo", "JP", 35.69, 139.69), ("New York", "US", 40.71, -74.01),
+    ("Paris", "FR", 48.85, 2.35), ("Osaka", "JP", 34.69, 135.50), ("Berlin", "DE", 52.52, 13.40),
+    ("Austin", "US", 30.27, -97.74), ("Sydney", "AU", -33.87, 151.21), ("São Paulo", "BR", -23.55, -46.63),
+    ("Toronto", "CA", 43.65, -79.38), ("Madrid", "ES", 40.42, -3.70), ("Seoul", "KR", 37.57, 126.98),
+    ("Mumbai", "IN", 19.08, 72.88), ("Cairo", "EG", 30.04, 31.24), ("Reykjavík", "IS", 64.15, -21.94),
+    ("Sapporo", "JP", 43.06, 141.35), ("San Francisco", "US", 37.77, -122.42), ("Lima", "PE", -12.05, -77.04),
+]
+_COUNTRIES = ["US", "GB", "JP", "DE", "FR", "ES", "IT", "CA", "AU", "BR", "IN", "MX", "SE", "NO", "KR", "ZA"]
+_SYLLABLES = ["an", "ber", "cas", "dor", "el", "fen", "gra", "hal", "ir", "jo", "ka", "lin",
+              "mor", "nor", "os", "pra", "quin", "ros", "sal", "tor", "ul", "ven", "wes", "yor", "zan"]
+
+# language -> share of lookups
+_LANGS = {"en": 60, "ja": 20, "fr": 7, "de": 7, "es": 6}
+
+# (condition id, English description, share)
+_CONDITIONS = [
+    (800, "clear sky", 30), (801, "few clouds", 14), (802, "scattered clouds", 12), (803, "broken clouds", 10),
+    (804, "overcast clouds", 12), (500, "light rain", 8), (501, "moderate rain", 4), (502, "heavy intensity rain", 1),
+    (300, "light intensity drizzle", 2), (600, "light snow", 2), (601, "snow", 1), (701, "mist", 2),
+    (741, "fog", 1), (200, "thunderstorm with light rain", 1),
+]
+
+
+class Location:
+    __slots__ = ("location_id", "ow_id", "name", "country", "lat", "lon", "postal")
+
+    def __init__(self, location_id, ow_id, name, country, lat, lon, postal=None):
+        self.location_id, self.ow_id, self.name = location_id, ow_id, name
+        self.country, self.lat, self.lon, self.postal = country, lat, lon, postal
+
+
+def locations(count: int = LOCATIONS, seed: int = 1) -> list[Location]:
+    # The location set, most popular first. Every 10th is a US postal code (no city id),
+    # which with the popularity below makes roughly a tenth of lookups postal.
+
+    rng = random.Random(f"locations:{seed}")
+    out = []
+
+    for i in range(count):
+        if i < len(_CITIES):
+            name, country, lat, lon = _CITIES[i]
+        else:
+            name = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+            country = rng.choice(_COUNTRIES)
+            lat, lon = round(rng.uniform(-55, 65), 2), round(rng.uniform(-180, 180), 2)
+
+        if i % 10 == 9:
+            out.append(Location(i + 1, None, name, "US", lat, lon, postal=f"{10000 + rng.randrange(89999):05d}"))
+        else:
+            out.append(Location(i + 1, 2_000_000 + i, name, country, lat, lon))
+
+    return out
+
+
+def _cumulative(weights) -> list[float]:
+    total, out = 0.0, []
+    for w in weights:
+        total += w
+        out.append(total)
+    return out
+
+
+class Generator:
+    # Builds rows for both DBs. Row i depends only on (seed, i).
+
+    def __init__(self, seed: int = 1, location_count: int = LOCATIONS):
+        from proxy.descriptions import CATALOGS
+
+        self.seed = seed
+        self.locations = locations(location_count, seed)
+
+        # Zipf-like popularity: the n-th location is looked up ~1/n as often.
+        self._loc_cum = _cumulative(1.0 / (n + 1) for n in range(len(self.locations)))
+        self._langs = list(_LANGS)
+        self._lang_cum = _cumulative(_LANGS.values())
+        self._cond_cum = _cumulative(c[2] for c in _CONDITIONS)
+
+        ja = CATALOGS.get("ja", {})
+        self._texts = {
+            lang: [ja.get(cid, en) if lang == "ja" else en for cid, en, _ in _CONDITIONS]
+            for lang in self._langs
+        }
+
+    def _pick(self, cum: list[float], r: float) -> int:
+        return min(bisect.bisect_right(cum, r * cum[-1]), len(cum) - 1)
+
+    def observations(self, lo: int, hi: int):
+        # Rows [lo, hi) as (created_utc, unix time, location, lang, condition index,
+        # temp, humidity, wind_speed, wind_deg).
+
+        for block in range(lo // BLOCK_ROWS, (hi - 1) // BLOCK_ROWS + 1):
+            rng = random.Random(self.seed * 1_000_003 + block)
+            first = block * BLOCK_ROWS
+            for i in range(first, min(first + BLOCK_ROWS, hi)):
+                row = self._observation(rng, i)
+                if i >= lo:
+                    yield row
+
+    def _observation(self, rng: random.Random, i: int):
+        loc = self.locations[self._pick(self._loc_cum, rng.random())]
+        lang = self._langs[self._pick(self._lang_cum, rng.random())]
+
+        ts = START_UTC + i * STEP_SEC
+        day = (ts / 86400.0) % 365.25
+        hour = (ts / 3600.0 + loc.lon / 15.0) % 24
+
+        # Warmer toward the equator, seasons flipped south of it, warmest mid-afternoon.
+        season = math.cos(2 * math.pi * (day - 200) / 365.25) * (1 if loc.lat >= 0 else -1)
+        temp = 28 - 0.45 * abs(loc.lat) + season * (4 + 0.2 * abs(loc.lat)) \
+            + 4 * math.cos(2 * math.pi * (hour - 15) / 24) + rng.gauss(0, 2.5)
+
+        created = datetime.fromtimestamp(ts, timezone.utc).isoformat()
+        return (
+            created, ts, loc, lang, self._pick(self._cond_cum, rng.random()),
+            round(temp, 2), rng.randint(15, 100), round(rng.expovariate(1 / 4.0), 2), rng.randrange(360),
+        )
+
+    def _raw(self, ts, loc, cond, temp, humidity, wind_speed, wind_deg, description) -> dict:
+        cid = _CONDITIONS[cond][0]
+        return {
+            "coord": {"lat": loc.lat, "lon": loc.lon},
+            "weather": [{"id": cid, "description": description}],
+            "main": {"temp": temp, "feels_like": temp, "pressure": 1013, "humidity": humidity},
+            "wind": {"speed": wind_speed, "deg": wind_deg},
+            "dt": int(ts) // 600 * 600,
+            "sys": {"country": loc.country},
+            "id": loc.ow_id or 0,
+            "name": loc.name,
+        }
+
+    def proxy_rows(self, lo: int, hi: int, raw_json: bool = True):
+        # Rows [lo, hi) as PROXY_INSERT_SQL parameters.
+
+        for created, ts, loc, lang, cond, temp, humidity, wind_speed, wind_deg in self.observations(lo, hi):
+            description = self._texts[lang][cond]
+            raw = None
+            if raw_json:
+                raw = json.dumps(
+                    self._raw(ts, loc, cond, temp, humidity, wind_speed, wind_deg, description),
+                    ensure_ascii=False, separators=(",", ":"),
+                )
+
+            yield (
+                created, "postal" if loc.postal else "city", None if loc.postal else loc.name, loc.postal,
+                loc.country, "metric", loc.name, description, temp, humidity, wind_speed,
+                raw, loc.location_id, lang, None,
+            )
+
+    def local_rows(self, lo: int, hi: int, raw_json: bool = True):
+        # Rows [lo, hi) as local_history._INSERT_SQL parameters.
+
+        from src.data.local_history import location_key
+
+        keys = {
+            loc.location_id: location_key("postal" if loc.postal else "city", loc.postal or loc.name, loc.country)
+            for loc in self.locations
+        }
+
+        for created, ts, loc, lang, cond, temp, humidity, wind_speed, wind_deg in self.observations(lo, hi):
+            description = self._texts[lang][cond]
+            raw = None
+            if raw_json:
+                data = self._raw(ts, loc, cond, temp, humidity, wind_speed, wind_deg, description)
+                raw = json.dumps({"lang": lang, "data": data}, ensure_ascii=False, separators=(",", ":"))
+
+            yield (
+                created, "postal" if loc.postal else "city", None if loc.postal else loc.name, loc.postal,
+                loc.country, "metric", lang, loc.name, description, temp, humidity, wind_speed,
+                raw, keys[loc.location_id], _CONDITIONS[cond][0], 1, 0,
+            )
+
+
+PROXY_INSERT_SQL = """
+    INSERT INTO weather_history (
+        created_utc, query_type, city, postal, country, units,
+        name, description, temp, humidity, wind_speed, raw_json, location_id,
+        lang, device_id
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+
+def _drop_indexes(conn: sqlite3.Connection) -> list[str]:
+    # Drops weather_history's secondary indexes. Returns the SQL to rebuild them.
+
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'weather_history' AND sql IS NOT NULL;"
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX IF EXISTS "{name}";')
+    return [sql for _, sql in indexes]
+
+
+def _fill(conn: sqlite3.Connection, sql: str, make_rows, start: int, rows: int, progress=None) -> None:
+    rebuild = _drop_indexes(conn)
+    conn.commit()
+
+    try:
+        for lo in range(start, start + rows, BATCH_ROWS):
+            hi = min(lo + BATCH_ROWS, start + rows)
+            with conn:
+                conn.executemany(sql, make_rows(lo, hi))
+            if progress:
+                progress(hi - start, rows)
+    finally:
+        with conn:
+            for index_sql in rebuild:
+                conn.execute(index_sql)
+
+
+def fill_proxy(db: Path, rows: int, start: int = 0, gen: Generator | None = None,
+               raw_json: bool = True, progress=None) -> None:
+    # Appends rows [start, start + rows) to the proxy DB at `db`, creating it if needed.
+    # Also registers the generator's locations (and their query keys) on first fill.
+
+    from proxy import server
+    from proxy.locations import normalize_query
+
+    gen = gen or Generator()
+    os.environ["WEATHER_DB_PATH"] = str(db)
+
+    conn = server._db_connect()
+    try:
+        now = datetime.now(timezone.utc).isoformat()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO locations (id, ow_id, name, country, lat, lon, updated_utc) VALUES (?, ?, ?, ?, ?, ?, ?);",
+                [(loc.location_id, loc.ow_id, loc.name, loc.country, loc.lat, loc.lon, now) for loc in gen.locations],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO location_keys (key, location_id) VALUES (?, ?);",
+                [
+                    (normalize_query("postal" if loc.postal else "city", loc.postal or loc.name, loc.country).key,
+                     loc.location_id)
+                    for loc in gen.locations
+                ],
+            )
+
+        _fill(conn, PROXY_INSERT_SQL, lambda lo, hi: gen.proxy_rows(lo, hi, raw_json), start, rows, progress)
+    finally:
+        conn.close()
+
+
+def fill_local(db: Path, rows: int, start: int = 0, gen: Generator | None = None,
+               raw_json: bool = True, progress=None) -> None:
+    # Appends rows [start, start + rows) to a client's local history DB at `db`.
+    # The search index catches up on the next search (or write), as it would in the CLI.
+
+    from src.data import local_history
+
+    gen = gen or Generator()
+
+    # Creates/migrates the DB, then lets go of it: rows go in on a plain connection.
+    with local_history._lock:
+        local_history._connect(Path(db))
+    local_history.close_db()
+
+    conn = sqlite3.connect(str(db))
+    try:
+        _fill(conn, local_history._INSERT_SQL, lambda lo, hi: gen.local_rows(lo, hi, raw_json), start, rows, progress)
+    finally:
+        conn.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Fill history DBs with synthetic weather observations.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--start", type=int, default=0, help="First row number (to grow an existing DB)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--locations", type=int, default=LOCATIONS)
+    parser.add_argument("--proxy-db", type=Path, help="Proxy weather_history.sqlite to fill")
+    parser.add_argument("--local-db", type=Path, help="Client weather_history.sqlite to fill")
+    parser.add_argument("--no-raw-json", action="store_true", help="Leave raw_json empty (smaller, faster)")
+    args = parser.parse_args(argv)
+
+    if not args.proxy_db and not args.local_db:
+        parser.error("give --proxy-db and/or --local-db")
+
+    gen = Generator(args.seed, args.locations)
+
+    def progress(done, total):
+        print(f"\r  {done:,}/{total:,} rows", end="", file=sys.stderr, flush=True)
+
+    for label, db, fill in (("proxy", args.proxy_db, fill_proxy), ("local", args.local_db, fill_local)):
+        if db is None:
+            continue
+        start = time.perf_counter()
+        print(f"{label}: {db}", file=sys.stderr)
+        fill(db, args.rows, args.start, gen, raw_json=not args.no_raw_json, progress=progress)
+        seconds = time.perf_counter() - start
+        print(file=sys.stderr)
+        print(json.dumps({"db": label, "rows": args.rows, "seconds": round(seconds, 1),
+                          "rows_per_sec": round(args.rows / seconds)}))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
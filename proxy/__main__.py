@@ -0,0 +1,89 @@
+import os, argparse, importlib.util
+
+
+"""
+Production Launcher
+
+    python -m proxy [--workers N] [--port 8000] ...
+
+Runs proxy.server:app under uvicorn with settings tuned for throughput:
+- one worker per available CPU (override with --workers / PROXY_WORKERS)
+- uvloop + httptools when installed, plain asyncio + h11 otherwise
+- longer keep-alive, a deeper accept backlog and a per-worker concurrency cap
+
+The DB schema is prepared once here, before any worker starts, and the
+workers are told how many of them share it (see PROXY_WORKERS in server.py).
+"""
+
+
+def _cpu_count() -> int:
+    # CPUs this process may actually run on (respects taskset/containers on Linux).
+
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+
+def _has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name, "").strip()
+    return int(raw) if raw else default
+
+
+def build_config(argv: list[str] | None = None) -> dict:
+    # Returns keyword arguments for uvicorn.run().
+
+    parser = argparse.ArgumentParser(prog="python -m proxy", description="Run the weather proxy.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("PORT", 8000))
+    parser.add_argument("--workers", type=int, default=_env_int("PROXY_WORKERS", _cpu_count()))
+    parser.add_argument("--keep-alive", type=int, default=_env_int("PROXY_KEEP_ALIVE", 30),
+                        help="Seconds an idle keep-alive connection stays open.")
+    parser.add_argument("--backlog", type=int, default=_env_int("PROXY_BACKLOG", 2048),
+                        help="Pending connections the OS may queue per socket.")
+    parser.add_argument("--limit-concurrency", type=int, default=_env_int("PROXY_LIMIT_CONCURRENCY", 1000),
+                        help="Open connections per worker before new ones get 503.")
+    parser.add_argument("--log-level", default=os.getenv("PROXY_LOG_LEVEL", "info"))
+
+    args = parser.parse_args(argv)
+
+    workers = max(1, args.workers)
+
+    # A recording file can only have one writer.
+    if os.getenv("UPSTREAM_MODE", "live").strip().lower() == "record":
+        workers = 1
+
+    return {
+        "host": args.host,
+        "port": args.port,
+        "workers": workers,
+        "loop": "uvloop" if _has_module("uvloop") else "asyncio",
+        "http": "httptools" if _has_module("httptools") else "h11",
+        "timeout_keep_alive": max(1, args.keep_alive),
+        "backlog": max(1, args.backlog),
+        "limit_concurrency": max(1, args.limit_concurrency),
+        "log_level": args.log_level,
+        "proxy_headers": True,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    config = build_config(argv)
+
+    # Workers read this at import time; it must be set before they spawn.
+    os.environ["PROXY_WORKERS"] = str(config["workers"])
+
+    # Creates/migrates the schema (and turns on WAL) once, so workers don't race on it.
+    from proxy.server import _db_init
+    _db_init()
+
+    import uvicorn
+    uvicorn.run("proxy.server:app", **config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import asyncio
+
+
+"""
+Upstream Micro-Batching
+
+Cache misses for cities whose OpenWeather id is known can share one call to
+OpenWeather's group endpoint (up to 20 ids per call) instead of one call each:
+
+    miss id=2643743 ─┐
+    miss id=1850147 ─┼─ wait GROUP_WINDOW_MS ─> /data/2.5/group?id=1850147,2643743,5128581
+    miss id=5128581 ─┘
+
+The first miss opens a short window; everything that arrives in it (or the
+first GROUP_MAX_IDS ids, whichever comes first) goes out as one request and
+each caller gets its own observation back. Ids the group response leaves out
+come back as None, and the caller falls back to a single call for them.
+"""
+
+# OpenWeather's limit on ids per group call.
+GROUP_MAX_IDS = 20
+
+
+class GroupBatcher:
+    # Collects ids for `window` seconds and fetches them with one fetch_group(ids) call.
+    # fetch_group: async (sorted list of ids) -> {id: observation}
+
+    def __init__(self, fetch_group, window: float, max_ids: int = GROUP_MAX_IDS):
+        self._fetch_group = fetch_group
+        self.window = max(0.0, float(window))
+        self.max_ids = max(1, min(int(max_ids), GROUP_MAX_IDS))
+
+        self._pending = {}      # id -> future shared by everyone waiting for it
+        self._timer = None
+        self._tasks = set()     # running group calls (kept referenced until done)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def get(self, ow_id: int) -> dict | None:
+        # The observation for one city id, or None if the group call didn't include it.
+        # Raises whatever the group call raised.
+
+        fut = self._pending.get(ow_id)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            self._pending[ow_id] = fut
+
+            if len(self._pending) >= self.max_ids:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+
+        return await asyncio.shield(fut)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: dict) -> None:
+        try:
+            found = await self._fetch_group(sorted(batch))
+        except Exception as exc:
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(exc)
+                    # Marks it retrieved even if every waiter was cancelled.
+                    fut.exception()
+            return
+
+        for ow_id, fut in batch.items():
+            if not fut.done():
+                fut.set_result(found.get(ow_id))
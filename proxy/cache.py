@@ -0,0 +1,101 @@
+import time, asyncio
+from collections import OrderedDict
+
+
+"""
+Response Cache + Request Coalescing
+
+OpenWeather only refreshes current conditions every ~10 minutes, so repeat
+lookups for the same canonical location can be served from memory.
+Concurrent misses for the same key share a single upstream call.
+"""
+
+
+class TTLCache:
+    # Small LRU cache where every entry expires after `ttl` seconds.
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self._items = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key):
+        # Returns the cached value, or None if missing/expired.
+
+        item = self._items.get(key)
+        if item is None:
+            return None
+
+        expires, value = item
+        if expires <= time.monotonic():
+            del self._items[key]
+            return None
+
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else float(ttl)
+        if ttl <= 0:
+            return
+
+        self._items[key] = (time.monotonic() + ttl, value)
+        self._items.move_to_end(key)
+
+        # Drops least-recently-used entries once we're over the cap.
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+class _Abandoned(Exception):
+    # Set on a shared call whose leader was cancelled, so a waiter takes it over.
+    pass
+
+
+class Coalescer:
+    # Runs at most one `factory()` per key at a time.
+    # Callers arriving while it's running await the same result (or exception).
+    # If the caller running it is cancelled (its client went away), one of the
+    # waiters starts it again instead of every waiter failing with it.
+
+    def __init__(self):
+        self._inflight = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key, factory):
+        while True:
+            fut = self._inflight.get(key)
+            if fut is None:
+                break
+            try:
+                return await asyncio.shield(fut)
+            except _Abandoned:
+                continue
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            fut.set_exception(_Abandoned())
+            fut.exception()
+            raise
+        except BaseException as exc:
+            fut.set_exception(exc)
+            # Marks the exception as retrieved when nobody else was waiting.
+            fut.exception()
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
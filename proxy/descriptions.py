@@ -0,0 +1,100 @@
+"""
+Condition Descriptions
+
+The proxy asks OpenWeather for each observation once, without `lang` (so the
+text comes back in English), and caches that one language-neutral copy.
+Each response then gets weather[].description rendered for the caller's
+language from a condition-id catalog below. Every language shares the same
+upstream call and cache entry; supporting one more is one more catalog.
+
+Ids a catalog doesn't have, and languages without a catalog, keep
+OpenWeather's English text.
+"""
+
+# lang -> OpenWeather condition id -> description.
+# "ja" matches the client's JP_WEATHER_ID (src/data/i18n.py), so cached and fresh text agree.
+CATALOGS = {
+    "ja": {
+        # Thunderstorm (200-232)
+        200: "雷雨（小雨）",
+        201: "雷雨（雨）",
+        202: "雷雨（大雨）",
+        210: "弱い雷雨",
+        211: "雷雨",
+        212: "強い雷雨",
+        221: "雷雨（不規則）",
+        230: "雷雨（霧雨）",
+        231: "雷雨（霧雨）",
+        232: "雷雨（強い霧雨）",
+
+        # Drizzle (300-321)
+        300: "霧雨",
+        301: "霧雨",
+        302: "強い霧雨",
+        310: "霧雨（小雨）",
+        311: "霧雨（雨）",
+        312: "霧雨（強い雨）",
+        313: "にわか雨",
+        314: "強いにわか雨",
+        321: "霧雨",
+
+        # Rain (500-531)
+        500: "小雨",
+        501: "雨",
+        502: "強い雨",
+        503: "非常に強い雨",
+        504: "豪雨",
+        511: "氷雨",
+        520: "にわか雨",
+        521: "強いにわか雨",
+        522: "激しいにわか雨",
+        531: "不規則なにわか雨",
+
+        # Snow (600-622)
+        600: "小雪",
+        601: "雪",
+        602: "大雪",
+        611: "みぞれ",
+        612: "にわかみぞれ",
+        613: "みぞれ",
+        615: "雨と雪",
+        616: "雨と雪",
+        620: "にわか雪",
+        621: "強いにわか雪",
+        622: "激しいにわか雪",
+
+        # Atmosphere (701-781)
+        701: "霧",
+        711: "煙",
+        721: "もや",
+        731: "砂塵",
+        741: "霧",
+        751: "砂",
+        761: "ちり",
+        762: "火山灰",
+        771: "スコール",
+        781: "竜巻",
+
+        # Clear/Clouds (800-804)
+        800: "快晴",
+        801: "晴れ（雲が少ない）",
+        802: "晴れ（雲が散らばっている）",
+        803: "くもり（雲が多い）",
+        804: "曇天",
+    },
+}
+
+
+def render(weather: list | None, lang: str) -> list | None:
+    # weather[] with each description in `lang`, as a new list: the cached
+    # observation is shared by every caller and never modified.
+
+    catalog = CATALOGS.get(lang)
+    if not catalog or not weather:
+        return weather
+
+    out = []
+    for item in weather:
+        text = catalog.get(item.get("id")) if isinstance(item, dict) else None
+        out.append(dict(item, description=text) if text else item)
+    return out
@@ -0,0 +1,158 @@
+import math, bisect
+from array import array
+from typing import NamedTuple
+from proxy import descriptions
+from proxy.units import convert
+
+
+"""
+Forecasts
+
+/forecast serves OpenWeather's 5-day / 3-hour forecast (40 steps). Like
+/weather, it's fetched once per location in canonical units and English,
+cached, and shared by every caller, language and units.
+
+A forecast is cached as parallel arrays (one per field, float32 where the
+values allow) instead of 40 nested JSON dicts: a sixth of the memory or
+less, so many more locations fit in the same cache.
+
+Nowcasts: the current conditions, interpolated from a cached forecast
+between the steps around "now". /weather serves one instead of calling
+OpenWeather when the daily budget is nearly spent (see NOWCAST_AT_USAGE in
+server.py), and /forecast?nowcast=true asks for one directly.
+"""
+
+# Step fields kept per forecast, besides dt and the condition id.
+# Missing values are stored as NaN.
+_FLOAT_FIELDS = ("temp", "feels_like", "humidity", "pressure", "wind_speed", "wind_deg", "pop")
+
+# Forecast steps are 3 hours apart; a nowcast may look this far before the first one.
+STEP_SEC = 3 * 3600
+
+
+class Forecast(NamedTuple):
+    city: dict          # OpenWeather's "city" block (id, name, coord, country, timezone...)
+    dt: array           # step times, unix seconds ('q')
+    weather_id: array   # condition id per step ('H', 0 = unknown)
+    fields: dict        # _FLOAT_FIELDS name -> array('f')
+    texts: dict         # condition id -> upstream (English) description
+
+
+def _number(value) -> float:
+    return float(value) if type(value) in (int, float) else math.nan
+
+
+def _value(x: float):
+    # float32 back to a JSON number (None for NaN), rounded to what OpenWeather sends.
+    return None if math.isnan(x) else round(x, 2)
+
+
+def compact(data: dict) -> Forecast:
+    # OpenWeather forecast JSON -> Forecast. Raises ValueError if it has no steps.
+
+    steps = sorted(
+        (s for s in (data.get("list") or []) if isinstance(s, dict) and type(s.get("dt")) is int),
+        key=lambda s: s["dt"],
+    )
+    if not steps:
+        raise ValueError("forecast has no steps")
+
+    dt, weather_id, texts = array("q"), array("H"), {}
+    fields = {name: array("f") for name in _FLOAT_FIELDS}
+
+    for s in steps:
+        main, wind = s.get("main") or {}, s.get("wind") or {}
+        weather0 = (s.get("weather") or [{}])[0] or {}
+
+        dt.append(s["dt"])
+        wid = weather0.get("id")
+        weather_id.append(wid if type(wid) is int and 0 < wid < 65536 else 0)
+        if weather_id[-1] and weather0.get("description"):
+            texts.setdefault(wid, weather0["description"])
+
+        for name, value in (
+            ("temp", main.get("temp")), ("feels_like", main.get("feels_like")),
+            ("humidity", main.get("humidity")), ("pressure", main.get("pressure")),
+            ("wind_speed", wind.get("speed")), ("wind_deg", wind.get("deg")), ("pop", s.get("pop")),
+        ):
+            fields[name].append(_number(value))
+
+    return Forecast(dict(data.get("city") or {}), dt, weather_id, fields, texts)
+
+
+def _step(fc: Forecast, i: int) -> dict:
+    # One step in canonical units, shaped like OpenWeather's.
+
+    f = {name: _value(values[i]) for name, values in fc.fields.items()}
+    wid = fc.weather_id[i] or None
+
+    return {
+        "dt": fc.dt[i],
+        "main": {"temp": f["temp"], "feels_like": f["feels_like"], "humidity": f["humidity"], "pressure": f["pressure"]},
+        "wind": {"speed": f["wind_speed"], "deg": f["wind_deg"]},
+        "weather": [{"id": wid, "description": fc.texts.get(wid)}],
+        "pop": f["pop"],
+    }
+
+
+def render(fc: Forecast, units: str, lang: str) -> list[dict]:
+    # Every step in `units` and `lang`.
+
+    out = []
+    for i in range(len(fc.dt)):
+        step = convert(_step(fc, i), units)
+        step["weather"] = descriptions.render(step["weather"], lang)
+        out.append(step)
+    return out
+
+
+def _lerp(a: float, b: float, w: float) -> float:
+    if math.isnan(a):
+        return b
+    if math.isnan(b):
+        return a
+    return a + (b - a) * w
+
+
+def _lerp_deg(a: float, b: float, w: float) -> float:
+    # Wind direction the short way round (350° -> 10° passes through 0°, not 180°).
+
+    if math.isnan(a) or math.isnan(b):
+        return _lerp(a, b, w)
+    return (a + ((b - a + 180.0) % 360.0 - 180.0) * w) % 360.0
+
+
+def nowcast(fc: Forecast, now: float) -> dict | None:
+    # Conditions at `now` (unix seconds) interpolated from the forecast, shaped like
+    # a /weather observation (canonical units, English). None outside the forecast.
+
+    if not fc.dt or now < fc.dt[0] - STEP_SEC or now > fc.dt[-1]:
+        return None
+
+    j = bisect.bisect_left(fc.dt, now)
+    if j == 0:
+        i = j = 0
+        w = 0.0
+    else:
+        i = j - 1
+        w = (now - fc.dt[i]) / (fc.dt[j] - fc.dt[i])
+
+    f = {name: values[i] if i == j else _lerp(values[i], values[j], w) for name, values in fc.fields.items()}
+    if i != j:
+        f["wind_deg"] = _lerp_deg(fc.fields["wind_deg"][i], fc.fields["wind_deg"][j], w)
+    f = {name: _value(v) for name, v in f.items()}
+
+    # Conditions don't interpolate: the nearer step's.
+    wid = fc.weather_id[j if w >= 0.5 else i] or None
+    city = fc.city
+
+    return {
+        "id": city.get("id"),
+        "name": city.get("name"),
+        "coord": city.get("coord"),
+        "dt": int(now),
+        "sys": {"country": city.get("country")},
+        "main": {"temp": f["temp"], "feels_like": f["feels_like"], "humidity": f["humidity"], "pressure": f["pressure"]},
+        "wind": {"speed": f["wind_speed"], "deg": f["wind_deg"]},
+        "weather": [{"id": wid, "description": fc.texts.get(wid)}],
+    }
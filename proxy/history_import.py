@@ -0,0 +1,481 @@
+import gc, os, re, sys, json, time, httpx, sqlite3, argparse
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from proxy.locations import normalize_query
+from proxy.units import UNITS, CANONICAL, convert, convert_temp, convert_speed
+
+
+"""
+Bulk History Import
+
+Loads NDJSON observations (one JSON object per line) into weather_history:
+
+    {"created_utc": "2025-01-01T00:00:00+00:00", "city": "London", "country": "GB",
+     "units": "metric", "name": "London", "description": "few clouds",
+     "temp": 4.2, "humidity": 81, "wind_speed": 3.1, "raw": {...}}
+
+Rows are validated in batches and written with executemany(), one large
+transaction per batch. With defer_indexes, weather_history's plain secondary
+indexes are dropped for the import and rebuilt once at the end. Unique and
+partial ones stay: the sync dedupe index (see history_sync.py) has to keep
+working for uploads that arrive during the import.
+
+CLI:
+    python -m proxy.history_import archive.ndjson --url https://host/history/import --token T
+    python -m proxy.history_import archive.ndjson --db proxy/weather_history.sqlite
+"""
+
+_UNITS = frozenset(UNITS)
+
+# "2025-01-01T00:00" / "2025-01-01 00:00" prefix. A regex match is much cheaper
+# per row than a full datetime parse, and SQLite only needs the sortable prefix.
+_ISO_PREFIX = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}")
+
+_NUMBER = (int, float)
+
+# Far outside any real reading; also keeps ints within SQLite's 64-bit range.
+_MAX_MEASUREMENT = 1e15
+
+_INSERT_SQL = """
+    INSERT INTO weather_history (
+        created_utc, query_type, city, postal, country, units,
+        name, description, temp, humidity, wind_speed, raw_json, location_id
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+
+def _measurement(value, field: str):
+    # A finite number (or None). JSON allows Infinity/NaN, which would otherwise
+    # be stored as is, or overflow on int() and abort the whole import.
+
+    if value is None:
+        return None
+    # type() (not isinstance) so JSON true/false aren't accepted as numbers.
+    if type(value) not in _NUMBER:
+        raise ValueError(f"{field} must be a number")
+    # Written so NaN fails too (every comparison with it is false).
+    if not abs(value) < _MAX_MEASUREMENT:
+        raise ValueError(f"{field} must be a finite number")
+    return value
+
+
+def parse_observation(obj) -> tuple:
+    # Validates one decoded NDJSON object.
+    # Returns the weather_history column tuple (location_id filled in later), or raises ValueError.
+    # Runs once per row, so it sticks to plain type checks and dict lookups.
+
+    if type(obj) is not dict:
+        raise ValueError("line is not a JSON object")
+
+    get = obj.get
+
+    created_utc = get("created_utc")
+    if type(created_utc) is not str or not _ISO_PREFIX.match(created_utc):
+        raise ValueError("created_utc must be an ISO 8601 timestamp")
+
+    city, postal, name, description = get("city"), get("postal"), get("name"), get("description")
+    if city is not None and type(city) is not str:
+        raise ValueError("city must be a string")
+    if postal is not None and type(postal) is not str:
+        raise ValueError("postal must be a string")
+    if name is not None and type(name) is not str:
+        raise ValueError("name must be a string")
+    if description is not None and type(description) is not str:
+        raise ValueError("description must be a string")
+
+    city = city.strip() or None if city else None
+    postal = postal.strip() or None if postal else None
+
+    query_type = get("query_type") or ("city" if city else "postal")
+    if query_type == "city":
+        if not city:
+            raise ValueError("city is required")
+    elif query_type == "postal":
+        if not postal:
+            raise ValueError("postal is required")
+    else:
+        raise ValueError("query_type must be 'city' or 'postal'")
+
+    country = get("country")
+    if type(country) is not str or len(country) != 2 or not country.isalpha():
+        raise ValueError("country must be an alpha-2 code")
+
+    units = get("units") or "metric"
+    if units not in _UNITS:
+        raise ValueError(f"units must be one of {sorted(_UNITS)}")
+
+    temp = _measurement(get("temp"), "temp")
+    humidity = _measurement(get("humidity"), "humidity")
+    wind_speed = _measurement(get("wind_speed"), "wind_speed")
+
+    raw = get("raw")
+
+    # Stored in canonical units (see units.py), like everything /weather logs.
+    if units != CANONICAL:
+        temp = convert_temp(temp, units, to_canonical=True)
+        wind_speed = convert_speed(wind_speed, units, to_canonical=True)
+        raw = convert(raw, units, to_canonical=True)
+        units = CANONICAL
+
+    return (
+        created_utc,
+        query_type,
+        city,
+        postal,
+        country.upper(),
+        units,
+        name,
+        description,
+        temp,
+        int(humidity) if humidity is not None else None,
+        wind_speed,
+        json.dumps(raw, separators=(",", ":")) if raw is not None else None,
+    )
+
+
+@contextmanager
+def _gc_paused():
+    # Building hundreds of thousands of dicts keeps triggering the cyclic GC,
+    # which costs more than the JSON decoding itself. Reference counting still
+    # frees everything; only cycle collection waits until the batch is parsed.
+
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def _decode_lines(lines: list[bytes]) -> list | None:
+    # Decodes a whole batch with one json.loads call (much less per-row overhead).
+    # Returns None if any line is invalid, or holds more than one value,
+    # so the caller can fall back to line-by-line decoding with precise errors.
+
+    try:
+        objs = json.loads(b"[" + b",".join(lines) + b"]")
+    except ValueError:
+        return None
+
+    return objs if len(objs) == len(lines) else None
+
+
+class HistoryImporter:
+    # Reads NDJSON from a binary file object and writes it to weather_history.
+    # Each import_batch() call parses up to `batch_rows` lines and commits them in one transaction.
+    # Everything here is blocking; the server runs it in a worker thread.
+
+    _CHUNK_BYTES = 1 << 20
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        batch_rows: int = 50000,
+        defer_indexes: bool = False,
+        max_errors: int = 20,
+        max_line_bytes: int = 65536,
+    ):
+        self.conn = conn
+        self.batch_rows = max(1, int(batch_rows))
+        self.defer_indexes = defer_indexes
+        self.max_errors = max_errors
+        self.max_line_bytes = max(1, int(max_line_bytes))
+
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.lines = 0
+
+        self._started = time.perf_counter()
+        self._dropped_indexes = None
+
+        # Read-ahead state for _read_lines(): split lines (reversed, so pop() is next),
+        # the unfinished last line, and whether we're inside an oversized line.
+        self._buffer = []
+        self._tail = b""
+        self._skipping = False
+
+        # Single writer thread + the batch it's currently committing.
+        self._writer = None
+        self._writing = None
+
+        # Known normalized queries -> canonical location id (see proxy/locations.py).
+        self._location_ids = dict(conn.execute("SELECT key, location_id FROM location_keys;").fetchall())
+        self._resolved = {}
+
+    def _reject(self, lineno: int, error: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": lineno, "error": error})
+
+    def _read_lines(self, fh) -> tuple[list[bytes], list[int], bool]:
+        # Reads up to batch_rows non-blank lines, in large chunks rather than line by line.
+        # Returns (lines, their line numbers, reached_eof). Oversized lines are rejected and skipped.
+
+        lines, numbers = [], []
+        limit = self.max_line_bytes
+
+        while len(lines) < self.batch_rows:
+            if not self._buffer:
+                chunk = fh.read(self._CHUNK_BYTES)
+                if not chunk:
+                    if self._tail:
+                        self._buffer.append(self._tail)
+                        self._tail = b""
+                    else:
+                        return lines, numbers, True
+                else:
+                    parts = (self._tail + chunk).split(b"\n")
+                    self._tail = parts.pop()
+                    self._buffer.extend(reversed(parts))
+
+                    # A partial line longer than the cap can't become valid; drop it as it streams.
+                    if len(self._tail) > limit:
+                        self._tail = b""
+                        self._skipping = True
+
+                    if not parts:
+                        continue
+
+            line = self._buffer.pop()
+            self.lines += 1
+
+            if self._skipping or len(line) > limit:
+                self._skipping = False
+                self._reject(self.lines, f"line longer than {limit} bytes")
+                continue
+
+            line = line.strip()
+            if line:
+                lines.append(line)
+                numbers.append(self.lines)
+
+        return lines, numbers, False
+
+    def _parse(self, lines: list[bytes], numbers: list[int]) -> list[tuple]:
+        rows = []
+        resolved = self._resolved
+
+        with _gc_paused():
+            objs = _decode_lines(lines)
+
+            for i, line in enumerate(lines):
+                try:
+                    # json.JSONDecodeError is a ValueError too.
+                    row = parse_observation(objs[i] if objs is not None else json.loads(line))
+                except ValueError as exc:
+                    self._reject(numbers[i], str(exc))
+                    continue
+
+                # Archives repeat a handful of locations, so each spelling is normalized once.
+                spelling = (row[1], row[2] or row[3], row[4])
+                location_id = resolved.get(spelling, -1)
+                if location_id == -1:
+                    lq = normalize_query(*spelling)
+                    location_id = resolved[spelling] = self._location_ids.get(lq.key)
+
+                rows.append(row + (location_id,))
+
+        return rows
+
+    def _drop_indexes(self) -> None:
+        # Remembers and drops weather_history's plain secondary indexes for the rest of the import.
+        # Unique/partial ones enforce rules (sync idempotency) and are left in place.
+
+        plain = {
+            name
+            for _, name, unique, origin, partial in self.conn.execute("PRAGMA index_list(weather_history);")
+            if origin == "c" and not unique and not partial
+        }
+        self._dropped_indexes = [
+            (name, sql)
+            for name, sql in self.conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'weather_history' AND sql IS NOT NULL;"
+            )
+            if name in plain
+        ]
+        for name, _ in self._dropped_indexes:
+            self.conn.execute(f'DROP INDEX IF EXISTS "{name}";')
+
+    def _write(self, rows: list[tuple]) -> int:
+        # One transaction per batch; `with conn` rolls it back if anything fails.
+
+        with self.conn:
+            if self.defer_indexes and self._dropped_indexes is None:
+                self._drop_indexes()
+            self.conn.executemany(_INSERT_SQL, rows)
+
+        return len(rows)
+
+    def _wait_for_write(self) -> None:
+        # Collects the previous batch's write (re-raising its error, if any).
+
+        if self._writing is not None:
+            future, self._writing = self._writing, None
+            self.imported += future.result()
+
+    def import_batch(self, fh) -> dict | None:
+        # Parses the next batch while the previous one is still being written.
+        # sqlite3 releases the GIL while it steps, so parsing and inserting overlap.
+        # Returns progress (committed rows), or None once the input is exhausted.
+
+        lines, numbers, eof = self._read_lines(fh)
+        rows = self._parse(lines, numbers)
+
+        self._wait_for_write()
+
+        if rows:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-import")
+            self._writing = self._writer.submit(self._write, rows)
+
+        if eof and not lines:
+            self._wait_for_write()
+            return None
+
+        return self.progress()
+
+    def progress(self) -> dict:
+        elapsed = max(time.perf_counter() - self._started, 1e-9)
+        return {
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "rows_per_sec": round(self.imported / elapsed),
+        }
+
+    def restore_indexes(self) -> None:
+        # Recreates anything _drop_indexes() removed. Safe to call more than once.
+
+        if self._dropped_indexes:
+            with self.conn:
+                for _, sql in self._dropped_indexes:
+                    self.conn.execute(sql)
+            self._dropped_indexes = []
+
+    def close(self) -> None:
+        # Waits for any in-flight write and stops the writer thread.
+
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+
+    def finish(self) -> dict:
+        # Waits for the last write, rebuilds deferred indexes, refreshes planner stats.
+
+        self._wait_for_write()
+        self.close()
+        self.restore_indexes()
+        self.conn.execute("PRAGMA optimize;")
+
+        result = self.progress()
+        result["done"] = True
+        result["errors"] = self.errors
+        return result
+
+    def fail(self, exc: BaseException) -> dict:
+        # Final status line when a batch or the finish step raised.
+        # The failed transaction was already rolled back; committed batches stay.
+
+        try:
+            self._wait_for_write()
+        except Exception:
+            pass
+        self.close()
+
+        try:
+            self.conn.rollback()
+            self.restore_indexes()
+        except sqlite3.Error:
+            pass
+
+        result = self.progress()
+        result["done"] = False
+        result["error"] = f"{type(exc).__name__}: {exc}"
+        result["errors"] = self.errors
+        return result
+
+    def run(self, fh, report=None) -> dict:
+        # Imports everything from `fh`; calls report(progress) after each batch.
+
+        try:
+            while True:
+                progress = self.import_batch(fh)
+                if progress is None:
+                    return self.finish()
+                if report:
+                    report(progress)
+        except sqlite3.Error as exc:
+            return self.fail(exc)
+
+
+def _import_direct(fh, db_path: str | None, batch_rows: int, defer_indexes: bool) -> dict:
+    # Imports straight into a local proxy DB (no HTTP).
+
+    if db_path:
+        os.environ["WEATHER_DB_PATH"] = db_path
+
+    from proxy.server import _db_connect
+
+    conn = _db_connect()
+    try:
+        importer = HistoryImporter(conn, batch_rows=batch_rows, defer_indexes=defer_indexes)
+        report = lambda progress: print(json.dumps(progress), file=sys.stderr)
+        return importer.run(fh, report=report)
+    finally:
+        conn.close()
+
+
+def _import_http(fh, url: str, token: str | None, batch_rows: int, defer_indexes: bool) -> dict:
+    # Streams the file to /history/import and echoes its progress lines.
+
+    headers = {"Content-Type": "application/x-ndjson"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+
+    params = {"batch_rows": batch_rows, "defer_indexes": str(defer_indexes).lower()}
+
+    def body():
+        for line in fh:
+            yield line
+
+    result = {}
+    with httpx.stream("POST", url, params=params, headers=headers, content=body(), timeout=None) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            if "done" not in result:
+                print(line, file=sys.stderr)
+
+    return result
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m proxy.history_import", description="Bulk import NDJSON observations.")
+    parser.add_argument("file", help="NDJSON file, or - for stdin")
+    parser.add_argument("--url", help="Proxy /history/import URL (HTTP mode)")
+    parser.add_argument("--token", help="Bearer token for the proxy")
+    parser.add_argument("--db", help="Import directly into this proxy DB file instead of over HTTP")
+    parser.add_argument("--batch-rows", type=int, default=50000)
+    parser.add_argument("--defer-indexes", action="store_true", help="Drop secondary indexes until the import ends")
+    args = parser.parse_args(argv)
+
+    fh = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+    try:
+        if args.url:
+            result = _import_http(fh, args.url, args.token, args.batch_rows, args.defer_indexes)
+        else:
+            result = _import_direct(fh, args.db, args.batch_rows, args.defer_indexes)
+    finally:
+        if fh is not sys.stdin.buffer:
+            fh.close()
+
+    print(json.dumps(result, ensure_ascii=False))
+    return 0 if result.get("done") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
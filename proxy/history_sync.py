@@ -0,0 +1,165 @@
+import re, json, zlib, sqlite3
+from proxy.history_import import parse_observation
+
+
+"""
+Device History Sync
+
+Field laptops keep logging to their local history while offline and sync it
+with the proxy DB when they're back (see src/functions/sync.py):
+
+    POST /history/sync?device_id=D     gzip NDJSON (or MessagePack) batch of the device's new rows
+    GET  /history/since?after=N        central rows with id > N, oldest first
+
+Each uploaded line is an import observation (see history_import.py) plus the
+device's own row "id" and "lang". Rows are keyed by (device_id, device_row_id),
+so a batch resent after an interruption is ignored instead of duplicated.
+Both directions walk an id range, so a sync costs O(new rows).
+"""
+
+# Longest batch accepted per request, and its decompressed size cap.
+SYNC_MAX_BATCH_ROWS = 1000
+SYNC_MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# Longest page returned by /history/since.
+SINCE_MAX_ROWS = 1000
+
+_DEVICE_ID = re.compile(r"[A-Za-z0-9_-]{8,64}")
+
+_INSERT_SQL = """
+    INSERT OR IGNORE INTO weather_history (
+        created_utc, query_type, city, postal, country, units,
+        name, description, temp, humidity, wind_speed, raw_json,
+        location_id, lang, device_id, device_row_id
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+
+def valid_device_id(device_id: str | None) -> str | None:
+    # The device id if it's well-formed, else None.
+
+    return device_id if device_id and _DEVICE_ID.fullmatch(device_id) else None
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    # Device columns on weather_history. Called from the proxy's schema step.
+
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(weather_history);")}
+    for name, decl in (("lang", "TEXT"), ("device_id", "TEXT"), ("device_row_id", "INTEGER")):
+        if name not in cols:
+            conn.execute(f"ALTER TABLE weather_history ADD COLUMN {name} {decl};")
+
+    # Idempotent uploads. Rows logged by /weather itself have no device_row_id.
+    conn.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_weather_history_device
+        ON weather_history(device_id, device_row_id) WHERE device_row_id IS NOT NULL;
+        """
+    )
+
+
+def decompress(body: bytes, encoding: str | None) -> bytes:
+    # gzip (or identity) request body -> bytes. Raises ValueError past SYNC_MAX_BODY_BYTES.
+
+    if (encoding or "").strip().lower() != "gzip":
+        if len(body) > SYNC_MAX_BODY_BYTES:
+            raise ValueError("batch too large")
+        return body
+
+    try:
+        d = zlib.decompressobj(wbits=31)
+        out = d.decompress(body, SYNC_MAX_BODY_BYTES)
+    except zlib.error as exc:
+        raise ValueError(f"bad gzip body: {exc}") from None
+
+    if d.unconsumed_tail:
+        raise ValueError("batch too large")
+    return out
+
+
+def parse_sync_row(obj) -> tuple[int, tuple, str]:
+    # One uploaded line -> (device row id, weather_history columns, lang). Raises ValueError.
+
+    row = parse_observation(obj)
+
+    row_id = obj.get("id")
+    if type(row_id) is not int or row_id <= 0:
+        raise ValueError("id must be a positive integer")
+
+    lang = obj.get("lang") or "en"
+    if type(lang) is not str or len(lang) > 8:
+        raise ValueError("lang must be a short string")
+
+    return row_id, row, lang.lower()
+
+
+def insert_batch(conn: sqlite3.Connection, device_id: str, body: bytes | list, locate) -> dict:
+    # Validates and inserts one batch in a single transaction.
+    # body: NDJSON bytes, or the rows already decoded (a MessagePack batch, see wire.py).
+    # locate(query_type, text, country) -> location id or None.
+    # Returns {"received", "inserted", "rejected", "errors", "last_id"}: last_id is the
+    # highest device row id in the batch, bad lines included (they'd never get better).
+
+    lines = body if isinstance(body, list) else [line for line in body.split(b"\n") if line.strip()]
+    if len(lines) > SYNC_MAX_BATCH_ROWS:
+        raise ValueError(f"at most {SYNC_MAX_BATCH_ROWS} rows per batch")
+
+    rows, errors, last_id = [], [], 0
+    for number, line in enumerate(lines, start=1):
+        try:
+            obj = line if isinstance(body, list) else json.loads(line)
+            if type(obj) is dict and type(obj.get("id")) is int:
+                last_id = max(last_id, obj["id"])
+
+            row_id, row, lang = parse_sync_row(obj)
+        except ValueError as exc:
+            errors.append({"line": number, "error": str(exc)})
+            continue
+
+        location_id = locate(row[1], row[2] or row[3], row[4])
+        rows.append(row + (location_id, lang, device_id, row_id))
+
+    with conn:
+        before = conn.total_changes
+        conn.executemany(_INSERT_SQL, rows)
+        inserted = conn.total_changes - before
+
+    return {
+        "received": len(lines),
+        "inserted": inserted,
+        "rejected": len(errors),
+        "errors": errors[:20],
+        "last_id": last_id,
+    }
+
+
+def rows_since(conn: sqlite3.Connection, after: int, limit: int, exclude_device: str | None = None) -> dict:
+    # Central rows with id > after, oldest first, minus the asking device's own.
+    # Returns {"items", "next"}; pass "next" back as `after` (it equals `after` when caught up).
+
+    limit = max(1, min(int(limit), SINCE_MAX_ROWS))
+
+    rows = conn.execute(
+        """
+        SELECT id, created_utc, query_type, city, postal, country, units, lang,
+               name, description, temp, humidity, wind_speed, raw_json, device_id
+        FROM weather_history
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?;
+        """,
+        (int(after), limit)
+    ).fetchall()
+
+    # Filtered here rather than in SQL, so a page is always one contiguous id range
+    # and "next" moves past the skipped rows too.
+    items = []
+    for r in rows:
+        if exclude_device and r["device_id"] == exclude_device:
+            continue
+        item = {k: r[k] for k in r.keys() if k not in ("raw_json", "device_id")}
+        item["raw"] = json.loads(r["raw_json"]) if r["raw_json"] else None
+        items.append(item)
+
+    return {"items": items, "next": rows[-1]["id"] if rows else int(after)}
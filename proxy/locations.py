@@ -0,0 +1,45 @@
+import re, unicodedata
+from typing import NamedTuple
+
+
+"""
+Location Normalization
+
+"london", " London ", "LONDON,gb" and "ｌｏｎｄｏｎ" all describe the same place.
+Each user query is reduced to one normalized key, which the DB maps to a
+canonical location row (OpenWeather city id + coordinates).
+"""
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class LocationQuery(NamedTuple):
+    query_type: str   # "city" or "postal"
+    text: str         # cleaned text to send upstream (original casing)
+    country: str      # alpha-2, upper case
+    key: str          # normalized lookup key, ex: "city:london|GB"
+
+
+def clean_text(s: str | None) -> str:
+    # NFKC folds full-width/compatibility characters, then whitespace is collapsed.
+
+    s = unicodedata.normalize("NFKC", s or "")
+    s = _WHITESPACE.sub(" ", s).strip()
+    return re.sub(r"\s*,\s*", ",", s)
+
+
+def normalize_query(query_type: str, text: str | None, country: str | None) -> LocationQuery:
+    # Builds the normalized, country-qualified form of a user query.
+    # A trailing ",xx" is only dropped when it repeats the country param
+    # ("LONDON,gb" + gb). Anything else stays in the text, so "Portland,OR" + us
+    # is still sent upstream as the state query "Portland,OR,US".
+
+    text = clean_text(text)
+    country = clean_text(country).upper()
+
+    head, sep, tail = text.rpartition(",")
+    if sep and head and tail.upper() == country:
+        text = head
+
+    key = f"{query_type}:{text.casefold()}|{country}"
+    return LocationQuery(query_type, text, country, key)
@@ -0,0 +1,147 @@
+import sys, time, asyncio, marshal, cProfile, threading, contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+
+"""
+Request Timing + Live Profiling
+
+ServerTimingMiddleware adds a `Server-Timing` header to every response,
+built from the stages the endpoint wrapped in `with stage("..."):`.
+
+StackSampler / profile_event_loop capture a profile of the running worker
+on demand (the admin endpoint decides when). Nothing runs when idle.
+"""
+
+# Per-request {stage name: milliseconds}. None outside a request.
+_timings = contextvars.ContextVar("server_timings", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    # Times a block and adds it to the current request's Server-Timing.
+    # Outside a request (tests, CLI) it's a no-op.
+
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - start) * 1000.0
+
+
+def note(name: str, desc: str) -> None:
+    # Adds a duration-less entry, ex: note("cache", "hit") -> cache;desc="hit"
+
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = desc
+
+
+def format_server_timing(timings: dict, total_ms: float) -> str:
+    parts = []
+    for name, value in timings.items():
+        if isinstance(value, str):
+            parts.append(f'{name};desc="{value}"')
+        else:
+            parts.append(f"{name};dur={value:.2f}")
+
+    parts.append(f"total;dur={total_ms:.2f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    # Plain ASGI middleware (cheaper than BaseHTTPMiddleware).
+    # The header is written when the response starts, so streaming bodies aren't delayed.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - start) * 1000.0
+                header = format_server_timing(timings, total_ms)
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+
+
+class StackSampler:
+    # Wall-clock sampling profiler.
+    # Every `interval` seconds it snapshots the stack of every other thread,
+    # and counts identical stacks (the "collapsed stack" format flame graphs use).
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = max(0.001, float(interval))
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_filename}:{code.co_name}:{code.co_firstlineno}"
+
+    def sample(self, seconds: float) -> Counter:
+        # Blocks for `seconds`; run it in a worker thread.
+
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = Counter()
+
+        deadline = time.perf_counter() + float(seconds)
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+
+                labels = []
+                while frame is not None:
+                    labels.append(self._frame_label(frame))
+                    frame = frame.f_back
+
+                labels.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(labels))] += 1
+
+            time.sleep(self.interval)
+
+        return stacks
+
+
+def format_collapsed(stacks: Counter) -> str:
+    # "root;child;leaf count" per line, most common first.
+
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+async def profile_event_loop(seconds: float) -> bytes:
+    # Deterministic profile of the event-loop thread for `seconds`.
+    # Every request served meanwhile is included.
+    # Returns a marshal'd pstats dump (load with pstats.Stats(path)).
+
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        prof.disable()
+
+    prof.create_stats()
+    return marshal.dumps(prof.stats)
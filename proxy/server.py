@@ -1,8 +1,21 @@
-import os, time, httpx, sqlite3, json
+import os, gzip, math, time, httpx, sqlite3, json, asyncio, hashlib, tempfile, threading
 from pathlib import Path
 from collections import defaultdict, deque
-from datetime import datetime, timezone
-from fastapi import FastAPI, HTTPException, Request
+from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from proxy.upstream import make_upstream
+from proxy.cache import TTLCache, Coalescer
+from proxy.batching import GroupBatcher
+from proxy.locations import LocationQuery, normalize_query
+from proxy.history_import import HistoryImporter
+from proxy import history_sync, descriptions, forecast, wire
+from proxy.shared_state import SharedState, create_schema as _shared_create_schema
+from proxy.units import UNITS, CANONICAL, convert as _convert_units, create_schema as _units_create_schema
+from proxy.profiling import (
+    ServerTimingMiddleware, StackSampler, stage, note,
+    format_collapsed, profile_event_loop,
+)
 
 
 """
@@ -19,12 +32,64 @@ PROXY_TOKENS = set(
     if t.strip()
 )
 
+# Tokens allowed to use /admin endpoints (profiling). Empty = admin endpoints disabled.
+PROXY_ADMIN_TOKENS = set(
+    t.strip()
+    for t in os.getenv("PROXY_ADMIN_TOKENS", "").split(",")
+    if t.strip()
+)
+
 # Limits API calls allowed in env var, or defaults to 60 per minute.
 OPENWEATHER_RATE_LIMIT_PER_MIN = int(os.getenv("RATE_LIMIT_PER_MIN", "60"))
 
 # Global daily limit for ALL users combined
 DAILY_LIMIT = int(os.getenv("DAILY_LIMIT", "1000"))
 
+# Upstream backend: "live" (default), "record" or "replay".
+# record/replay use UPSTREAM_RECORDING (gzip'd NDJSON) so load tests can run offline.
+UPSTREAM_MODE = os.getenv("UPSTREAM_MODE", "live").strip().lower()
+UPSTREAM_RECORDING = os.getenv(
+    "UPSTREAM_RECORDING",
+    str(Path(__file__).resolve().parent / "upstream_recording.ndjson.gz"),
+)
+
+# Replay latency: "recorded" (per response) or "sampled" (from the whole recording),
+# multiplied by the scale. A scale of 0 replays as fast as possible.
+UPSTREAM_LATENCY_MODE = os.getenv("UPSTREAM_LATENCY_MODE", "recorded").strip().lower()
+UPSTREAM_LATENCY_SCALE = float(os.getenv("UPSTREAM_LATENCY_SCALE", "1.0"))
+
+# How long a fetched observation is reused for the same location (seconds).
+# OpenWeather refreshes current conditions roughly every 10 minutes.
+CACHE_TTL_SEC = float(os.getenv("CACHE_TTL_SEC", "600"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+# How long a fetched 5-day forecast is reused (seconds). OpenWeather updates it every few hours.
+FORECAST_TTL_SEC = float(os.getenv("FORECAST_TTL_SEC", "3600"))
+
+# Once this share of DAILY_LIMIT is used, /weather misses for locations with a cached
+# forecast are answered with a nowcast instead of an upstream call (see proxy/forecast.py).
+# 0 turns nowcasts off.
+NOWCAST_AT_USAGE = float(os.getenv("NOWCAST_AT_USAGE", "0.9"))
+
+# Rows per transaction for /history/import (callers may ask for fewer, never more than the max).
+IMPORT_BATCH_ROWS = int(os.getenv("IMPORT_BATCH_ROWS", "50000"))
+IMPORT_MAX_BATCH_ROWS = 200000
+
+# Longest NDJSON line /history/import accepts; longer lines are rejected.
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", "65536"))
+
+# OpenWeather host. Point it at a stand-in (ex: python -m proxy.stub_upstream) to run offline.
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org").strip().rstrip("/")
+
+# Cache misses for known city ids arriving within this window share one group call
+# (see proxy/batching.py). 0 turns batching off.
+GROUP_WINDOW_MS = float(os.getenv("GROUP_WINDOW_MS", "5"))
+
+# Number of worker processes serving this proxy (set by `python -m proxy`).
+# With more than one, the daily/per-minute limits, the observation cache and
+# upstream call coalescing are shared through SQLite (see proxy/shared_state.py).
+PROXY_WORKERS = max(1, int(os.getenv("PROXY_WORKERS", "1")))
+
 # Tracks usage for the current UTC day
 _usage_day = None          # e.g. "2025-12-31"
 _usage_count = 0
@@ -36,6 +101,18 @@ def _enforce_daily_limit() -> None:
     # Uses UTC date so it’s consistent regardless of server location
     today = datetime.now(timezone.utc).date().isoformat()
 
+    # Several workers -> one shared counter in the DB, leased out in blocks.
+    shared = _get_shared()
+    if shared is not None:
+        tomorrow = (datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+                    + timedelta(days=1)).timestamp()
+        if not shared.take("daily", DAILY_LIMIT, today, expires=tomorrow):
+            raise HTTPException(
+                status_code=429,
+                detail=f"Daily limit reached ({DAILY_LIMIT} requests/day). Try again tomorrow."
+            )
+        return
+
     # Resets counter when the date changes
     if _usage_day != today:
         _usage_day = today
@@ -52,16 +129,103 @@ def _enforce_daily_limit() -> None:
     _usage_count += 1
 
 
-# Stores the endpoint of OpenWeatherMap's API
-OPENWEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+def _daily_used() -> int:
+    # Requests counted against DAILY_LIMIT so far today (every worker's, when shared).
+
+    today = datetime.now(timezone.utc).date().isoformat()
+
+    shared = _get_shared()
+    if shared is not None:
+        return shared.used("daily", today)
+
+    return _usage_count if _usage_day == today else 0
+
+
+def _budget_tight() -> bool:
+    # True once NOWCAST_AT_USAGE of the daily budget is spent.
+
+    return NOWCAST_AT_USAGE > 0 and _daily_used() >= NOWCAST_AT_USAGE * DAILY_LIMIT
+
+
+# Stores the endpoints of OpenWeatherMap's API (one location, up to 20 city ids, and the 5-day forecast)
+OPENWEATHER_URL = f"{OPENWEATHER_BASE_URL}/data/2.5/weather"
+OPENWEATHER_GROUP_URL = f"{OPENWEATHER_BASE_URL}/data/2.5/group"
+OPENWEATHER_FORECAST_URL = f"{OPENWEATHER_BASE_URL}/data/2.5/forecast"
 
 # Starts an instance of the FastAPI class, registering data routes
 # 'univron' requires an object to run, in this case, 'app'
 app = FastAPI()
 
+# Adds a Server-Timing header (auth, ratelimit, db, upstream, parse) to every response.
+app.add_middleware(ServerTimingMiddleware)
+
+# Only one live profile may run at a time.
+_profile_lock = threading.Lock()
+
 # Maps a key to a deque of timestamps if the key doesn't exist.
 _hits = defaultdict(deque)
 
+# Upstream backend, built from config on first use.
+_upstream = None
+
+# Observations keyed by location_id, in canonical units and language-neutral
+# (see units.py and descriptions.py).
+_weather_cache = TTLCache(CACHE_TTL_SEC, CACHE_MAX_ENTRIES)
+
+# Compact forecasts (forecast.Forecast) keyed like _weather_cache.
+_forecast_cache = TTLCache(FORECAST_TTL_SEC, CACHE_MAX_ENTRIES)
+
+# Shares one upstream call between concurrent misses for the same location.
+_coalescer = Coalescer()
+
+# Groups cache misses for known city ids into one upstream call. Built on first use.
+_batcher = None
+
+# Normalized query key -> (location_id, OpenWeather city id or None).
+# Front of the location_keys table so hot lookups skip SQLite.
+_location_ids = {}
+
+# Limits/cache shared with the other workers. None with a single worker.
+_shared = None
+
+
+def _get_shared() -> SharedState | None:
+    global _shared
+
+    if PROXY_WORKERS <= 1:
+        return None
+
+    if _shared is None:
+        _shared = SharedState(_db_connect, PROXY_WORKERS)
+
+    return _shared
+
+
+def _get_upstream():
+    global _upstream
+
+    if _upstream is None:
+        _upstream = make_upstream(
+            UPSTREAM_MODE,
+            UPSTREAM_RECORDING,
+            latency_scale=UPSTREAM_LATENCY_SCALE,
+            latency_mode=UPSTREAM_LATENCY_MODE,
+        )
+
+    return _upstream
+
+
+def _get_batcher() -> GroupBatcher | None:
+    global _batcher
+
+    if GROUP_WINDOW_MS <= 0:
+        return None
+
+    if _batcher is None:
+        _batcher = GroupBatcher(lambda ids: _fetch_group(_get_upstream(), ids), GROUP_WINDOW_MS / 1000.0)
+
+    return _batcher
+
 
 """
 SQLite History Storage
@@ -78,52 +242,214 @@ def _db_path() -> Path:
     return Path(__file__).resolve().parent / "weather_history.sqlite"
 
 
+# DB files whose schema was already created by this process.
+_db_ready = set()
+
+
 def _db_connect() -> sqlite3.Connection:
     # Opens a DB connection.
     # check_same_thread=False so it doesn't explode under ASGI threads.
+    # The schema is created on first use, so callers never hit a missing table.
 
     p = _db_path()
     p.parent.mkdir(parents=True, exist_ok=True)
 
-    conn = sqlite3.connect(str(p), check_same_thread=False)
+    conn = sqlite3.connect(str(p), check_same_thread=False, timeout=10)
     conn.row_factory = sqlite3.Row
+
+    # WAL (set once in the schema step) is durable with NORMAL sync and lets
+    # worker processes read while another one writes.
+    conn.execute("PRAGMA synchronous=NORMAL;")
+
+    if str(p) not in _db_ready:
+        _db_create_schema(conn)
+        _db_ready.add(str(p))
+
     return conn
 
 
 def _db_init() -> None:
+    # Makes sure the DB file and table exist.
+
+    _db_connect().close()
+
+
+def _db_create_schema(conn: sqlite3.Connection) -> None:
     # Creates the table if it doesn't exist yet.
 
+    conn.execute("PRAGMA journal_mode=WAL;")
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS weather_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_utc TEXT NOT NULL,
+            query_type TEXT NOT NULL,
+            city TEXT,
+            postal TEXT,
+            country TEXT NOT NULL,
+            units TEXT NOT NULL,
+            name TEXT,
+            description TEXT,
+            temp REAL,
+            humidity INTEGER,
+            wind_speed REAL,
+            raw_json TEXT
+        );
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_history_created ON weather_history(created_utc);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_history_name ON weather_history(name);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_history_desc ON weather_history(description);")
+
+    # Canonical locations learned from OpenWeather responses.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS locations (
+            id INTEGER PRIMARY KEY,
+            ow_id INTEGER UNIQUE,
+            name TEXT,
+            country TEXT,
+            lat REAL,
+            lon REAL,
+            updated_utc TEXT NOT NULL
+        );
+        """
+    )
+
+    # Normalized user query ("city:london|GB") -> canonical location.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS location_keys (
+            key TEXT PRIMARY KEY,
+            location_id INTEGER NOT NULL REFERENCES locations(id)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    # Older DBs predate locations; history rows reference them by id.
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(weather_history);")}
+    if "location_id" not in cols:
+        conn.execute("ALTER TABLE weather_history ADD COLUMN location_id INTEGER REFERENCES locations(id);")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_history_location ON weather_history(location_id);")
+
+    # Device columns for history synced from clients' local DBs.
+    history_sync.create_schema(conn)
+
+    # Rows from before units were canonical, converted once.
+    _units_create_schema(conn)
+
+    # Quotas, cache and fetch claims shared by all worker processes.
+    _shared_create_schema(conn)
+    conn.commit()
+
+
+def _db_lookup_location(key: str) -> tuple[int, int | None] | None:
+    # Finds the canonical location for a normalized query key.
+    # Returns (location_id, ow_id) or None if we haven't seen this query yet.
+
+    hit = _location_ids.get(key)
+    if hit is not None:
+        return hit
+
     conn = _db_connect()
     try:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS weather_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                created_utc TEXT NOT NULL,
-                query_type TEXT NOT NULL,
-                city TEXT,
-                postal TEXT,
-                country TEXT NOT NULL,
-                units TEXT NOT NULL,
-                name TEXT,
-                description TEXT,
-                temp REAL,
-                humidity INTEGER,
-                wind_speed REAL,
-                raw_json TEXT
-            );
+        row = conn.execute(
             """
+            SELECT l.id, l.ow_id
+            FROM location_keys k JOIN locations l ON l.id = k.location_id
+            WHERE k.key = ?;
+            """,
+            (key,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        return None
+
+    _location_ids[key] = (row["id"], row["ow_id"])
+    return _location_ids[key]
+
+
+def _db_learn_location(key: str, data: dict, by_city_id: bool = True) -> int | None:
+    # Records which canonical location an OpenWeather response belongs to.
+    # Uses the OpenWeather city id when present, else the (rounded) coordinates.
+    # Postal queries pass by_city_id=False: a zip code's coordinates are finer
+    # than the city it's reported under, so it must not share the city's entry.
+    # Returns the location id, or None if the response carries neither.
+
+    coord = data.get("coord") or {}
+    lat, lon = coord.get("lat"), coord.get("lon")
+
+    try:
+        ow_id = int(data.get("id") or 0) or None if by_city_id else None
+    except (TypeError, ValueError):
+        ow_id = None
+
+    if ow_id is None and (lat is None or lon is None):
+        return None
+
+    now = datetime.now(timezone.utc).isoformat()
+    name = data.get("name")
+    country = (data.get("sys") or {}).get("country")
+
+    conn = _db_connect()
+    try:
+        if ow_id is not None:
+            conn.execute(
+                """
+                INSERT INTO locations (ow_id, name, country, lat, lon, updated_utc)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(ow_id) DO UPDATE SET
+                    name = excluded.name, country = excluded.country,
+                    lat = excluded.lat, lon = excluded.lon, updated_utc = excluded.updated_utc;
+                """,
+                (ow_id, name, country, lat, lon, now)
+            )
+            location_id = conn.execute("SELECT id FROM locations WHERE ow_id = ?;", (ow_id,)).fetchone()[0]
+        else:
+            lat, lon = round(float(lat), 4), round(float(lon), 4)
+            row = conn.execute(
+                "SELECT id FROM locations WHERE ow_id IS NULL AND lat = ? AND lon = ?;",
+                (lat, lon)
+            ).fetchone()
+
+            if row:
+                location_id = row[0]
+            else:
+                location_id = conn.execute(
+                    "INSERT INTO locations (ow_id, name, country, lat, lon, updated_utc) VALUES (NULL, ?, ?, ?, ?, ?);",
+                    (name, country, lat, lon, now)
+                ).lastrowid
+
+        conn.execute(
+            "INSERT OR REPLACE INTO location_keys (key, location_id) VALUES (?, ?);",
+            (key, location_id)
         )
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_history_created ON weather_history(created_utc);")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_history_name ON weather_history(name);")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_history_desc ON weather_history(description);")
         conn.commit()
     finally:
         conn.close()
 
-
-def _db_log(*, query_type: str, city: str | None, postal: str | None, country: str, units: str, data: dict) -> None:
+    _location_ids[key] = (location_id, ow_id)
+    return location_id
+
+
+def _db_log(
+    *,
+    query_type: str,
+    city: str | None,
+    postal: str | None,
+    country: str,
+    units: str,
+    data: dict,
+    location_id: int | None = None,
+    lang: str | None = None,
+    device_id: str | None = None,
+) -> None:
     # Inserts one successful weather call into the DB.
+    # device_id marks rows the calling client also logged locally, so sync doesn't send them back.
 
     created_utc = datetime.now(timezone.utc).isoformat()
 
@@ -142,13 +468,15 @@ def _db_log(*, query_type: str, city: str | None, postal: str | None, country: s
             """
             INSERT INTO weather_history (
                 created_utc, query_type, city, postal, country, units,
-                name, description, temp, humidity, wind_speed, raw_json
+                name, description, temp, humidity, wind_speed, raw_json, location_id,
+                lang, device_id
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
             """,
             (
                 created_utc, query_type, city, postal, country, units,
-                name, description, temp, humidity, wind_speed, json.dumps(data),
+                name, description, temp, humidity, wind_speed, json.dumps(data), location_id,
+                lang, device_id,
             )
         )
         conn.commit()
@@ -166,7 +494,7 @@ def _db_fetch_history(limit: int = 25) -> list[dict]:
         rows = conn.execute(
             """
             SELECT created_utc, query_type, city, postal, country, units,
-                   name, description, temp, humidity, wind_speed
+                   name, description, temp, humidity, wind_speed, location_id
             FROM weather_history
             ORDER BY id DESC
             LIMIT ?;
@@ -191,7 +519,7 @@ def _db_search(q: str, limit: int = 25) -> list[dict]:
         rows = conn.execute(
             """
             SELECT created_utc, query_type, city, postal, country, units,
-                   name, description, temp, humidity, wind_speed
+                   name, description, temp, humidity, wind_speed, location_id
             FROM weather_history
             WHERE
                 lower(coalesce(city, '')) LIKE ?
@@ -210,9 +538,27 @@ def _db_search(q: str, limit: int = 25) -> list[dict]:
 
 # Runs once when the proxy starts.
 # Sets up the SQLite file/table if missing.
+# Also builds the upstream backend, so a bad UPSTREAM_MODE or a missing
+# replay file stops the process here instead of failing every request.
 @app.on_event("startup")
 def _startup() -> None:
     _db_init()
+    _get_upstream()
+
+
+# Runs once when the proxy stops.
+# Closes the upstream backend so a recording file is fully written.
+@app.on_event("shutdown")
+def _shutdown() -> None:
+    global _upstream, _shared
+
+    if _upstream is not None:
+        _upstream.close()
+        _upstream = None
+
+    if _shared is not None:
+        _shared.close()
+        _shared = None
 
 
 """
@@ -235,14 +581,49 @@ def _get_bearer_token(request: Request) -> str | None:
     return None
 
 
+# Checks the Bearer token against PROXY_TOKENS (if any are configured).
+# Returns the token so callers can rate limit per token.
+def _check_token(request: Request) -> str | None:
+
+    with stage("auth"):
+        token = _get_bearer_token(request)
+
+        if PROXY_TOKENS:
+            if not token or token not in PROXY_TOKENS:
+                raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return token
+
+
 # Function Definition that returns None
 # key = str; idetifier per token or per IP
 # limit = int; max allowed requests per minute
+def _rate_limited(retry_after: float) -> HTTPException:
+    # 429 with a Retry-After header (whole seconds, at least 1) so clients know when to retry.
+    # The daily limit sends none: retrying later today wouldn't help.
+
+    return HTTPException(
+        status_code=429,
+        detail="Rate limit exceeded.",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
 def _enforce_rate_limit(key: str, limit: int) -> None:
 
     # Current UNIX time in seconds as a float
     now = time.time()
 
+    # Several workers -> fixed one-minute windows shared through the DB.
+    # The key is hashed so tokens never land in the DB file.
+    shared = _get_shared()
+    if shared is not None:
+        minute = int(now // 60)
+        name = "rate:" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        if not shared.take(name, limit, str(minute), expires=(minute + 1) * 60):
+            raise _rate_limited((minute + 1) * 60 - now)
+        return
+
     # The earliest starting time within the last minute
     window_start = now - 60
 
@@ -259,7 +640,8 @@ def _enforce_rate_limit(key: str, limit: int) -> None:
     # Checks if the length of q is greater than or equal to the set limit.
     if len(q) >= limit:
         # Raises an exception for the standard "Too Many Requests." code number, 429.
-        raise HTTPException(status_code=429, detail="Rate limit exceeded.")
+        # The oldest hit leaves the window in (q[0] + 60 - now) seconds.
+        raise _rate_limited(q[0] + 60 - now)
 
     q.append(now)
 
@@ -274,65 +656,257 @@ async def root():
     return {"status": "ok", "hint": "Use /weather"}
 
 
+def _wire_format(request: Request, layout: str) -> str:
+    # Media type for a history response (see wire.py). Raises 400 for an unknown layout.
+
+    if layout not in wire.LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"layout must be one of {', '.join(wire.LAYOUTS)}")
+
+    return wire.negotiate(request.headers.get("accept"))
+
+
+def _wire_response(body: dict, media_type: str, layout: str) -> Response:
+    # JSON rows (the default) are rendered as before; the rest by wire.encode.
+
+    headers = {"Vary": "Accept"}
+    if media_type == wire.JSON and layout == "rows":
+        return JSONResponse(body, headers=headers)
+
+    return Response(wire.encode(body, media_type, layout), media_type=media_type, headers=headers)
+
+
 # Returns recent requests from the proxy DB.
 # This endpoint uses the same token security rules as /weather.
+# MessagePack and a columnar layout on request (see wire.py).
 @app.get("/history")
-async def history(request: Request, limit: int = 25):
+async def history(request: Request, limit: int = 25, layout: str = "rows"):
 
-    token = _get_bearer_token(request)
+    _check_token(request)
+    media_type = _wire_format(request, layout)
 
-    if PROXY_TOKENS:
-        if not token or token not in PROXY_TOKENS:
-            raise HTTPException(status_code=401, detail="Unauthorized")
+    with stage("db"):
+        items = _db_fetch_history(limit=limit)
 
-    return {"items": _db_fetch_history(limit=limit)}
+    return _wire_response({"items": items}, media_type, layout)
 
 
 # Searches the history DB for city/name/description matches.
 @app.get("/search")
-async def search(request: Request, q: str, limit: int = 25):
-
-    token = _get_bearer_token(request)
+async def search(request: Request, q: str, limit: int = 25, layout: str = "rows"):
 
-    if PROXY_TOKENS:
-        if not token or token not in PROXY_TOKENS:
-            raise HTTPException(status_code=401, detail="Unauthorized")
+    _check_token(request)
+    media_type = _wire_format(request, layout)
 
     if not (q or "").strip():
         raise HTTPException(status_code=400, detail="q is required")
 
-    return {"items": _db_search(q=q, limit=limit)}
+    with stage("db"):
+        items = _db_search(q=q, limit=limit)
 
+    return _wire_response({"items": items}, media_type, layout)
 
-# Decorator (function abstraction) for FastAPT to handle GET requests to "/weather".
-@app.get("/weather")
-async def weather(
+
+# Bulk-loads NDJSON observations into the history DB.
+# The whole body is spooled first (so the streamed response never competes with
+# body reads), then progress comes back as NDJSON lines; the last one has "done".
+# Writes data, so it always needs a token (and PROXY_TOKENS must be configured).
+@app.post("/history/import")
+async def history_import(request: Request, batch_rows: int = IMPORT_BATCH_ROWS, defer_indexes: bool = False):
+
+    if not PROXY_TOKENS:
+        raise HTTPException(status_code=403, detail="Import requires PROXY_TOKENS to be configured")
+
+    _check_token(request)
+
+    batch_rows = max(1, min(int(batch_rows), IMPORT_MAX_BATCH_ROWS))
+
+    # Small bodies stay in memory, big ones roll over to a temp file.
+    body = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+    except BaseException:
+        body.close()
+        raise
+
+    async def run():
+        conn = await asyncio.to_thread(_db_connect)
+        try:
+            importer = HistoryImporter(
+                conn,
+                batch_rows=batch_rows,
+                defer_indexes=defer_indexes,
+                max_line_bytes=IMPORT_MAX_LINE_BYTES,
+            )
+
+            try:
+                while True:
+                    # Parsing and writing both run off the event loop.
+                    progress = await asyncio.to_thread(importer.import_batch, body)
+                    if progress is None:
+                        break
+                    yield json.dumps(progress) + "\n"
+
+                result = await asyncio.to_thread(importer.finish)
+            except Exception as exc:
+                result = await asyncio.to_thread(importer.fail, exc)
+
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            conn.close()
+            body.close()
+
+    return StreamingResponse(run(), media_type="application/x-ndjson")
+
+
+# Receives one gzip NDJSON (or MessagePack) batch of a device's local history (see history_sync.py).
+# Resending a batch is harmless: rows are keyed by (device_id, device row id).
+# Writes data, so like import it needs PROXY_TOKENS configured and a valid token.
+@app.post("/history/sync")
+async def history_sync_upload(request: Request, device_id: str):
+
+    if not PROXY_TOKENS:
+        raise HTTPException(status_code=403, detail="Sync requires PROXY_TOKENS to be configured")
+
+    _check_token(request)
+
+    if not history_sync.valid_device_id(device_id):
+        raise HTTPException(status_code=400, detail="Invalid device_id")
+
+    try:
+        body = history_sync.decompress(await request.body(), request.headers.get("content-encoding"))
+    except ValueError as exc:
+        raise HTTPException(status_code=413 if "too large" in str(exc) else 400, detail=str(exc))
+
+    # MessagePack batches are {"items": [...]} in either layout; NDJSON is parsed line by line.
+    content_type = request.headers.get("content-type")
+    if wire.is_msgpack(content_type):
+        try:
+            body = wire.decode(body, content_type).get("items")
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="items must be a list")
+
+    def locate(query_type, text, country):
+        location = _db_lookup_location(normalize_query(query_type, text, country).key)
+        return location[0] if location else None
+
+    def run():
+        conn = _db_connect()
+        try:
+            return history_sync.insert_batch(conn, device_id, body, locate)
+        finally:
+            conn.close()
+
+    with stage("db"):
+        try:
+            result = await asyncio.to_thread(run)
+        except ValueError as exc:
+            raise HTTPException(status_code=413, detail=str(exc))
+
+    return result
+
+
+# Central history rows after a given id, for devices pulling what others logged.
+# device_id leaves out the asking device's own rows. Gzipped when the client accepts it,
+# MessagePack and/or columnar on request (see wire.py).
+@app.get("/history/since")
+async def history_since(
     request: Request,
-    city: str | None = None,
-    postal: str | None = None,
-    country: str = "us",
-    units: str = "metric",
-    lang: str = "en",
+    after: int = 0,
+    limit: int = 500,
+    device_id: str | None = None,
+    layout: str = "rows",
 ):
 
-    # Enforce daily limit at start of request
-    _enforce_daily_limit()
+    _check_token(request)
+    media_type = _wire_format(request, layout)
 
-    # Checks if nothing is retrieved for secret key in env vars.
-    if not OPENWEATHER_API_KEY:
-        raise HTTPException(
-            status_code=500,
-            detail="Server missing OPENWEATHER_API_KEY",
-        )
+    def run():
+        conn = _db_connect()
+        try:
+            return history_sync.rows_since(conn, after, limit, history_sync.valid_device_id(device_id))
+        finally:
+            conn.close()
+
+    with stage("db"):
+        result = await asyncio.to_thread(run)
+
+    body = wire.encode(result, media_type, layout)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, 6)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type=media_type, headers=headers)
+
+
+# Profiles this worker for N seconds and returns the result.
+# format=collapsed -> sampled stacks of all threads (feed to flamegraph.pl / speedscope)
+# format=pstats    -> cProfile dump of the event loop (load with pstats.Stats)
+# Requires a token from PROXY_ADMIN_TOKENS; disabled when none are configured.
+@app.get("/admin/profile")
+async def admin_profile(
+    request: Request,
+    seconds: float = 5.0,
+    format: str = "collapsed",
+    interval_ms: float = 5.0,
+):
 
-    # Extracts token from header
     token = _get_bearer_token(request)
 
+    if not PROXY_ADMIN_TOKENS or not token or token not in PROXY_ADMIN_TOKENS:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    if format not in ("collapsed", "pstats"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'pstats'")
+
+    seconds = max(0.1, min(float(seconds), 60.0))
+
+    if not _profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    try:
+        if format == "pstats":
+            dump = await profile_event_loop(seconds)
+            return Response(
+                content=dump,
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": 'attachment; filename="proxy.pstats"'},
+            )
+
+        sampler = StackSampler(interval=interval_ms / 1000.0)
+        stacks = await asyncio.to_thread(sampler.sample, seconds)
+        return Response(content=format_collapsed(stacks), media_type="text/plain")
+    finally:
+        _profile_lock.release()
+
+
+def _begin_lookup(request: Request, city, postal, country, units, lang):
+    # Checks shared by /weather and /forecast: auth, limits, config and the query itself.
+    # Returns (upstream, normalized query, units, lang).
+
+    # Extracts token from header
     # Checks if an allowed token(s) has been configured
     # Raises 401 Exception, needing valid credentials.
-    if PROXY_TOKENS:
-        if not token or token not in PROXY_TOKENS:
-            raise HTTPException(status_code=401, detail="Unauthorized")
+    # Runs first, so unauthenticated requests never count against (or write) any limit.
+    token = _check_token(request)
+
+    # Enforce daily limit once the caller is known
+    with stage("ratelimit"):
+        _enforce_daily_limit()
+
+    # Built at startup; only tests (no startup hook) build it here.
+    upstream = _get_upstream()
+
+    # Checks if nothing is retrieved for secret key in env vars.
+    # Replay mode never talks to OpenWeather, so it doesn't need one.
+    if upstream.needs_api_key and not OPENWEATHER_API_KEY:
+        raise HTTPException(
+            status_code=500,
+            detail="Server missing OPENWEATHER_API_KEY",
+        )
 
     # Assigns current client IP to 'client_ip'
     client_ip = request.client.host if request.client else "unknown"
@@ -343,25 +917,14 @@ async def weather(
     rate_key = f"tok:{token}" if token else f"ip:{client_ip}"
 
     # Enactment of rate limit on current user, prevents spamming
-    _enforce_rate_limit(rate_key, OPENWEATHER_RATE_LIMIT_PER_MIN)
-
-    # Normalizes country code for OpenWeather
-    country = country.strip().upper()
-
-    # Parameters for OpenWeather API request
-    params = {
-        "appid": OPENWEATHER_API_KEY,
-        "units": units,
-        "lang": (lang or "en").strip().lower()
-    }
-
-    # Uses city search if provided
-    if city:
-        params["q"] = f"{city.strip()},{country}"
+    with stage("ratelimit"):
+        _enforce_rate_limit(rate_key, OPENWEATHER_RATE_LIMIT_PER_MIN)
 
-    # Uses postal search if provided
-    elif postal:
-        params["zip"] = f"{postal.strip()},{country}"
+    # Normalizes the query ("LONDON,gb" == " london " + country=gb)
+    if city and city.strip():
+        lq = normalize_query("city", city, country)
+    elif postal and postal.strip():
+        lq = normalize_query("postal", postal, country)
 
     # Otherwise request is invalid
     else:
@@ -369,11 +932,257 @@ async def weather(
             status_code=400,
             detail="Provide either city or postal"
         )
-    
-    
-    # Calls OpenWeatherMap with an async HTTP client with an 8-second timeout.
-    async with httpx.AsyncClient(timeout=8) as client_http:
-        response = await client_http.get(OPENWEATHER_URL, params=params)
+
+    lang = (lang or "en").strip().lower()
+
+    units = (units or CANONICAL).strip().lower()
+    if units not in UNITS:
+        raise HTTPException(status_code=400, detail=f"units must be one of {', '.join(UNITS)}")
+
+    return upstream, lq, units, lang
+
+
+# Decorator (function abstraction) for FastAPT to handle GET requests to "/weather".
+@app.get("/weather")
+async def weather(
+    request: Request,
+    response: Response,
+    city: str | None = None,
+    postal: str | None = None,
+    country: str = "us",
+    units: str = "metric",
+    lang: str = "en",
+):
+
+    upstream, lq, units, lang = _begin_lookup(request, city, postal, country, units, lang)
+
+    # Known queries map to a canonical location, so every spelling shares one cache entry.
+    with stage("db"):
+        location = _db_lookup_location(lq.key)
+
+    # One entry per location serves every language and units.
+    cache_key = location[0] if location else lq.key
+
+    data = _weather_cache.get(cache_key)
+
+    # Nearly out of daily budget: a miss we hold a forecast for is answered from it.
+    # Nowcasts aren't observations, so they're marked and never logged.
+    nowcast = None
+    if data is None and _budget_tight():
+        fc = _forecast_cache.get(cache_key)
+        nowcast = forecast.nowcast(fc, time.time()) if fc is not None else None
+
+    if nowcast is not None:
+        note("cache", "nowcast")
+        data, location_id = nowcast, None
+    elif data is None:
+        note("cache", "miss")
+        data, location_id = await _coalescer.run(
+            cache_key,
+            lambda: _load_weather(upstream, lq, location, cache_key),
+        )
+    else:
+        note("cache", "hit")
+        location_id = location[0] if location else None
+
+    # Returns a dict with all nessecary fields for client.
+    # dt is OpenWeather's observation time (unix seconds), so clients can tell a new reading.
+    shown = _convert_units(data, units)
+    body = {
+        "name": data.get("name"),
+        "dt": data.get("dt"),
+        "sys": data.get("sys"),
+        "main": shown.get("main"),
+        "wind": shown.get("wind"),
+        "weather": descriptions.render(data.get("weather"), lang),
+    }
+    if nowcast is not None:
+        body["nowcast"] = True
+
+    # Conditional requests: a client that already has this exact observation gets
+    # an empty 304 instead of the body (and nothing new is logged).
+    etag = _etag(body)
+    known = _parse_if_none_match(request.headers.get("if-none-match"))
+    if etag in known or "*" in known:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Logs the successful call into SQLite history.
+    # Not a client's background prefetch (Purpose: prefetch): the client only
+    # reports it (via sync) once the user actually asks for that location.
+    prefetch = "prefetch" in (request.headers.get("purpose") or request.headers.get("sec-purpose") or "")
+    with stage("db"):
+        if nowcast is None and not prefetch:
+            _db_log(
+                query_type=lq.query_type,
+                city=city.strip() if lq.query_type == "city" else None,
+                postal=postal.strip() if lq.query_type == "postal" else None,
+                country=lq.country,
+                units=CANONICAL,
+                data=dict(data, weather=body["weather"]),
+                location_id=location_id,
+                lang=lang,
+                device_id=history_sync.valid_device_id(request.headers.get("x-device-id")),
+            )
+
+    # FastAPI serializes this dict to a JSON for HTTP response automatically.
+    response.headers["ETag"] = etag
+    return body
+
+
+@app.get("/forecast")
+async def forecast_route(
+    request: Request,
+    city: str | None = None,
+    postal: str | None = None,
+    country: str = "us",
+    units: str = "metric",
+    lang: str = "en",
+    nowcast: bool = False,
+):
+    # OpenWeather's 5-day / 3-hour forecast, in `units` and `lang`.
+    # nowcast=true: just the current conditions interpolated from it, shaped like /weather.
+
+    upstream, lq, units, lang = _begin_lookup(request, city, postal, country, units, lang)
+
+    with stage("db"):
+        location = _db_lookup_location(lq.key)
+
+    cache_key = location[0] if location else lq.key
+
+    fc = _forecast_cache.get(cache_key)
+    if fc is None:
+        note("cache", "miss")
+        fc = await _coalescer.run(
+            ("forecast", cache_key),
+            lambda: _load_forecast(upstream, lq, location, cache_key),
+        )
+    else:
+        note("cache", "hit")
+
+    if nowcast:
+        data = forecast.nowcast(fc, time.time())
+        if data is None:
+            raise HTTPException(status_code=404, detail="Forecast doesn't cover the current time")
+
+        shown = _convert_units(data, units)
+        return {
+            "name": data.get("name"),
+            "dt": data.get("dt"),
+            "sys": data.get("sys"),
+            "main": shown.get("main"),
+            "wind": shown.get("wind"),
+            "weather": descriptions.render(data.get("weather"), lang),
+            "nowcast": True,
+        }
+
+    return {"city": fc.city, "list": forecast.render(fc, units, lang)}
+
+
+def _etag(body: dict) -> str:
+    # Validator for one observation: same body -> same ETag.
+
+    raw = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def _parse_if_none_match(header: str | None) -> set[str]:
+    # 'W/"abc", "def"' -> {'"abc"', '"def"'} (weak/strong compare the same for GET).
+
+    if not header:
+        return set()
+
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
+async def _load_weather(
+    upstream,
+    lq: LocationQuery,
+    location: tuple[int, int | None] | None,
+    cache_key,
+) -> tuple[dict, int | None]:
+    # Fills a local cache miss.
+    # Returns (data, location_id) and caches the observation under its canonical location.
+
+    shared = _get_shared()
+    if shared is None:
+        data = await _fetch_weather(upstream, lq, location)
+    else:
+        # Another worker may already have it, or be fetching it right now.
+        data = await shared.fetch_once(
+            json.dumps(cache_key),
+            lambda: _fetch_weather(upstream, lq, location),
+            ttl=CACHE_TTL_SEC,
+        )
+
+    with stage("db"):
+        location_id = location[0] if location else _db_learn_location(
+            lq.key, data, by_city_id=lq.query_type == "city"
+        )
+    if location_id is not None:
+        _weather_cache.set(location_id, data)
+
+    return data, location_id
+
+
+async def _fetch_weather(
+    upstream,
+    lq: LocationQuery,
+    location: tuple[int, int | None] | None,
+) -> dict:
+    # One upstream call. Returns the parsed OpenWeather observation.
+    # Always canonical units, and no `lang`: descriptions come back in English
+    # and are rendered (and converted) per caller.
+
+    # Once we know a city's OpenWeather id, ask for it together with other misses
+    # arriving at the same time when batching is on. Ids the group call doesn't
+    # return are asked for on their own.
+    batcher = _get_batcher()
+    if lq.query_type == "city" and location and location[1] and batcher is not None:
+        with stage("upstream"):
+            data = await batcher.get(location[1])
+        if data is not None:
+            return data
+
+    return await _upstream_get(upstream, OPENWEATHER_URL, lq, location)
+
+
+async def _upstream_get(
+    upstream,
+    url: str,
+    lq: LocationQuery,
+    location: tuple[int, int | None] | None,
+) -> dict:
+    # GETs one location from an OpenWeather endpoint (/weather or /forecast).
+    # Raises HTTPException with OpenWeather's status on failure.
+
+    # Parameters for OpenWeather API request
+    params = {
+        "units": CANONICAL,
+    }
+
+    if OPENWEATHER_API_KEY:
+        params["appid"] = OPENWEATHER_API_KEY
+
+    if lq.query_type == "city":
+        query_params = dict(params, q=f"{lq.text},{lq.country}")
+    else:
+        query_params = dict(params, zip=f"{lq.text},{lq.country}")
+
+    # Once we know a city's OpenWeather id, ask for it directly.
+    # The q= form goes along as an alternate so record/replay match either way.
+    # Postal queries always stay on zip= (the city id would lose zip-level coordinates).
+    if lq.query_type == "city" and location and location[1]:
+        params["id"] = location[1]
+        alternates = (query_params,)
+    else:
+        params, alternates = query_params, ()
+
+    # Recordings made while the proxy still forwarded `lang` have lang=en in their keys.
+    alternates += tuple(dict(p, lang="en") for p in (params, *alternates))
+
+    # Calls OpenWeatherMap through the configured backend (live/record/replay).
+    with stage("upstream"):
+        response = await upstream.get(url, params, alternates)
 
     # Checks OpenWeatherMap Call response code for failure codes.
     if response.status_code != 200:
@@ -388,24 +1197,68 @@ async def weather(
         )
 
     # Parses response body into a dict/list structure.
-    data = response.json()
+    with stage("parse"):
+        return response.json()
+
+
+async def _load_forecast(
+    upstream,
+    lq: LocationQuery,
+    location: tuple[int, int | None] | None,
+    cache_key,
+) -> forecast.Forecast:
+    # Fills a forecast cache miss: one upstream call, compacted and cached under
+    # the canonical location (learned from the forecast's city block if new).
+
+    shared = _get_shared()
+    if shared is None:
+        data = await _upstream_get(upstream, OPENWEATHER_FORECAST_URL, lq, location)
+    else:
+        data = await shared.fetch_once(
+            json.dumps(["forecast", cache_key]),
+            lambda: _upstream_get(upstream, OPENWEATHER_FORECAST_URL, lq, location),
+            ttl=FORECAST_TTL_SEC,
+        )
 
-    # Logs the successful call into SQLite history.
-    _db_log(
-        query_type="city" if city else "postal",
-        city=city.strip() if city else None,
-        postal=postal.strip() if postal else None,
-        country=country,
-        units=units,
-        data=data,
-    )
+    with stage("parse"):
+        try:
+            fc = forecast.compact(data)
+        except ValueError:
+            raise HTTPException(status_code=502, detail="Upstream returned an empty forecast")
 
-    # Returns a dict with all nessecary fields for client.
-    # FastAPI serializes this dict to a JSON for HTTP response automatically.
-    return {
-        "name": data.get("name"),
-        "sys": data.get("sys"),
-        "main": data.get("main"),
-        "wind": data.get("wind"),
-        "weather": data.get("weather"),
-    }
+    if location:
+        location_id = location[0]
+    else:
+        city = fc.city
+        with stage("db"):
+            location_id = _db_learn_location(
+                lq.key,
+                {"id": city.get("id"), "name": city.get("name"), "coord": city.get("coord"),
+                 "sys": {"country": city.get("country")}},
+                by_city_id=lq.query_type == "city",
+            )
+    if location_id is not None:
+        _forecast_cache.set(location_id, fc)
+
+    return fc
+
+
+async def _fetch_group(upstream, ids: list[int]) -> dict:
+    # One group call for up to 20 city ids. Returns {city id: observation}.
+    # A failed call returns {}: every caller then retries on its own, so errors
+    # (404, 401, 429...) are reported per location exactly as without batching.
+
+    params = {"id": ",".join(str(i) for i in ids), "units": CANONICAL}
+    if OPENWEATHER_API_KEY:
+        params["appid"] = OPENWEATHER_API_KEY
+
+    response = await upstream.get(OPENWEATHER_GROUP_URL, params)
+    if response.status_code != 200:
+        return {}
+
+    try:
+        items = response.json().get("list") or []
+    except (ValueError, AttributeError):
+        return {}
+
+    return {item["id"]: item for item in items if isinstance(item, dict) and "id" in item}
@@ -0,0 +1,238 @@
+import os, json, time, asyncio, sqlite3, threading
+
+
+"""
+Cross-Worker State
+
+With several worker processes (`python -m proxy --workers N`) each one has its
+own memory, so in-process limits and caches would let N workers allow N times
+the rate limit and make up to N upstream calls for the same location.
+SharedState keeps those in the proxy's SQLite DB instead:
+
+- quotas:  each worker leases a small block of a limit at a time and spends it
+           locally, so SQLite is only written once per block, not per request
+- cache:   observations fetched by one worker are readable by all of them
+- claims:  one worker fetches a missing entry; the others wait for it
+
+Only used when PROXY_WORKERS > 1. A single worker keeps everything in memory.
+"""
+
+# Blocks per worker a limit is split into. Smaller blocks strand less quota in
+# idle workers; larger ones write less often.
+LEASES_PER_WORKER = 4
+
+# Smallest block, as long as every worker can still get one (limit // workers):
+# with 60/min over 4 workers, limit-sized splitting alone gives blocks of 1,
+# i.e. a write transaction per request again.
+MIN_LEASE = 5
+
+# How often expired rows are swept (seconds).
+CLEANUP_INTERVAL_SEC = 60.0
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    # Tables shared by all workers. Called from the proxy's schema step.
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS quota_leases (
+            name TEXT NOT NULL,
+            window TEXT NOT NULL,
+            used INTEGER NOT NULL,
+            expires REAL NOT NULL,
+            PRIMARY KEY (name, window)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS shared_cache (
+            key TEXT PRIMARY KEY,
+            expires REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+        """
+    )
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fetch_claims (
+            key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires REAL NOT NULL
+        ) WITHOUT ROWID;
+        """
+    )
+
+
+class SharedState:
+    # One per worker process. Holds a single connection, guarded by a lock.
+
+    def __init__(self, connect, workers: int):
+        # connect: returns a sqlite3 connection to the proxy DB (schema included)
+
+        self.workers = max(1, int(workers))
+        self.owner = f"{os.getpid()}:{id(self)}"
+
+        self._conn = connect()
+        self._conn.isolation_level = None   # explicit transactions only
+        self._lock = threading.Lock()
+
+        # (name, window) -> [requests left in our lease, expires]
+        self._leases = {}
+
+        # (name, window) -> expires, for windows the DB says are used up.
+        # `used` only grows, so no need to ask again until the window ends.
+        self._exhausted = {}
+        self._next_cleanup = 0.0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # Quotas
+
+    def take(self, name: str, limit: int, window: str, expires: float) -> bool:
+        # Spends one unit of `name` for `window` (ex: the UTC day, or the minute).
+        # Returns False once every unit of the window has been handed out.
+
+        self._maybe_cleanup()
+
+        if (name, window) in self._exhausted:
+            return False
+
+        lease = self._leases.get((name, window))
+        if lease is None or lease[0] <= 0:
+            granted = self._lease(name, limit, window, expires)
+            if granted <= 0:
+                self._leases.pop((name, window), None)
+                self._exhausted[(name, window)] = expires
+                return False
+            lease = self._leases[(name, window)] = [granted, expires]
+
+        lease[0] -= 1
+        return True
+
+    def used(self, name: str, window: str) -> int:
+        # Units of `name` handed out for `window` so far, by every worker.
+        # Counts whole leases, so it runs slightly ahead of the requests actually served.
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT used FROM quota_leases WHERE name = ? AND window = ?;",
+                (name, window)
+            ).fetchone()
+
+        return row[0] if row else 0
+
+    def _lease(self, name: str, limit: int, window: str, expires: float) -> int:
+        # Reserves the next block of the limit for this worker. Returns its size (0 if exhausted).
+
+        block = max(MIN_LEASE, limit // (self.workers * LEASES_PER_WORKER))
+        block = max(1, min(block, limit // self.workers))
+
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so read-then-update can't race.
+            self._conn.execute("BEGIN IMMEDIATE;")
+            try:
+                row = self._conn.execute(
+                    "SELECT used FROM quota_leases WHERE name = ? AND window = ?;",
+                    (name, window)
+                ).fetchone()
+
+                granted = min(block, limit - (row[0] if row else 0))
+                if granted > 0:
+                    self._conn.execute(
+                        """
+                        INSERT INTO quota_leases (name, window, used, expires) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(name, window) DO UPDATE SET used = used + excluded.used;
+                        """,
+                        (name, window, granted, expires)
+                    )
+                self._conn.execute("COMMIT;")
+            except BaseException:
+                self._conn.execute("ROLLBACK;")
+                raise
+
+        return granted
+
+    # Cache
+
+    def cache_get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM shared_cache WHERE key = ? AND expires > ?;",
+                (key, time.time())
+            ).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def cache_set(self, key: str, data: dict, ttl: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO shared_cache (key, expires, data) VALUES (?, ?, ?);",
+                (key, time.time() + ttl, json.dumps(data, separators=(",", ":")))
+            )
+
+    async def fetch_once(self, key: str, factory, ttl: float, claim_ttl: float = 15.0, poll: float = 0.05):
+        # Returns the shared entry for `key`, calling factory() in at most one
+        # worker at a time. The others poll the cache until it shows up.
+        # If the claiming worker fails, its claim is released and a waiter takes over;
+        # if it hangs, the claim expires after claim_ttl.
+        # SQLite calls run in a thread, so a busy DB never stalls the event loop.
+        # (Expired rows are swept by take(), which every request goes through first.)
+
+        while True:
+            data = await asyncio.to_thread(self.cache_get, key)
+            if data is not None:
+                return data
+
+            if await asyncio.to_thread(self._claim, key, claim_ttl):
+                break
+
+            await asyncio.sleep(poll)
+
+        try:
+            data = await factory()
+            await asyncio.to_thread(self.cache_set, key, data, ttl)
+            return data
+        finally:
+            await asyncio.to_thread(self._release, key)
+
+    def _claim(self, key: str, claim_ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                """
+                INSERT INTO fetch_claims (key, owner, expires) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires
+                WHERE fetch_claims.expires < ?;
+                """,
+                (key, self.owner, now + claim_ttl, now)
+            )
+        return cur.rowcount == 1
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM fetch_claims WHERE key = ? AND owner = ?;",
+                (key, self.owner)
+            )
+
+    # Housekeeping
+
+    def _maybe_cleanup(self) -> None:
+        # Drops expired leases, cache entries and abandoned claims (at most once a minute).
+
+        now = time.time()
+        if now < self._next_cleanup:
+            return
+        self._next_cleanup = now + CLEANUP_INTERVAL_SEC
+
+        self._leases = {k: v for k, v in self._leases.items() if v[1] > now}
+        self._exhausted = {k: v for k, v in self._exhausted.items() if v > now}
+
+        with self._lock:
+            for table in ("quota_leases", "shared_cache", "fetch_claims"):
+                self._conn.execute(f"DELETE FROM {table} WHERE expires < ?;", (now,))
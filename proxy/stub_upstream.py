@@ -0,0 +1,209 @@
+import os, time, zlib, argparse
+from collections import Counter
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+
+"""
+Stub OpenWeather
+
+A stand-in for OpenWeather's current-weather and forecast endpoints, so the
+proxy (and its group batching) can be run and tested without network or an API key:
+
+    python -m proxy.stub_upstream --port 8001
+    OPENWEATHER_BASE_URL=http://127.0.0.1:8001 OPENWEATHER_API_KEY=stub python -m proxy
+
+    GET /data/2.5/weather?q=London,GB | zip=22304,US | id=N
+    GET /data/2.5/group?id=N,M,...       (at most 20 ids)
+    GET /data/2.5/forecast?q=... | zip=... | id=N   (40 steps, 3 hours apart)
+    GET /stats                           calls served per endpoint
+
+Observations are made up but stable: each city's id, coordinates and
+conditions derive from its name, and change only every 10 minutes, like the
+real thing. Ids are known once a city has been asked for by name.
+Every endpoint wants an appid, of any value.
+"""
+
+GROUP_MAX_IDS = 20
+
+# (weather id, description)
+_CONDITIONS = (
+    (800, "clear sky"), (801, "few clouds"), (802, "scattered clouds"), (803, "broken clouds"),
+    (804, "overcast clouds"), (500, "light rain"), (501, "moderate rain"), (600, "light snow"), (701, "mist"),
+)
+
+app = FastAPI()
+
+# Calls served, per endpoint ("weather", "group", "forecast").
+calls = Counter()
+
+# City id -> (name, alpha-2), learned from q= lookups.
+_cities = {}
+
+
+def _error(status: int, message: str) -> JSONResponse:
+    return JSONResponse({"cod": str(status), "message": message}, status_code=status)
+
+
+def _city_id(name: str, country: str) -> int:
+    return 1_000_000 + zlib.crc32(f"{name.casefold()},{country.upper()}".encode("utf-8")) % 9_000_000
+
+
+def observation(name: str, country: str, ow_id: int, units: str = "metric") -> dict:
+    # One synthetic current-weather response, as OpenWeather shapes it.
+
+    slot = int(time.time() // 600)
+    seed = zlib.crc32(f"{ow_id}:{slot}".encode("ascii"))
+    place = zlib.crc32(str(ow_id).encode("ascii"))
+
+    temp = round((seed % 400) / 10.0 - 5.0, 2)
+    speed = round((seed >> 9) % 150 / 10.0, 2)
+    if units == "imperial":
+        temp, speed = round(temp * 1.8 + 32.0, 2), round(speed / 0.44704, 2)
+    elif units != "metric":
+        temp = round(temp + 273.15, 2)
+
+    weather_id, description = _CONDITIONS[(seed >> 17) % len(_CONDITIONS)]
+
+    lat = round((place % 18000) / 100.0 - 90.0, 4)
+    lon = round((place >> 15) % 36000 / 100.0 - 180.0, 4)
+
+    return {
+        "coord": {"lat": lat, "lon": lon},
+        "weather": [{"id": weather_id, "main": description.split()[-1].title(), "description": description}],
+        "main": {"temp": temp, "feels_like": temp, "pressure": 1013, "humidity": (seed >> 5) % 101},
+        "wind": {"speed": speed, "deg": (seed >> 3) % 360},
+        "dt": slot * 600,
+        "sys": {"country": country.upper()},
+        "id": ow_id,
+        "name": name,
+        "cod": 200,
+    }
+
+
+def forecast(name: str, country: str, ow_id: int, units: str = "metric", steps: int = 40) -> dict:
+    # One synthetic 5-day / 3-hour forecast, starting at the next 3-hour boundary.
+
+    start = (int(time.time()) // 10800 + 1) * 10800
+    now = observation(name, country, ow_id, units)
+
+    items = []
+    for i in range(steps):
+        item = observation(name, country, ow_id + i + 1, units)
+        items.append({
+            "dt": start + i * 10800,
+            "main": item["main"],
+            "weather": item["weather"],
+            "wind": item["wind"],
+            "pop": round(((ow_id + i) % 11) / 10.0, 2),
+        })
+
+    return {
+        "cod": "200",
+        "cnt": len(items),
+        "list": items,
+        "city": {"id": ow_id, "name": name, "coord": now["coord"], "country": country.upper()},
+    }
+
+
+def _locate(q: str | None, zip: str | None, id: int | None):
+    # (name, alpha-2, city id) for a q= / zip= / id= query, or an error response.
+
+    if id is not None:
+        if id not in _cities:
+            return _error(404, "city not found")
+        return (*_cities[id], id)
+
+    query = q or zip
+    if not query:
+        return _error(400, "Nothing to geocode")
+
+    text, _, country = query.rpartition(",")
+    if not text:
+        text, country = query, "US"
+    text, country = text.strip(), country.strip().upper()
+
+    # Postal codes have no city id, like OpenWeather's zip= answers.
+    if zip:
+        return f"Zip {text}", country, 0
+
+    ow_id = _city_id(text, country)
+    _cities[ow_id] = (text.title(), country)
+    return text.title(), country, ow_id
+
+
+@app.get("/data/2.5/weather")
+async def weather(
+    appid: str | None = None,
+    q: str | None = None,
+    zip: str | None = None,
+    id: int | None = None,
+    units: str = "standard",
+):
+    calls["weather"] += 1
+
+    if not appid:
+        return _error(401, "Invalid API key.")
+
+    found = _locate(q, zip, id)
+    if isinstance(found, JSONResponse):
+        return found
+    return observation(*found, units)
+
+
+@app.get("/data/2.5/forecast")
+async def forecast_route(
+    appid: str | None = None,
+    q: str | None = None,
+    zip: str | None = None,
+    id: int | None = None,
+    units: str = "standard",
+):
+    calls["forecast"] += 1
+
+    if not appid:
+        return _error(401, "Invalid API key.")
+
+    found = _locate(q, zip, id)
+    if isinstance(found, JSONResponse):
+        return found
+    return forecast(*found, units)
+
+
+@app.get("/data/2.5/group")
+async def group(appid: str | None = None, id: str = "", units: str = "standard"):
+    calls["group"] += 1
+
+    if not appid:
+        return _error(401, "Invalid API key.")
+
+    try:
+        ids = [int(i) for i in id.split(",") if i.strip()]
+    except ValueError:
+        return _error(400, "id must be a comma-separated list of city ids")
+
+    if not ids or len(ids) > GROUP_MAX_IDS:
+        return _error(400, f"between 1 and {GROUP_MAX_IDS} ids")
+
+    # Unknown ids are simply left out of the list.
+    found = [observation(*_cities[i], i, units) for i in ids if i in _cities]
+    return {"cnt": len(found), "list": found}
+
+
+@app.get("/stats")
+async def stats():
+    return dict(calls)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m proxy.stub_upstream", description="Run a stub OpenWeather.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
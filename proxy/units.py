@@ -0,0 +1,115 @@
+import json, sqlite3
+
+
+"""
+Canonical Units
+
+Observations are fetched, cached and stored in one unit system, metric
+(°C, m/s), whatever `units` the caller asked for. The same conditions asked
+for in metric and imperial are one upstream call, one cache entry, and
+history rows that compare directly. Responses are converted on the way out:
+
+    metric     °C   m/s
+    imperial   °F   mph
+    standard   K    m/s
+
+Only temperatures and wind speeds differ between OpenWeather's unit systems;
+pressure, humidity and visibility are the same in all three. The client has
+its own copy of the conversions (src/functions/units.py); change both together.
+"""
+
+UNITS = ("metric", "imperial", "standard")
+CANONICAL = "metric"
+
+# units -> (scale, offset) from the canonical value: out = value * scale + offset
+_TEMP = {"metric": (1.0, 0.0), "imperial": (1.8, 32.0), "standard": (1.0, 273.15)}
+_SPEED = {"metric": 1.0, "imperial": 1 / 0.44704, "standard": 1.0}
+
+TEMP_FIELDS = ("temp", "feels_like", "temp_min", "temp_max")
+SPEED_FIELDS = ("speed", "gust")
+
+
+def _number(value) -> bool:
+    # type() (not isinstance) so JSON true/false aren't converted.
+    return type(value) in (int, float)
+
+
+def convert_temp(value, units: str, to_canonical: bool = False):
+    # One temperature from canonical into `units` (or back). None stays None.
+
+    if not _number(value) or units == CANONICAL:
+        return value
+
+    scale, offset = _TEMP[units]
+    return round((value - offset) / scale if to_canonical else value * scale + offset, 2)
+
+
+def convert_speed(value, units: str, to_canonical: bool = False):
+    # One wind speed from canonical into `units` (or back). None stays None.
+
+    scale = _SPEED[units]
+    if not _number(value) or scale == 1.0:
+        return value
+
+    return round(value / scale if to_canonical else value * scale, 2)
+
+
+def convert(data: dict, units: str, to_canonical: bool = False) -> dict:
+    # An observation with main temperatures and wind speeds in `units`
+    # (to_canonical: from `units` into metric). Returns data itself for metric,
+    # else a copy: cached observations are shared and never modified.
+
+    if units == CANONICAL or not isinstance(data, dict):
+        return data
+
+    out = dict(data)
+
+    main = data.get("main")
+    if isinstance(main, dict):
+        out["main"] = dict(main, **{
+            f: convert_temp(main[f], units, to_canonical) for f in TEMP_FIELDS if f in main
+        })
+
+    wind = data.get("wind")
+    if isinstance(wind, dict):
+        out["wind"] = dict(wind, **{
+            f: convert_speed(wind[f], units, to_canonical) for f in SPEED_FIELDS if f in wind
+        })
+
+    return out
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    # Rewrites history rows stored in other units (before units were canonical)
+    # into metric: temp, wind_speed and the raw observation. Called from the
+    # proxy's schema step; the partial index keeps later startups from scanning.
+
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_weather_history_units ON weather_history(id) WHERE units <> 'metric';"
+    )
+
+    rows = conn.execute(
+        "SELECT id, units, temp, wind_speed, raw_json FROM weather_history WHERE units <> 'metric';"
+    ).fetchall()
+
+    updates = []
+    for row_id, units, t, wind_speed, raw_json in rows:
+        if units not in _TEMP:
+            units = "standard"      # OpenWeather's default for anything it didn't recognize
+
+        raw = None
+        if raw_json:
+            try:
+                raw = json.dumps(convert(json.loads(raw_json), units, to_canonical=True))
+            except ValueError:
+                raw = raw_json
+
+        updates.append((
+            convert_temp(t, units, to_canonical=True), convert_speed(wind_speed, units, to_canonical=True),
+            raw, row_id,
+        ))
+
+    conn.executemany(
+        "UPDATE weather_history SET units = 'metric', temp = ?, wind_speed = ?, raw_json = ? WHERE id = ?;",
+        updates,
+    )
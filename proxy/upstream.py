@@ -0,0 +1,206 @@
+import gzip, json, time, random, asyncio, threading, httpx
+from pathlib import Path
+from collections import defaultdict
+
+
+"""
+Upstream Backends
+
+The proxy talks to OpenWeather through one of these objects.
+Every backend has the same small interface:
+
+    await backend.get(url, params, alternates=()) -> httpx.Response-like object
+
+`alternates` are other param sets that ask for the same thing (ex: q=London,GB
+for a request sent as id=2643743). Live ignores them; record stores the
+response under every form and replay matches any of them, so a recording
+replays the same whatever the proxy DB has learned since.
+
+- live:   calls OpenWeather for real
+- record: calls OpenWeather and saves every response (+ timing) to a file
+- replay: serves saved responses back, no network and no API key needed
+"""
+
+UPSTREAM_MODES = ("live", "record", "replay")
+
+
+def request_key(url: str, params: dict | None) -> str:
+    # Stable identity for one upstream call.
+    # The API key is left out so recordings can be shared safely.
+
+    items = sorted(
+        (str(k), str(v))
+        for k, v in (params or {}).items()
+        if k != "appid" and v is not None
+    )
+    return url + "?" + "&".join(f"{k}={v}" for k, v in items)
+
+
+class LiveUpstream:
+    # Calls OpenWeather over the network.
+
+    needs_api_key = True
+
+    async def get(self, url: str, params: dict, alternates=()):
+        # Async HTTP client with an 8-second timeout (same as before backends existed).
+        async with httpx.AsyncClient(timeout=8) as client_http:
+            return await client_http.get(url, params=params)
+
+    def close(self) -> None:
+        pass
+
+
+class RecordingUpstream(LiveUpstream):
+    # Calls OpenWeather and appends each response to a gzip'd NDJSON file.
+    # One line per call: {"key", "alt": [...], "status", "ms", "json" | "text"}
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Appending to a gzip file adds a new member; gzip.open reads them all back.
+        self._fh = gzip.open(self.path, "at", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    async def get(self, url: str, params: dict, alternates=()):
+        start = time.perf_counter()
+        response = await super().get(url, params)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+        entry = {
+            "key": request_key(url, params),
+            "status": response.status_code,
+            "ms": round(elapsed_ms, 2),
+        }
+
+        if alternates:
+            entry["alt"] = [request_key(url, alt) for alt in alternates]
+
+        # Prefer the parsed body so the file stays compact and easy to diff.
+        try:
+            entry["json"] = response.json()
+        except Exception:
+            entry["text"] = response.text
+
+        line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False)
+
+        with self._lock:
+            self._fh.write(line + "\n")
+            # Sync-flush so a crash mid-run still leaves a readable file.
+            self._fh.flush()
+
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._fh.closed:
+                self._fh.close()
+
+
+class ReplayUpstream:
+    # Serves responses from a recording file.
+    # Repeated calls for the same request cycle through its recorded responses in order.
+
+    needs_api_key = False
+
+    def __init__(
+        self,
+        path: str | Path,
+        latency_scale: float = 1.0,
+        latency_mode: str = "recorded",
+        seed: int | None = None,
+    ):
+        # latency_mode:
+        #   "recorded" -> each response waits as long as it originally took
+        #   "sampled"  -> waits are drawn from the whole recorded distribution
+        # latency_scale multiplies the wait (0 disables waiting entirely).
+
+        if latency_mode not in ("recorded", "sampled"):
+            raise ValueError(f"Unknown latency mode: {latency_mode!r}")
+
+        self.path = Path(path)
+        self.latency_scale = max(0.0, float(latency_scale))
+        self.latency_mode = latency_mode
+
+        self._entries = defaultdict(list)
+        self._latencies = []
+        self._cursor = defaultdict(int)
+        self._rng = random.Random(seed)
+
+        with gzip.open(self.path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+
+                entry = json.loads(line)
+                for key in [entry["key"], *entry.get("alt", ())]:
+                    self._entries[key].append(entry)
+                self._latencies.append(float(entry.get("ms") or 0.0))
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def _delay_seconds(self, entry: dict) -> float:
+        if not self.latency_scale:
+            return 0.0
+
+        if self.latency_mode == "sampled" and self._latencies:
+            ms = self._rng.choice(self._latencies)
+        else:
+            ms = float(entry.get("ms") or 0.0)
+
+        return ms * self.latency_scale / 1000.0
+
+    async def get(self, url: str, params: dict, alternates=()):
+        # First recorded form that matches: the params as sent, then each alternate.
+        key, entries = None, None
+        for candidate in (params, *alternates):
+            key = request_key(url, candidate)
+            entries = self._entries.get(key)
+            if entries:
+                break
+
+        if not entries:
+            return httpx.Response(
+                404,
+                json={"cod": "404", "message": "replay: no recording for this request"},
+            )
+
+        i = self._cursor[key]
+        self._cursor[key] = i + 1
+        entry = entries[i % len(entries)]
+
+        delay = self._delay_seconds(entry)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if "json" in entry:
+            return httpx.Response(entry["status"], json=entry["json"])
+
+        return httpx.Response(entry["status"], text=entry.get("text", ""))
+
+    def close(self) -> None:
+        pass
+
+
+def make_upstream(
+    mode: str,
+    path: str | Path,
+    latency_scale: float = 1.0,
+    latency_mode: str = "recorded",
+):
+    # Builds the backend selected by config.
+
+    mode = (mode or "live").strip().lower()
+
+    if mode == "live":
+        return LiveUpstream()
+
+    if mode == "record":
+        return RecordingUpstream(path)
+
+    if mode == "replay":
+        return ReplayUpstream(path, latency_scale=latency_scale, latency_mode=latency_mode)
+
+    raise ValueError(f"UPSTREAM_MODE must be one of {UPSTREAM_MODES}, got {mode!r}")
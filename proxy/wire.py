@@ -0,0 +1,176 @@
+import json, math
+from array import array
+
+try:
+    import msgpack
+except ImportError:     # optional: without it everything is JSON, as before
+    msgpack = None
+
+
+"""
+Wire Formats
+
+History responses (/history, /search, /history/since) and sync uploads can
+travel as MessagePack instead of JSON when both ends have `msgpack`
+installed. JSON stays the default; a client opts in with
+
+    Accept: application/x-msgpack
+
+and gets a body that's smaller and several times cheaper to encode and
+decode. Uploads say which they are with Content-Type.
+
+List responses can also come back column by column (?layout=columns), in
+either format: every row's keys are sent once, and in MessagePack, float
+columns whose values all have at most FLOAT32_DECIMALS decimals (temp,
+wind_speed...) are packed as little-endian float32, 4 bytes a value:
+
+    {"items": {"layout": "columns", "count": 2, "columns": {
+        "city": ["London", "Paris"],
+        "temp": {"dtype": "f4", "decimals": 2, "data": b"..."},
+        ...}}}
+
+decode() turns either layout back into a list of row dicts, rounding float32
+columns to their decimals, so callers never see the difference. The client
+has its own copy of it (src/functions/wire.py); change both together.
+"""
+
+JSON = "application/json"
+MSGPACK = "application/x-msgpack"
+_MSGPACK_TYPES = {MSGPACK, "application/msgpack", "application/vnd.msgpack"}
+
+LAYOUTS = ("rows", "columns")
+
+# Float32 keeps these decimals exactly for |values| below FLOAT32_MAX_ABS (its
+# spacing there is < 0.0005), so such a column round-trips without loss.
+FLOAT32_DECIMALS = 2
+FLOAT32_MAX_ABS = 8192.0
+
+
+def available() -> bool:
+    return msgpack is not None
+
+
+def _media_type(header: str | None) -> str:
+    return (header or "").split(";", 1)[0].strip().lower()
+
+
+def is_msgpack(content_type: str | None) -> bool:
+    return _media_type(content_type) in _MSGPACK_TYPES
+
+
+def negotiate(accept: str | None) -> str:
+    # The media type to answer with: MessagePack when the Accept header ranks it
+    # above JSON (and msgpack is installed), else JSON.
+
+    if msgpack is None or not accept:
+        return JSON
+
+    best_msgpack = best_json = 0.0
+    for part in accept.split(","):
+        media, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for p in params:
+            if p.lower().startswith("q="):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.0
+
+        media = media.lower()
+        if media in _MSGPACK_TYPES:
+            best_msgpack = max(best_msgpack, q)
+        elif media in (JSON, "application/*", "*/*"):
+            best_json = max(best_json, q)
+
+    return MSGPACK if best_msgpack > 0 and best_msgpack >= best_json else JSON
+
+
+def _float32_ok(values: list) -> bool:
+    # Every value a float (or None) that float32 keeps at FLOAT32_DECIMALS.
+
+    seen = False
+    for v in values:
+        if v is None:
+            continue
+        if type(v) is not float or not abs(v) < FLOAT32_MAX_ABS or round(v, FLOAT32_DECIMALS) != v:
+            return False
+        seen = True
+    return seen
+
+
+def to_columns(items: list[dict], binary: bool = False) -> dict:
+    # Row dicts -> the columnar layout. binary: float32 columns as bytes (MessagePack only).
+
+    names = {}
+    for item in items:
+        names.update(dict.fromkeys(item))
+
+    columns = {}
+    for name in names:
+        values = [item.get(name) for item in items]
+        if binary and _float32_ok(values):
+            packed = array("f", (math.nan if v is None else v for v in values))
+            columns[name] = {"dtype": "f4", "decimals": FLOAT32_DECIMALS, "data": packed.tobytes()}
+        else:
+            columns[name] = values
+
+    return {"layout": "columns", "count": len(items), "columns": columns}
+
+
+def from_columns(table: dict) -> list[dict]:
+    # The columnar layout -> row dicts. Raises ValueError if it's malformed.
+
+    count, columns = table.get("count"), table.get("columns")
+    if type(count) is not int or count < 0 or not isinstance(columns, dict):
+        raise ValueError("bad columnar table")
+
+    values = {}
+    for name, column in columns.items():
+        if isinstance(column, dict):
+            if column.get("dtype") != "f4" or not isinstance(column.get("data"), bytes):
+                raise ValueError(f"bad column {name!r}")
+            packed = array("f")
+            packed.frombytes(column["data"])
+            decimals = int(column.get("decimals", FLOAT32_DECIMALS))
+            column = [None if math.isnan(v) else round(v, decimals) for v in packed]
+        if not isinstance(column, list) or len(column) != count:
+            raise ValueError(f"column {name!r} doesn't have {count} values")
+        values[name] = column
+
+    names = list(values)
+    return [dict(zip(names, row)) for row in zip(*(values[n] for n in names))] if names else [{} for _ in range(count)]
+
+
+def encode(body: dict, media_type: str = JSON, layout: str = "rows") -> bytes:
+    # A response body ({"items": [...], ...}) in `media_type` and `layout`.
+
+    binary = media_type == MSGPACK
+    if layout == "columns" and isinstance(body.get("items"), list):
+        body = dict(body, items=to_columns(body["items"], binary=binary))
+
+    if binary:
+        return msgpack.packb(body, use_bin_type=True)
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode(data: bytes, content_type: str | None = None) -> dict:
+    # A body from encode() (either format, either layout) -> dict with "items" as rows.
+    # Raises ValueError on anything malformed.
+
+    binary = is_msgpack(content_type)
+    if binary and msgpack is None:
+        raise ValueError("MessagePack body, but msgpack isn't installed")
+
+    try:
+        body = msgpack.unpackb(data, raw=False) if binary else json.loads(data)
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"bad body: {exc}") from None
+
+    if not isinstance(body, dict):
+        raise ValueError("body must be an object")
+
+    items = body.get("items")
+    if isinstance(items, dict) and items.get("layout") == "columns":
+        body["items"] = from_columns(items)
+
+    return body
@@ -4,4 +4,4 @@ if (!(Test-Path ".venv")) {
   .\setup.ps1
 }
 
-.\.venv\Scripts\python src\main.py
+.\.venv\Scripts\python src\main.py @args
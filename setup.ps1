@@ -18,4 +18,4 @@ if (!(Test-Path ".venv")) {
 
 Write-Host "Setup complete."
 Write-Host "Run client: '.\.venv\Scripts\python src\main.py' or 'python -m src.main'"
-Write-Host "Run proxy:  .\.venv\Scripts\uvicorn proxy.server:app --host 127.0.0.1 --port 8000"
+Write-Host "Run proxy:  .\.venv\Scripts\python -m proxy --host 127.0.0.1 --port 8000"
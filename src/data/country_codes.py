@@ -1,45 +1,43 @@
-import pycountry
+from src.data.country_index import get_index
 from src.data.i18n import TEXT
 
 
+def load_countries() -> None:
+    # Loads the country index (from its disk cache, or built from pycountry the
+    # first time); main.py calls this on a background thread while the user types.
+
+    get_index()
+
+
 def resolve_country(user_text: str, allow_fuzzy: bool = True):
-    # Tries to resolve user input into a pycountry country object.
+    # Tries to resolve user input into a Country (alpha_2, alpha_3, name, name_ja).
+    # Accepts codes, English and Japanese names (see country_index.py).
     # Returns: (best_match | None, candidates_list)
 
     s = (user_text or "").strip()
     if not s:
         return None, []
 
-    u = s.upper()
-
-    # alpha-2 match
-    if len(u) == 2:
-        c = pycountry.countries.get(alpha_2=u)
-        if c:
-            return c, [c]
+    index = get_index()
 
-    # alpha-3 match
-    if len(u) == 3:
-        c = pycountry.countries.get(alpha_3=u)
-        if c:
-            return c, [c]
+    # alpha-2 / alpha-3 / any known name
+    c = index.lookup(s)
+    if c:
+        return c, [c]
 
-    # exact name match
-    for c in pycountry.countries:
-        if c.name.lower() == s.lower():
-            return c, [c]
-
-    # fuzzy fallback (pycountry built-in)
+    # fuzzy fallback (trigram match, top 5)
     if allow_fuzzy:
-        try:
-            matches = pycountry.countries.search_fuzzy(s)
-            return matches[0], matches[:5]
-        except LookupError:
-            pass
+        matches = index.search(s, k=5)
+        if matches:
+            return matches[0], matches
 
     return None, []
 
 
+def _display_name(country, lang: str) -> str:
+    return country.name_ja if lang == "ja" and country.name_ja else country.name
+
+
 def prompt_country_code(confirm: bool = True, allow_fuzzy: bool = True, lang: str = "en") -> str:
     # Interactive country prompt.
     # Returns alpha-2 code (lowercase handled by caller if desired).
@@ -61,7 +59,7 @@ def prompt_country_code(confirm: bool = True, allow_fuzzy: bool = True, lang: st
         if len(candidates) > 1:
             print(t["possible_matches"])
             for i, c in enumerate(candidates, start=1):
-                print(f"  {i}) {c.name} [{c.alpha_2}/{c.alpha_3}]")
+                print(f"  {i}) {_display_name(c, lang)} [{c.alpha_2}/{c.alpha_3}]")
 
             choice = input(t["select_number"]).strip()
             if choice:
@@ -74,7 +72,7 @@ def prompt_country_code(confirm: bool = True, allow_fuzzy: bool = True, lang: st
         alpha2 = best.alpha_2
 
         if confirm:
-            yn = input(t["confirm_country"].format(name=best.name, code=alpha2)).strip().lower()
+            yn = input(t["confirm_country"].format(name=_display_name(best, lang), code=alpha2)).strip().lower()
             if yn not in ("y", "yes"):
                 print(t["try_again"])
                 continue
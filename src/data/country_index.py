@@ -0,0 +1,248 @@
+import os, re, json, heapq, threading, unicodedata
+from pathlib import Path
+from collections import Counter
+from typing import NamedTuple
+
+
+"""
+Country Index
+
+Everything resolve_country() matches against, precomputed from pycountry
+once and cached on disk (LocalAppData), so later runs don't import pycountry
+or parse its ISO JSON at all:
+
+    keys:   normalized spelling -> country   (alpha-2, alpha-3, name, official
+                                              and common names, Japanese names)
+    grams:  trigram -> keys containing it    (fuzzy candidates)
+
+Fuzzy matching scores every name sharing a trigram with the query (Dice
+coefficient, plus a bonus when the query starts a word of the name), then
+keeps the best few that are also close in edit distance (or that the query
+is a prefix of), one per country. Codes only ever match exactly.
+
+The cache is rebuilt when pycountry's version or INDEX_VERSION changes.
+"""
+
+INDEX_VERSION = 1
+
+# Best-scoring names checked for edit distance per fuzzy lookup.
+FUZZY_CANDIDATES = 20
+
+# Everyday spellings pycountry doesn't carry.
+ALIASES = {
+    "UK": "GB", "Great Britain": "GB", "England": "GB", "America": "US",
+    "Holland": "NL", "Burma": "MM", "Ivory Coast": "CI",
+    "アメリカ": "US", "アメリカ合衆国": "US", "イギリス": "GB", "韓国": "KR", "北朝鮮": "KP",
+    "中国": "CN", "台湾": "TW", "ロシア": "RU", "ベトナム": "VN",
+}
+
+
+class Country(NamedTuple):
+    alpha_2: str
+    alpha_3: str
+    name: str
+    name_ja: str
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize(text: str | None) -> str:
+    # NFKC + casefold, accents dropped, punctuation -> spaces: "Côte d'Ivoire" -> "cote d ivoire".
+
+    text = unicodedata.normalize("NFKD", unicodedata.normalize("NFKC", text or "").casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+def trigrams(key: str) -> set[str]:
+    # Padded, so short keys ("日本", "uk") still have grams and word starts weigh more.
+
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def cache_path() -> Path:
+    base = os.getenv("LOCALAPPDATA", "").strip()
+    root = Path(base) / "weather_application" if base else Path.home() / ".weather_application"
+    return root / "country_index.json"
+
+
+def _pycountry_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("pycountry")
+    except Exception:
+        # Frozen builds may not ship package metadata; the index is still rebuilt per INDEX_VERSION.
+        return "unknown"
+
+
+def build() -> dict:
+    # Reads pycountry (slow: imports it and parses its ISO data) into the index dict.
+
+    import gettext, pycountry
+
+    try:
+        ja = gettext.translation("iso3166-1", pycountry.LOCALES_DIR, languages=["ja"]).gettext
+    except OSError:
+        ja = lambda s: s
+
+    countries, keys, codes = [], {}, set()
+
+    def add(spelling, i):
+        key = normalize(spelling)
+        if key:
+            keys.setdefault(key, i)
+
+    for c in sorted(pycountry.countries, key=lambda c: c.alpha_2):
+        i = len(countries)
+        countries.append([c.alpha_2, c.alpha_3, c.name, ja(c.name)])
+
+        # Codes first, so a code never loses its key to some other country's name.
+        add(c.alpha_2, i)
+        add(c.alpha_3, i)
+        codes.update((normalize(c.alpha_2), normalize(c.alpha_3)))
+
+    for i, (alpha_2, _, name, name_ja) in enumerate(countries):
+        c = pycountry.countries.get(alpha_2=alpha_2)
+        for spelling in (name, getattr(c, "official_name", None), getattr(c, "common_name", None)):
+            if spelling:
+                add(spelling, i)
+                add(ja(spelling), i)
+        add(name_ja, i)
+
+    by_code = {c[0]: i for i, c in enumerate(countries)}
+    for spelling, code in ALIASES.items():
+        add(spelling, by_code[code])
+
+    key_list = sorted(keys)
+    grams = {}
+    for key_id, key in enumerate(key_list):
+        if key in codes:
+            continue
+        for gram in trigrams(key):
+            grams.setdefault(gram, []).append(key_id)
+
+    return {
+        "version": INDEX_VERSION,
+        "source": _pycountry_version(),
+        "countries": countries,
+        "keys": [[key, keys[key]] for key in key_list],
+        "grams": grams,
+    }
+
+
+def _read_cache(path: Path) -> dict | None:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+    if data.get("version") != INDEX_VERSION or data.get("source") != _pycountry_version():
+        return None
+    return data
+
+
+def _write_cache(path: Path, data: dict) -> None:
+    # Written to a temp file and renamed, so a crash never leaves half an index.
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        pass    # read-only profile: just rebuild next time
+
+
+class CountryIndex:
+    def __init__(self, data: dict):
+        self.countries = [Country(*c) for c in data["countries"]]
+        self.keys = [k for k, _ in data["keys"]]
+        self.owner = [i for _, i in data["keys"]]
+        self.exact = dict(data["keys"])
+        self.grams = data["grams"]
+
+    def lookup(self, text: str) -> Country | None:
+        # Exact match on any indexed spelling (codes, names, Japanese names, aliases).
+
+        i = self.exact.get(normalize(text))
+        return None if i is None else self.countries[i]
+
+    def search(self, text: str, k: int = 5) -> list[Country]:
+        # Up to k countries whose names best match text, best first.
+
+        q = normalize(text)
+        if not q:
+            return []
+
+        q_grams = trigrams(q)
+        shared = Counter()
+        for gram in q_grams:
+            shared.update(self.grams.get(gram, ()))
+
+        def score(key_id):
+            key = self.keys[key_id]
+            dice = 2.0 * shared[key_id] / (len(q_grams) + len(key) + 1)
+            return dice + (0.5 if _starts_word(q, key) else 0.0)
+
+        out, seen = [], set()
+        for key_id in heapq.nlargest(FUZZY_CANDIDATES, shared, key=score):
+            country = self.owner[key_id]
+            if country not in seen and _close(q, self.keys[key_id]):
+                seen.add(country)
+                out.append(self.countries[country])
+                if len(out) == k:
+                    break
+        return out
+
+
+def _starts_word(q: str, key: str) -> bool:
+    return len(q) >= 3 and (key.startswith(q) or f" {q}" in key)
+
+
+def _distance(a: str, b: str) -> int:
+    # Edit distance counting a swap of neighbours as one edit ("frnace" -> "france").
+
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _close(q: str, key: str) -> bool:
+    # A typo away from the name (or one of its words), about one edit per 4 letters,
+    # or the start of one of its words.
+
+    if _starts_word(q, key):
+        return True
+
+    limit = max(1, len(q) // 4)
+    words = (key, *key.split()) if " " in key else (key,)
+    return any(abs(len(w) - len(q)) <= limit and _distance(q, w) <= limit for w in words)
+
+
+def get_index() -> CountryIndex:
+    # The process-wide index: from the disk cache, or built (and cached) on first use.
+
+    global _index
+
+    with _index_lock:
+        if _index is None:
+            path = cache_path()
+            data = _read_cache(path)
+            if data is None:
+                data = build()
+                _write_cache(path, data)
+            _index = CountryIndex(data)
+
+    return _index
@@ -16,6 +16,10 @@ TEXT = {
         "enter_city_or_postal": "Enter a municipality name or press Enter to use a postal code: ",
         "enter_postal": "Enter a postal/ZIP code: ",
 
+        # Recent locations quick pick
+        "recent_title": "\nRecent locations:",
+        "recent_pick": "Pick a number, or press Enter for a new location: ",
+
         # Country prompts
         "enter_country": "Enter country (name, alpha-2, or alpha-3): ",
         "no_country_found": "No country found. Try 'United States', 'US', 'USA', 'Japan', 'JP', etc.\n",
@@ -41,16 +45,23 @@ TEXT = {
         "rate_limited": "Error: Proxy rate limit exceeded. Please try again later.",
         "http_error": "HTTP error occurred",
         "request_error": "An error occurred during the API request",
+        "offline_miss": "No saved weather for this location (offline mode)",
+
+        # Marks output served from local history
+        "cached_note": "cached",
 
         # History/search menu
-        "history_prompt": "\n[h]istory, [s]earch, or press Enter to quit: ",
+        "history_prompt": "\n[h]istory, [s]earch, [f]ilter, [t]rends, or press Enter to quit: ",
         "history_count": "How many entries? (default 10): ",
         "search_prompt": "Search text (ex: 'rain', 'Tokyo'): ",
         "search_blank": "Search text can't be blank.",
+        "filter_prompt": "Filters (ex: country=jp since=2026-01-01 temp>=20 humidity<=60 sort=oldest): ",
+        "filter_more": "Enter for more, anything else to stop: ",
+        "trends_prompt": "Location (ex: 'Tokyo,jp', '22304,us'): ",
         "no_history": "\nNo history found yet.\n",
         "history_title": "\n--- Local History ---",
         "history_footer": "---------------------\n",
-        "unknown_option": "Unknown option. Use 'h', 's', or Enter.",
+        "unknown_option": "Unknown option. Use 'h', 's', 'f', 't', or Enter.",
     },
 
     "ja": {
@@ -61,6 +72,10 @@ TEXT = {
         "enter_city_or_postal": "市区町村名を入力（郵便番号ならEnter）: ",
         "enter_postal": "郵便番号を入力: ",
 
+        # Recent locations quick pick
+        "recent_title": "\n最近の場所:",
+        "recent_pick": "番号を選択（新しい場所ならEnter）: ",
+
         # Country prompts
         "enter_country": "国を入力（国名 / alpha-2 / alpha-3）: ",
         "no_country_found": "国が見つかりません。例: 'United States', 'US', 'USA', 'Japan', 'JP' など。\n",
@@ -86,16 +101,23 @@ TEXT = {
         "rate_limited": "エラー: レート制限です。少し待ってから再試行してください。",
         "http_error": "HTTPエラー",
         "request_error": "APIリクエスト中にエラーが発生しました",
+        "offline_miss": "この場所の保存データがありません（オフライン）",
+
+        # Marks output served from local history
+        "cached_note": "キャッシュ",
 
         # History/search menu
-        "history_prompt": "\n[h]履歴, [s]検索, Enterで終了: ",
+        "history_prompt": "\n[h]履歴, [s]検索, [f]絞り込み, [t]傾向, Enterで終了: ",
         "history_count": "件数（default 10）: ",
         "search_prompt": "検索（例: 'rain', 'Tokyo'）: ",
         "search_blank": "検索文字は空にできません。",
+        "filter_prompt": "条件（例: country=jp since=2026-01-01 temp>=20 humidity<=60 sort=oldest）: ",
+        "filter_more": "Enterで続きを表示、それ以外で終了: ",
+        "trends_prompt": "場所（例: 'Tokyo,jp', '22304,us'）: ",
         "no_history": "\n履歴はまだありません。\n",
         "history_title": "\n--- ローカル履歴 ---",
         "history_footer": "---------------------\n",
-        "unknown_option": "無効な選択です。'h' / 's' / Enter を使ってください。",
+        "unknown_option": "無効な選択です。'h' / 's' / 'f' / 't' / Enter を使ってください。",
     },
 }
 
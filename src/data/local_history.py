@@ -1,6 +1,8 @@
-import os, json, sqlite3
+import os, re, sys, json, time, uuid, queue, atexit, sqlite3, itertools, threading, unicodedata
+from array import array
 from pathlib import Path
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from src.data import search_index
 
 
 def _local_appdata_dir() -> Path:
@@ -20,48 +22,232 @@ def db_path() -> Path:
     return _local_appdata_dir() / "weather_history.sqlite"
 
 
-def _connect() -> sqlite3.Connection:
-    # Opens SQLite connection, ensures folder exists.
+def location_key(query_type: str, text: str | None, country: str | None) -> str:
+    # Normalized identity of a lookup, so "london", " London " and "ＬＯＮＤＯＮ" match.
+    # Ex: location_key("city", " London ", "gb") -> "city:london|GB"
+
+    text = unicodedata.normalize("NFKC", text or "")
+    text = re.sub(r"\s+", " ", text).strip().casefold()
+    return f"{query_type}:{text}|{(country or '').strip().upper()}"
+
+
+# One long-lived connection per process (re-opened only if the DB path changes).
+# The lock serializes access from batch/watch worker threads.
+_conn = None
+_conn_path = None
+_lock = threading.RLock()
+
+# Background writer: log_weather() only queues the row; one thread commits
+# whatever has piled up in a single transaction. The queue is bounded, so a
+# stuck disk slows logging down instead of eating memory, and nothing is dropped:
+# rows that still can't be saved after WRITE_RETRIES attempts are kept (parked)
+# and go again with the next batch, and flush() reports them.
+WRITE_QUEUE_SIZE = 256
+WRITE_BATCH_ROWS = 256
+WRITE_RETRIES = 8
+
+_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+
+# (path, row) items not saved yet, oldest first, and why. Only the writer changes them.
+_parked = []
+_parked_error = None
+_parked_lock = threading.Lock()
+
+# Queued by flush() to have the writer retry parked rows when nothing new is coming.
+_RETRY = object()
+
+_INSERT_SQL = """
+    INSERT INTO weather_history (
+        created_utc, query_type, city, postal, country, units, lang,
+        name, description, temp, humidity, wind_speed, raw_json, loc_key, weather_id, proxy_logged,
+        prefetch
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+
+def _migration_1(conn: sqlite3.Connection) -> None:
+    # Base table + indexes (IF NOT EXISTS: DBs from before versioning already have them).
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS weather_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_utc TEXT NOT NULL,
+            query_type TEXT NOT NULL,
+            city TEXT,
+            postal TEXT,
+            country TEXT NOT NULL,
+            units TEXT NOT NULL,
+            lang TEXT NOT NULL,
+            name TEXT,
+            description TEXT,
+            temp REAL,
+            humidity INTEGER,
+            wind_speed REAL,
+            raw_json TEXT
+        );
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_created ON weather_history(created_utc);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_name ON weather_history(name);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_desc ON weather_history(description);")
+
+
+def _migration_2(conn: sqlite3.Connection) -> None:
+    # Lookup key used by the freshness cache, filled in for existing rows.
+
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(weather_history);")}
+    if "loc_key" not in cols:
+        conn.execute("ALTER TABLE weather_history ADD COLUMN loc_key TEXT;")
+        rows = conn.execute("SELECT id, query_type, city, postal, country FROM weather_history;").fetchall()
+        conn.executemany(
+            "UPDATE weather_history SET loc_key = ? WHERE id = ?;",
+            [
+                (location_key(r["query_type"], r["city"] or r["postal"], r["country"]), r["id"])
+                for r in rows
+            ],
+        )
+
+    # Newest row for one location/units/lang is a single index seek.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_lookup ON weather_history(loc_key, units, lang, created_utc);")
+
+
+def _migration_3(conn: sqlite3.Connection) -> None:
+    # Access paths for query_history(): each equality filter seeks straight to its
+    # rows already in date order; each measurement range seeks its own index.
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_country ON weather_history(country, created_utc);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_type ON weather_history(query_type, created_utc);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_lang ON weather_history(lang, created_utc);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_temp ON weather_history(temp);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_humidity ON weather_history(humidity);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_wind ON weather_history(wind_speed);")
+
+
+def _migration_4(conn: sqlite3.Connection) -> None:
+    # OpenWeather condition id (see JP_WEATHER_ID), backfilled from the saved JSON,
+    # and a covering index so trends read one location's columns without touching the table.
+
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(weather_history);")}
+    if "weather_id" not in cols:
+        conn.execute("ALTER TABLE weather_history ADD COLUMN weather_id INTEGER;")
+        conn.execute(
+            "UPDATE weather_history SET weather_id = json_extract(raw_json, '$.data.weather[0].id') "
+            "WHERE json_valid(raw_json);"
+        )
+
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_wh_trends "
+        "ON weather_history(loc_key, created_utc, temp, humidity, weather_id);"
+    )
+
+
+def _migration_5(conn: sqlite3.Connection) -> None:
+    # Sync with the proxy (see src/functions/sync.py): rows pulled from the central
+    # DB carry its id (so they're stored once and never uploaded back), and
+    # sync_state keeps this device's id and both directions' high-water marks.
+
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(weather_history);")}
+    if "central_id" not in cols:
+        conn.execute("ALTER TABLE weather_history ADD COLUMN central_id INTEGER;")
+
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_wh_central ON weather_history(central_id) "
+        "WHERE central_id IS NOT NULL;"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);")
+
+
+def _migration_6(conn: sqlite3.Connection) -> None:
+    # Rows the proxy already stored centrally when it answered the lookup
+    # (/weather logs them under this device's id), so sync doesn't upload them again.
+
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(weather_history);")}
+    if "proxy_logged" not in cols:
+        conn.execute("ALTER TABLE weather_history ADD COLUMN proxy_logged INTEGER NOT NULL DEFAULT 0;")
+
+
+def _migration_7(conn: sqlite3.Connection) -> None:
+    # Background refreshes of the recent-locations quick pick (see src/functions/recent.py).
+    # They only fill the cache: until the user actually asks for one, it doesn't count
+    # as a lookup (ranking) and isn't uploaded by sync.
+
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(weather_history);")}
+    if "prefetch" not in cols:
+        conn.execute("ALTER TABLE weather_history ADD COLUMN prefetch INTEGER NOT NULL DEFAULT 0;")
+
+
+# Applied in order; PRAGMA user_version records the last one a DB has seen.
+# New schema changes go at the end, never edit an applied one.
+MIGRATIONS = [_migration_1, _migration_2, _migration_3, _migration_4, _migration_5, _migration_6, _migration_7]
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    # Brings the DB up to len(MIGRATIONS), one transaction per step.
+
+    version = conn.execute("PRAGMA user_version;").fetchone()[0]
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Explicit BEGIN: sqlite3 would otherwise run the DDL outside any transaction.
+        conn.execute("BEGIN;")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number};")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def _connect(p: Path | None = None) -> sqlite3.Connection:
+    # Returns the shared connection, opening and migrating it on first use.
+    # Callers hold _lock while using it.
+
+    global _conn, _conn_path
+
+    p = p or db_path()
+    if _conn is not None and _conn_path == p:
+        return _conn
+
+    close_db()
 
-    p = db_path()
     p.parent.mkdir(parents=True, exist_ok=True)
 
-    conn = sqlite3.connect(str(p))
+    conn = sqlite3.connect(str(p), check_same_thread=False, cached_statements=256)
     conn.row_factory = sqlite3.Row
+
+    # WAL + NORMAL: commits don't wait for a full fsync, readers never block the writer.
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+
+    _migrate(conn)
+
+    # Search index sidecar (weather_history.search.sqlite), see search_index.py.
+    search_index.attach(conn, search_index.sidecar_path(p))
+
+    _conn, _conn_path = conn, p
     return conn
 
 
+def close_db() -> None:
+    # Closes the shared connection (the next call re-opens it).
+
+    global _conn, _conn_path
+
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+        _conn, _conn_path = None, None
+
+
 def init_db() -> None:
-    # Creates the table if it doesn't exist yet.
+    # Opens the DB and applies any pending migrations (cheap after the first call).
 
-    conn = _connect()
-    try:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS weather_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                created_utc TEXT NOT NULL,
-                query_type TEXT NOT NULL,
-                city TEXT,
-                postal TEXT,
-                country TEXT NOT NULL,
-                units TEXT NOT NULL,
-                lang TEXT NOT NULL,
-                name TEXT,
-                description TEXT,
-                temp REAL,
-                humidity INTEGER,
-                wind_speed REAL,
-                raw_json TEXT
-            );
-            """
-        )
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_created ON weather_history(created_utc);")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_name ON weather_history(name);")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_wh_desc ON weather_history(description);")
-        conn.commit()
-    finally:
-        conn.close()
+    with _lock:
+        _connect()
 
 
 def log_weather(
@@ -74,8 +260,14 @@ def log_weather(
     lang: str,
     description_override: str | None = None,
     data: dict,
+    proxy_logged: bool = False,
+    prefetch: bool = False,
 ) -> None:
-    # Inserts one successful weather call into local SQLite.
+    # Records one successful weather call in local SQLite.
+    # proxy_logged: a live /weather answer, which the proxy already stored centrally
+    # (nowcasts it keeps out of history on purpose), so sync doesn't upload it.
+    # prefetch: a background refresh, not asked for by the user (see claim_prefetched()).
+    # Returns right away: the row is committed by the background writer (see flush()).
 
     created_utc = datetime.now(timezone.utc).isoformat()
 
@@ -92,36 +284,218 @@ def log_weather(
     humidity = main.get("humidity")
     wind_speed = (data.get("wind") or {}).get("speed")
 
-    conn = _connect()
     try:
-        conn.execute(
-            """
-            INSERT INTO weather_history (
-                created_utc, query_type, city, postal, country, units, lang,
-                name, description, temp, humidity, wind_speed, raw_json
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+        weather_id = int(weather0.get("id"))
+    except (TypeError, ValueError):
+        weather_id = None
+
+    row = (
+        created_utc,
+        query_type,
+        city,
+        postal,
+        country,
+        units,
+        (lang or "en").strip().lower(),
+        name,
+        description,
+        temp,
+        humidity,
+        wind_speed,
+        # We wrap the response so we can store a little bit of metadata too.
+        json.dumps({"lang": (lang or "en").strip().lower(), "data": data}),
+        location_key(query_type, city or postal, country),
+        weather_id,
+        1 if proxy_logged else 0,
+        1 if prefetch else 0,
+    )
+
+    # Blocks only if the writer is WRITE_QUEUE_SIZE rows behind.
+    _ensure_writer()
+    _queue.put((db_path(), row))
+
+
+def _ensure_writer() -> None:
+    global _writer
+
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_loop, name="history-writer", daemon=True)
+            _writer.start()
+
+
+def _write_loop() -> None:
+    # Waits for one row, then takes everything else already queued.
+    # Parked rows go first, so rows are still committed in the order they were logged.
+
+    global _parked, _parked_error
+
+    while True:
+        items = [_queue.get()]
+        while len(items) < WRITE_BATCH_ROWS:
+            try:
+                items.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            batch = _parked + [item for item in items if item is not _RETRY]
+            try:
+                unwritten, error = _write_batch(batch) if batch else ([], None)
+            except Exception as err:
+                # Whatever went wrong, the rows are kept and the thread carries on.
+                unwritten, error = batch, err
+
+            with _parked_lock:
+                _parked, _parked_error = unwritten, error if unwritten else None
+        finally:
+            for _ in items:
+                _queue.task_done()
+
+
+def _commit(path: Path, rows: list) -> None:
+    # One transaction. A locked/busy DB is retried with backoff; raises once it gives up.
+
+    for attempt in range(WRITE_RETRIES):
+        try:
+            with _lock:
+                conn = _connect(path)
+                with conn:
+                    conn.executemany(_INSERT_SQL, rows)
+                    search_index.index_new_rows(conn)
+            return
+        except sqlite3.OperationalError:
+            if attempt == WRITE_RETRIES - 1:
+                raise
+            time.sleep(min(1.0, 0.05 * 2 ** attempt))
+
+
+def _write_batch(batch: list) -> tuple[list, Exception | None]:
+    # Commits queued rows, one transaction per DB file (normally just one).
+    # Returns the (path, row) items it couldn't save, and the last error.
+
+    by_path = {}
+    for path, row in batch:
+        by_path.setdefault(path, []).append(row)
+
+    unwritten, error = [], None
+    for path, rows in by_path.items():
+        try:
+            _commit(path, rows)
+        except sqlite3.OperationalError as err:
+            # Still locked, disk full...: the whole batch waits for the next attempt.
+            unwritten += [(path, row) for row in rows]
+            error = err
+        except Exception as err:
+            # Something about the rows themselves: one at a time, so a bad one can't hold back the rest.
+            error = err
+            for row in rows:
+                try:
+                    _commit(path, [row])
+                except Exception as row_err:
+                    unwritten.append((path, row))
+                    error = row_err
+
+    return unwritten, error
+
+
+def _wait_for_writes(retry: bool = False) -> None:
+    # Waits until the writer has been through every queued row.
+    # Reads call this first, so they see what was just logged (parked rows once saved).
+    # retry: also have it try the parked rows once more.
+
+    if _writer is None:
+        return
+
+    if retry and _parked:
+        _ensure_writer()
+        _queue.put(_RETRY)
+    _queue.join()
+
+
+def flush() -> None:
+    # Waits until every queued row is committed.
+    # Raises sqlite3.OperationalError if some still can't be; they stay queued
+    # (and are retried) for as long as the process runs.
+
+    _wait_for_writes(retry=True)
+
+    with _parked_lock:
+        if _parked:
+            raise sqlite3.OperationalError(f"{len(_parked)} history rows not saved yet: {_parked_error}")
+
+
+def _flush_at_exit() -> None:
+    # Interpreter exit (normal end, sys.exit, or an uncaught Ctrl+C) still saves queued rows.
+    # Rows that can't be saved by now are reported: this is their last chance.
+
+    try:
+        flush()
+    except sqlite3.OperationalError as err:
+        print(f"Could not save history: {err}", file=sys.stderr)
+
+
+atexit.register(_flush_at_exit)
+
+
+def fetch_cached(
+    query_type: str,
+    text: str | None,
+    country: str,
+    units: str,
+    lang: str,
+    max_age_sec: float | None = None,
+) -> dict | None:
+    # Newest stored observation for this location/units/lang.
+    # max_age_sec=None ignores age (offline mode).
+    # Returns {"id", "data", "created_utc", "age_sec", "prefetch"} or None.
+
+    params = [location_key(query_type, text, country), units, (lang or "en").strip().lower()]
+    age_filter = ""
+
+    if max_age_sec is not None:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age_sec)
+        age_filter = "AND created_utc >= ?"
+        params.append(cutoff.isoformat())
+
+    _wait_for_writes()
+
+    with _lock:
+        conn = _connect()
+        row = conn.execute(
+            f"""
+            SELECT id, created_utc, raw_json, prefetch
+            FROM weather_history
+            WHERE loc_key = ? AND units = ? AND lang = ? {age_filter}
+            ORDER BY created_utc DESC
+            LIMIT 1;
             """,
-            (
-                created_utc,
-                query_type,
-                city,
-                postal,
-                country,
-                units,
-                (lang or "en").strip().lower(),
-                name,
-                description,
-                temp,
-                humidity,
-                wind_speed,
-                # We wrap the response so we can store a little bit of metadata too.
-                json.dumps({"lang": (lang or "en").strip().lower(), "data": data}),
-            ),
-        )
-        conn.commit()
-    finally:
-        conn.close()
+            params,
+        ).fetchone()
+
+    if row is None or not row["raw_json"]:
+        return None
+
+    data = json.loads(row["raw_json"]).get("data") or {}
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(row["created_utc"])
+
+    return {
+        "id": row["id"],
+        "data": data,
+        "created_utc": row["created_utc"],
+        "age_sec": max(0.0, age.total_seconds()),
+        "prefetch": bool(row["prefetch"]),
+    }
+
+
+def claim_prefetched(row_id: int) -> None:
+    # The user asked for a prefetched observation: from now on it's their lookup
+    # (it counts in recent_locations() and sync uploads it).
+
+    with _lock:
+        conn = _connect()
+        with conn:
+            conn.execute("UPDATE weather_history SET prefetch = 0 WHERE id = ? AND prefetch;", (int(row_id),))
 
 
 def fetch_history(limit: int = 25) -> list[dict]:
@@ -129,8 +503,10 @@ def fetch_history(limit: int = 25) -> list[dict]:
 
     limit = max(1, min(int(limit), 200))
 
-    conn = _connect()
-    try:
+    _wait_for_writes()
+
+    with _lock:
+        conn = _connect()
         rows = conn.execute(
             """
             SELECT created_utc, query_type, city, postal, country, units, lang,
@@ -143,33 +519,306 @@ def fetch_history(limit: int = 25) -> list[dict]:
         ).fetchall()
 
         return [dict(r) for r in rows]
-    finally:
-        conn.close()
 
 
 def search_history(q: str, limit: int = 25) -> list[dict]:
-    # Simple LIKE search on city/name/description.
+    # Substring search on city/name/description through the n-gram index.
+    # Ranked exact > prefix > substring match, newest first within each.
 
     limit = max(1, min(int(limit), 200))
-    needle = f"%{(q or '').strip().lower()}%"
 
-    conn = _connect()
-    try:
+    _wait_for_writes()
+
+    with _lock:
+        conn = _connect()
+
+        # Picks up rows written by other processes (or before the index existed).
+        with conn:
+            search_index.index_new_rows(conn)
+
+        ids = search_index.search(conn, q, limit)
+        if not ids:
+            return []
+
         rows = conn.execute(
-            """
-            SELECT created_utc, query_type, city, postal, country, units, lang,
+            f"""
+            SELECT id, created_utc, query_type, city, postal, country, units, lang,
                    name, description, temp, humidity, wind_speed
             FROM weather_history
-            WHERE
-                lower(coalesce(city, '')) LIKE ?
-                OR lower(coalesce(name, '')) LIKE ?
-                OR lower(coalesce(description, '')) LIKE ?
-            ORDER BY id DESC
+            WHERE id IN ({",".join("?" * len(ids))});
+            """,
+            ids,
+        ).fetchall()
+
+    by_id = {r["id"]: r for r in rows}
+    return [
+        {k: by_id[i][k] for k in by_id[i].keys() if k != "id"}
+        for i in ids
+        if i in by_id
+    ]
+
+
+# query_history() filters: keyword -> SQL condition.
+# Dates are ISO UTC strings, so they compare as text in created_utc order.
+HISTORY_FILTERS = {
+    "since": "created_utc >= ?",
+    "until": "created_utc < ?",
+    "country": "country = ?",
+    "query_type": "query_type = ?",
+    "lang": "lang = ?",
+    "temp_min": "temp >= ?",
+    "temp_max": "temp <= ?",
+    "humidity_min": "humidity >= ?",
+    "humidity_max": "humidity <= ?",
+    "wind_min": "wind_speed >= ?",
+    "wind_max": "wind_speed <= ?",
+}
+
+
+def _utc_iso(value) -> str:
+    # datetime (naive = UTC) or ISO string -> the created_utc text format.
+
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def _history_query(filters: dict, oldest_first: bool = False, after: str | None = None, limit: int = 25):
+    # Builds the SELECT for query_history(). Returns (sql, params).
+    # Sorted by (created_utc, id); `after` is the cursor of the previous page's
+    # last row, so the next page starts with an index seek, not an OFFSET.
+
+    where, params = [], []
+
+    for key, value in filters.items():
+        if value is None:
+            continue
+        if key not in HISTORY_FILTERS:
+            raise ValueError(f"unknown history filter: {key}")
+
+        if key in ("since", "until"):
+            value = _utc_iso(value)
+        elif key == "country":
+            value = value.strip().upper()
+
+        where.append(HISTORY_FILTERS[key])
+        params.append(value)
+
+    if after:
+        created, _, row_id = after.rpartition("|")
+        where.append(f"(created_utc, id) {'>' if oldest_first else '<'} (?, ?)")
+        params.extend([created, int(row_id)])
+
+    direction = "ASC" if oldest_first else "DESC"
+    sql = f"""
+        SELECT id, created_utc, query_type, city, postal, country, units, lang,
+               name, description, temp, humidity, wind_speed
+        FROM weather_history
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY created_utc {direction}, id {direction}
+        LIMIT ?;
+    """
+    params.append(limit)
+    return sql, params
+
+
+def query_history(
+    *,
+    oldest_first: bool = False,
+    after: str | None = None,
+    limit: int = 25,
+    **filters,
+) -> tuple[list[dict], str | None]:
+    # History rows matching every given filter (see HISTORY_FILTERS), newest first
+    # unless oldest_first. Returns (rows, cursor): pass the cursor back as `after`
+    # for the next page; it is None on the last page.
+
+    limit = max(1, min(int(limit), 200))
+
+    _wait_for_writes()
+
+    sql, params = _history_query(filters, oldest_first=oldest_first, after=after, limit=limit + 1)
+
+    with _lock:
+        rows = _connect().execute(sql, params).fetchall()
+
+    # One extra row tells whether another page exists.
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    cursor = f"{rows[-1]['created_utc']}|{rows[-1]['id']}" if more else None
+    return [{k: r[k] for k in r.keys() if k != "id"} for r in rows], cursor
+
+
+def recent_locations(limit: int = 5, days: int = 30) -> list[dict]:
+    # Locations looked up most often on this device in the last `days` days,
+    # most frequent first (ties: most recent first). Rows pulled in by sync are
+    # other devices' lookups, and unclaimed prefetches nobody's, so they don't count.
+    # Returns [{"query_type", "text", "country", "count"}], text as last typed.
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+
+    _wait_for_writes()
+
+    with _lock:
+        rows = _connect().execute(
+            """
+            SELECT query_type, coalesce(city, postal) AS text, country,
+                   count(*) AS count, max(created_utc) AS last_utc
+            FROM weather_history
+            WHERE created_utc >= ? AND central_id IS NULL AND NOT prefetch
+            GROUP BY loc_key
+            ORDER BY count DESC, last_utc DESC
             LIMIT ?;
             """,
-            (needle, needle, needle, limit),
+            (cutoff.isoformat(), max(1, int(limit))),
         ).fetchall()
 
-        return [dict(r) for r in rows]
-    finally:
-        conn.close()
+    return [{k: r[k] for k in ("query_type", "text", "country", "count")} for r in rows]
+
+
+# Columns of trend_columns(), in order. Missing values come back as +inf.
+TREND_COLUMNS = ("time", "temp", "humidity", "weather_id")
+
+
+def trend_columns(loc_key: str, since=None) -> array:
+    # One location's history as a flat array('d') of TREND_COLUMNS rows, oldest first
+    # (time = unix seconds). Read straight off the covering idx_wh_trends index and
+    # filled without per-row Python objects; np.frombuffer() can wrap it as-is.
+
+    _wait_for_writes()
+
+    sql = """
+        SELECT CAST(strftime('%s', created_utc) AS REAL),
+               IFNULL(temp, 9e999), IFNULL(humidity, 9e999), IFNULL(weather_id, 9e999)
+        FROM weather_history INDEXED BY idx_wh_trends
+        WHERE loc_key = ?
+    """
+    params = [loc_key]
+    if since is not None:
+        sql += " AND created_utc >= ?"
+        params.append(_utc_iso(since))
+
+    with _lock:
+        cur = _connect().execute(sql + " ORDER BY created_utc;", params)
+        return array("d", itertools.chain.from_iterable(cur))
+
+
+# Sync state
+
+_SYNC_COLUMNS = """
+    created_utc, query_type, city, postal, country, units, lang,
+    name, description, temp, humidity, wind_speed
+"""
+
+
+def _state(conn: sqlite3.Connection, key: str, default=None):
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?;", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_state(conn: sqlite3.Connection, key: str, value) -> None:
+    conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?);", (key, str(value)))
+
+
+def device_id() -> str:
+    # This installation's random id, created on first use.
+
+    with _lock:
+        conn = _connect()
+        value = _state(conn, "device_id")
+        if value is None:
+            value = uuid.uuid4().hex
+            with conn:
+                _set_state(conn, "device_id", value)
+        return value
+
+
+def sync_marks() -> tuple[int, int]:
+    # (last local id uploaded, last central id downloaded).
+
+    with _lock:
+        conn = _connect()
+        return int(_state(conn, "uploaded_id", 0)), int(_state(conn, "downloaded_id", 0))
+
+
+def unsynced_rows(limit: int = 500) -> list[dict]:
+    # The next rows to upload: logged here after the upload mark, oldest first.
+    # Skips rows pulled from the proxy or already logged by its /weather, and unclaimed prefetches.
+    # An id range on the primary key, so each batch costs O(batch).
+
+    _wait_for_writes()
+
+    with _lock:
+        conn = _connect()
+        after = int(_state(conn, "uploaded_id", 0))
+        rows = conn.execute(
+            f"""
+            SELECT id, {_SYNC_COLUMNS}, raw_json
+            FROM weather_history
+            WHERE id > ? AND central_id IS NULL AND NOT proxy_logged AND NOT prefetch
+            ORDER BY id
+            LIMIT ?;
+            """,
+            (after, limit),
+        ).fetchall()
+
+    out = []
+    for r in rows:
+        row = {k: r[k] for k in r.keys() if k != "raw_json"}
+        row["raw"] = json.loads(r["raw_json"]).get("data") if r["raw_json"] else None
+        out.append(row)
+    return out
+
+
+def mark_uploaded(last_id: int) -> None:
+    # Moves the upload mark once the proxy has stored everything up to last_id.
+
+    with _lock:
+        conn = _connect()
+        with conn:
+            _set_state(conn, "uploaded_id", max(int(last_id), int(_state(conn, "uploaded_id", 0))))
+
+
+def add_central_rows(items: list[dict], next_id: int) -> int:
+    # Stores rows pulled from the proxy and moves the download mark to next_id,
+    # in one transaction, so an interrupted download resumes where it stopped.
+    # Returns how many rows were new.
+
+    rows = []
+    for item in items:
+        raw = item.get("raw")
+        lang = (item.get("lang") or "en").strip().lower()
+        query_type = item["query_type"]
+
+        try:
+            weather_id = int(((raw or {}).get("weather") or [{}])[0].get("id"))
+        except (TypeError, ValueError, AttributeError):
+            weather_id = None
+
+        rows.append((
+            item["created_utc"], query_type, item.get("city"), item.get("postal"), item["country"],
+            item.get("units") or "metric", lang, item.get("name"), item.get("description"),
+            item.get("temp"), item.get("humidity"), item.get("wind_speed"),
+            json.dumps({"lang": lang, "data": raw}) if raw is not None else None,
+            location_key(query_type, item.get("city") or item.get("postal"), item["country"]),
+            weather_id, item["id"],
+        ))
+
+    with _lock:
+        conn = _connect()
+        with conn:
+            before = conn.total_changes
+            conn.executemany(
+                f"""
+                INSERT OR IGNORE INTO weather_history ({_SYNC_COLUMNS}, raw_json, loc_key, weather_id, central_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+                """,
+                rows,
+            )
+            added = conn.total_changes - before
+            _set_state(conn, "downloaded_id", max(int(next_id), int(_state(conn, "downloaded_id", 0))))
+
+    return added
@@ -0,0 +1,213 @@
+import re, heapq, sqlite3, unicodedata
+from pathlib import Path
+
+
+"""
+History Search Index
+
+An n-gram inverted index over the local history's searchable text
+(city, name and description), kept in a sidecar SQLite file next to the DB
+and ATTACHed to the history connection as "search".
+
+A history has few distinct texts ("London", "overcast clouds", "小雨"...)
+repeated over many rows, so the index works on distinct terms:
+
+    grams:    1/2/3-character gram -> term ids       (finds candidate terms)
+    postings: term id -> history row ids              (newest rows per term)
+
+Character n-grams need no word splitting, so Japanese descriptions and any
+substring match the same way. Results are ranked exact > prefix > substring
+match, newest first within each rank.
+
+The index is derived data: rows past its high-water mark are indexed on the
+next write or search, and a missing or stale sidecar is simply rebuilt.
+"""
+
+GRAM_SIZES = (1, 2, 3)
+
+# Rank classes, best first.
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text: str | None) -> str:
+    # NFKC + casefold + collapsed whitespace, so "ＬＯＮＤＯＮ " == "london".
+
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def grams(text: str) -> set[str]:
+    # Every 1-, 2- and 3-character substring of text.
+
+    return {text[i:i + n] for n in GRAM_SIZES for i in range(len(text) - n + 1)}
+
+
+def sidecar_path(db_path: Path) -> Path:
+    # weather_history.sqlite -> weather_history.search.sqlite
+
+    return db_path.with_name(db_path.stem + ".search.sqlite")
+
+
+def attach(conn: sqlite3.Connection, path: Path) -> None:
+    # Attaches (and if needed creates) the sidecar index as schema "search".
+    # An unreadable sidecar is deleted and rebuilt; it only holds derived data.
+
+    try:
+        _attach(conn, path)
+    except sqlite3.DatabaseError:
+        if any(r[1] == "search" for r in conn.execute("PRAGMA database_list;")):
+            conn.execute("DETACH DATABASE search;")
+        for suffix in ("", "-wal", "-shm"):
+            Path(str(path) + suffix).unlink(missing_ok=True)
+        _attach(conn, path)
+
+
+def _attach(conn: sqlite3.Connection, path: Path) -> None:
+    conn.execute("ATTACH DATABASE ? AS search;", (str(path),))
+    conn.execute("PRAGMA search.journal_mode=WAL;")
+
+    conn.execute("CREATE TABLE IF NOT EXISTS search.terms (id INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE);")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS search.grams (
+            gram TEXT NOT NULL,
+            term_id INTEGER NOT NULL,
+            PRIMARY KEY (gram, term_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS search.postings (
+            term_id INTEGER NOT NULL,
+            row_id INTEGER NOT NULL,
+            PRIMARY KEY (term_id, row_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS search.meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);")
+    conn.commit()
+
+
+def _high_water(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM search.meta WHERE key = 'last_row_id';").fetchone()
+    return row[0] if row else 0
+
+
+def _reset(conn: sqlite3.Connection) -> None:
+    for table in ("terms", "grams", "postings", "meta"):
+        conn.execute(f"DELETE FROM search.{table};")
+
+
+def index_new_rows(conn: sqlite3.Connection) -> int:
+    # Indexes history rows added since the last call. Returns how many.
+    # Runs inside the caller's transaction when there is one.
+
+    last = _high_water(conn)
+
+    # The history DB was replaced/shrunk under us: start over.
+    max_id = conn.execute("SELECT coalesce(max(id), 0) FROM main.weather_history;").fetchone()[0]
+    if last > max_id:
+        _reset(conn)
+        last = 0
+
+    if last == max_id:
+        return 0
+
+    rows = conn.execute(
+        "SELECT id, city, name, description FROM main.weather_history WHERE id > ? ORDER BY id;",
+        (last,),
+    ).fetchall()
+
+    term_ids = {}
+    postings = []
+
+    for row_id, *fields in rows:
+        for text in {normalize(f) for f in fields}:
+            if not text:
+                continue
+
+            term_id = term_ids.get(text)
+            if term_id is None:
+                term_id = _term_id(conn, text)
+                term_ids[text] = term_id
+
+            postings.append((term_id, row_id))
+
+    conn.executemany("INSERT OR IGNORE INTO search.postings (term_id, row_id) VALUES (?, ?);", postings)
+    conn.execute(
+        "INSERT OR REPLACE INTO search.meta (key, value) VALUES ('last_row_id', ?);",
+        (rows[-1][0],),
+    )
+    return len(rows)
+
+
+def _term_id(conn: sqlite3.Connection, text: str) -> int:
+    # Id of a distinct term, adding it (and its grams) the first time it's seen.
+
+    row = conn.execute("SELECT id FROM search.terms WHERE text = ?;", (text,)).fetchone()
+    if row:
+        return row[0]
+
+    term_id = conn.execute("INSERT INTO search.terms (text) VALUES (?);", (text,)).lastrowid
+    conn.executemany(
+        "INSERT OR IGNORE INTO search.grams (gram, term_id) VALUES (?, ?);",
+        [(g, term_id) for g in grams(text)],
+    )
+    return term_id
+
+
+def _rank(term: str, q: str) -> int:
+    if term == q:
+        return EXACT
+    if term.startswith(q) or any(word.startswith(q) for word in term.split(" ")):
+        return PREFIX
+    return SUBSTRING
+
+
+def search(conn: sqlite3.Connection, q: str, limit: int) -> list[int]:
+    # History row ids matching q, best first. Call index_new_rows() first.
+
+    q = normalize(q)
+    if not q:
+        return []
+
+    # Candidate terms: those containing every trigram of q (or q itself if it's short).
+    probes = {q} if len(q) <= max(GRAM_SIZES) else {q[i:i + 3] for i in range(len(q) - 2)}
+
+    candidates = None
+    for gram in probes:
+        ids = {r[0] for r in conn.execute("SELECT term_id FROM search.grams WHERE gram = ?;", (gram,))}
+        candidates = ids if candidates is None else candidates & ids
+        if not candidates:
+            return []
+
+    # Grams only say "maybe"; confirm the real substring and rank it.
+    by_rank = {EXACT: [], PREFIX: [], SUBSTRING: []}
+    for term_id in candidates:
+        term = conn.execute("SELECT text FROM search.terms WHERE id = ?;", (term_id,)).fetchone()[0]
+        if q in term:
+            by_rank[_rank(term, q)].append(term_id)
+
+    # Each term's newest `limit` rows (an index range scan), merged newest-first per rank.
+    results, seen = [], set()
+    for rank in (EXACT, PREFIX, SUBSTRING):
+        streams = [
+            [r[0] for r in conn.execute(
+                "SELECT row_id FROM search.postings WHERE term_id = ? ORDER BY row_id DESC LIMIT ?;",
+                (term_id, limit),
+            )]
+            for term_id in by_rank[rank]
+        ]
+
+        for row_id in heapq.merge(*streams, reverse=True):
+            if row_id in seen:
+                continue
+            seen.add(row_id)
+            results.append(row_id)
+            if len(results) >= limit:
+                return results
+
+    return results
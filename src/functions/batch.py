@@ -0,0 +1,191 @@
+import sys, csv, json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+"""
+Batch Lookups
+
+Fetches many locations at once, for scripts:
+
+    python -m src.main "London,gb" "22304,us" "Tokyo,Japan"
+    python -m src.main --file sites.txt --format csv
+    cat sites.txt | python -m src.main --file - --format json
+
+One location per line/argument: "<city or postal>,<country>".
+Text with a digit in it is treated as a postal code. The country may be a
+name, alpha-2 or alpha-3, and defaults to US when left out.
+
+Requests run concurrently on a bounded thread pool that shares the client's
+pooled session, so a batch takes about as long as its slowest lookup.
+Results are printed as they arrive, not in input order.
+
+main.py imports this module for its argument parser, so the country index and the
+HTTP client are only imported once a batch actually runs.
+"""
+
+FORMATS = ("table", "json", "csv")
+
+FIELDS = ("query", "country", "name", "temp", "humidity", "wind_speed", "description", "cached", "error")
+
+# Column widths for the table format.
+_WIDTHS = {"query": 20, "country": 7, "name": 20, "temp": 7, "humidity": 8,
+           "wind_speed": 6, "description": 24, "cached": 6, "error": 0}
+
+
+def read_locations(args: list[str], file=None) -> list[str]:
+    # Locations from argv plus an optional open file (or stdin), blanks and #comments skipped.
+
+    lines = list(args or [])
+    if file is not None:
+        lines.extend(file)
+
+    out = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            out.append(line)
+    return out
+
+
+def parse_location(line: str) -> tuple[str, str, str]:
+    # "London,gb" -> ("city", "London", "gb")
+    # "22304,us"  -> ("postal", "22304", "us")
+    # "Portland,OR,us" -> ("city", "Portland,OR", "us")
+
+    text, sep, country = line.rpartition(",")
+    if not sep:
+        text, country = line, "US"
+
+    text, country = text.strip(), country.strip()
+    query_type = "postal" if any(ch.isdigit() for ch in text) else "city"
+    return query_type, text, country
+
+
+def resolve_locations(parsed) -> tuple[list, list]:
+    # Swaps each location's country for its alpha-2 code.
+    # Each distinct country spelling is resolved once (fuzzy matches cost the most).
+    # Returns (resolved, unknown): resolved holds (query_type, text, alpha-2),
+    # unknown the parsed tuples whose country didn't resolve.
+
+    from src.data.country_codes import resolve_country
+
+    codes = {}
+    resolved, unknown = [], []
+
+    for query_type, text, raw_country in parsed:
+        if raw_country not in codes:
+            best, _ = resolve_country(raw_country, allow_fuzzy=True)
+            codes[raw_country] = best.alpha_2 if best else None
+
+        if codes[raw_country] is None:
+            unknown.append((query_type, text, raw_country))
+        else:
+            resolved.append((query_type, text, codes[raw_country]))
+
+    return resolved, unknown
+
+
+def _lookup(query_type: str, text: str, country: str, lang: str, offline: bool, units: str = "metric") -> dict:
+    # One row of output. Errors are reported in the row, never raised.
+
+    import requests
+    from src.functions.get_weather import fetch_weather
+
+    row = {"query": text, "country": country}
+
+    try:
+        data = fetch_weather(query_type, text, country, lang=lang, offline=offline, units=units)
+    except requests.exceptions.HTTPError as err:
+        status = getattr(err.response, "status_code", None)
+        row["error"] = f"HTTP {status}" if status else str(err)
+        return row
+    except (requests.exceptions.RequestException, LookupError, ValueError) as err:
+        row["error"] = str(err)
+        return row
+
+    main = data.get("main") or {}
+    row.update(
+        name=data.get("name"),
+        temp=main.get("temp"),
+        humidity=main.get("humidity"),
+        wind_speed=(data.get("wind") or {}).get("speed"),
+        description=data.get("description"),
+        cached=data.get("cached"),
+    )
+    return row
+
+
+class _Writer:
+    # Prints rows one at a time in the chosen format.
+
+    def __init__(self, fmt: str, out):
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {FORMATS}, got {fmt!r}")
+
+        self.fmt = fmt
+        self.out = out
+        self._csv = csv.DictWriter(out, fieldnames=FIELDS, extrasaction="ignore") if fmt == "csv" else None
+
+    def header(self) -> None:
+        if self.fmt == "csv":
+            self._csv.writeheader()
+        elif self.fmt == "table":
+            self.out.write(self._table_line({f: f for f in FIELDS}) + "\n")
+
+    def row(self, row: dict) -> None:
+        if self.fmt == "json":
+            self.out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        elif self.fmt == "csv":
+            self._csv.writerow(row)
+        else:
+            self.out.write(self._table_line(row) + "\n")
+
+        # Rows show up as they arrive, even through a pipe.
+        self.out.flush()
+
+    @staticmethod
+    def _table_line(row: dict) -> str:
+        cells = []
+        for field in FIELDS:
+            value = row.get(field)
+            value = "" if value is None else str(value)
+            width = _WIDTHS[field]
+            cells.append(value[:width].ljust(width) if width else value)
+        return " ".join(cells).rstrip()
+
+
+def run_batch(
+    locations: list[str],
+    fmt: str = "table",
+    lang: str = "en",
+    workers: int = 16,
+    offline: bool = False,
+    out=None,
+    units: str = "metric",
+) -> int:
+    # Fetches every location concurrently and prints each row as it completes.
+    # Returns the number of failed lookups (0 = all good).
+
+    out = out or sys.stdout
+    writer = _Writer(fmt, out)
+
+    resolved, unknown = resolve_locations(parse_location(line) for line in locations)
+
+    writer.header()
+    failures = len(unknown)
+
+    for _, text, raw_country in unknown:
+        writer.row({"query": text, "country": raw_country, "error": "unknown country"})
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(resolved) or 1))) as pool:
+        futures = [
+            pool.submit(_lookup, query_type, text, alpha2, lang, offline, units)
+            for query_type, text, alpha2 in resolved
+        ]
+
+        for fut in as_completed(futures):
+            row = fut.result()
+            failures += bool(row.get("error"))
+            writer.row(row)
+
+    return failures
@@ -1,6 +1,11 @@
-import os, requests
+import os, sqlite3, threading, requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from src.data.i18n import TEXT, jp_description_from_weather
-from src.data.local_history import init_db, log_weather, fetch_history, search_history
+from src.functions.units import UNITS, LABELS, convert
+from src.data.local_history import (
+    init_db, log_weather, fetch_cached, claim_prefetched, fetch_history, search_history, query_history, device_id,
+)
 
 
 def _t(lang: str, key: str, default: str) -> str:
@@ -28,11 +33,102 @@ def _get_proxy_url() -> str:
     return proxy_url if proxy_url else DEFAULT_PROXY_URL
 
 
+def _get_proxy_base_url() -> str:
+    # https://host/weather -> https://host
+
+    url = _get_proxy_url().rstrip("/")
+    return url[: -len("/weather")] if url.endswith("/weather") else url
+
+
+# (connect, read) timeouts in seconds.
+# Connecting should be quick; reading can be slow while a sleeping proxy host wakes up.
+PROXY_TIMEOUT = (
+    float(os.getenv("WEATHER_CONNECT_TIMEOUT", "10")),
+    float(os.getenv("WEATHER_READ_TIMEOUT", "120")),
+)
+
+# A lookup repeated within this many seconds is served from local history.
+# OpenWeather refreshes current conditions about every 10 minutes. 0 disables it.
+WEATHER_CACHE_TTL_SEC = float(os.getenv("WEATHER_CACHE_TTL_SEC", "600"))
+
+# Longest Retry-After (seconds) we'll wait out before giving up on a 429.
+MAX_RETRY_AFTER_SEC = 60
+
+# One pooled session per process, so repeated lookups reuse a warm keep-alive connection.
+_session = None
+_session_lock = threading.Lock()
+
+
+class _ProxyRetry(Retry):
+    # Retries connection errors and 502/503/504 with backoff.
+    # A 429 is only retried when the proxy says when (Retry-After), and only if that's soon;
+    # the daily limit sends no Retry-After, so it fails straight away.
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429 and not has_retry_after:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_retry_after(self, response):
+        seconds = super().get_retry_after(response)
+        return None if seconds is None else min(seconds, MAX_RETRY_AFTER_SEC)
+
+
+def _get_session() -> requests.Session:
+    # Builds the shared session on first use (thread-safe).
+
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            retry = _ProxyRetry(
+                total=3,
+                connect=3,
+                read=1,
+                status=2,
+                backoff_factor=0.5,
+                status_forcelist=(429, 502, 503, 504),
+                allowed_methods=frozenset({"GET"}),
+                respect_retry_after_header=True,
+                # Hand the last response back so the callers' status handling still runs.
+                raise_on_status=False,
+            )
+
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+
+    return _session
+
+
 def _get_proxy_headers() -> dict:
-    # Optional Bearer token for proxy auth.
+    # Optional Bearer token for proxy auth, plus this device's id so the proxy
+    # knows which of its rows we already have locally (see src/functions/sync.py).
 
     token = os.getenv("WEATHER_PROXY_TOKEN", "").strip()
-    return {"Authorization": f"Bearer {token}"} if token else {}
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    try:
+        headers["X-Device-Id"] = device_id()
+    except sqlite3.Error:
+        pass
+
+    return headers
+
+
+def warm_up_proxy() -> bool:
+    # Cheap GET of the proxy root, sent while the user is still at a prompt:
+    # a sleeping proxy host starts waking up, and the pooled connection is
+    # already open (TLS done) when the first real lookup goes out.
+    # Returns whether the proxy answered; errors are left for that lookup to report.
+
+    try:
+        return _get_session().get(_get_proxy_base_url() + "/", timeout=PROXY_TIMEOUT).ok
+    except requests.exceptions.RequestException:
+        return False
 
 
 def _normalize_lang(lang: str) -> str:
@@ -43,9 +139,17 @@ def _normalize_lang(lang: str) -> str:
     return lang if lang in ("en", "ja") else "en"
 
 
+def _normalize_units(units: str) -> str:
+    # Display units (see units.py). Everything else falls back to metric.
+
+    units = (units or "metric").strip().lower()
+    return units if units in UNITS else "metric"
+
+
 def _extract_description(weather_data: dict, lang: str) -> str | None:
     # Grabs a description from the API response.
     # If lang=ja, we prefer our ID->JP map so it's consistent.
+    # (The proxy renders it from the same map; this covers older proxies and saved rows.)
 
     weather0 = (weather_data.get("weather") or [{}])[0] or {}
     desc = weather0.get("description")
@@ -57,14 +161,55 @@ def _extract_description(weather_data: dict, lang: str) -> str | None:
     return desc
 
 
-def get_weather_by_city_name(city_name, country_code, lang: str = "en"):
+def _cached_weather(query_type: str, text, country_code, lang: str, offline: bool, prefetch: bool = False) -> dict | None:
+    # Local history row to serve instead of calling the proxy.
+    # Online: only if it's younger than WEATHER_CACHE_TTL_SEC. Offline: the newest, any age.
+    # Serving a prefetched row to the user makes it their lookup (claim_prefetched()).
+
+    if not offline and WEATHER_CACHE_TTL_SEC <= 0:
+        return None
+
+    cached = fetch_cached(
+        query_type,
+        (text or "").strip(),
+        (country_code or "").strip().upper() or "US",
+        units="metric",
+        lang=lang,
+        max_age_sec=None if offline else WEATHER_CACHE_TTL_SEC,
+    )
+    if cached is not None and cached["prefetch"] and not prefetch:
+        claim_prefetched(cached["id"])
+
+    return cached
+
+
+def _format_age(seconds: float) -> str:
+    # 42 -> "42s", 600 -> "10m", 7200 -> "2h"
+
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    return f"{seconds // 3600}h"
+
+
+def get_weather_by_city_name(city_name, country_code, lang: str = "en", offline: bool = False, units: str = "metric"):
     # Gets weather from the proxy by city name.
     # Also logs the result locally so history/search work even if the proxy goes down later.
+    # A recent identical lookup (or any saved one when offline) is served from local history.
+    # Returns the observation dict with "cached": True/False, or None on failure.
 
     init_db()
 
     BASE_URL = _get_proxy_url()
     lang = _normalize_lang(lang)
+    units = _normalize_units(units)
+
+    cached = _cached_weather("city", city_name, country_code, lang, offline)
+    if cached is None and offline:
+        print(f"{_t(lang, 'offline_miss', 'No saved weather for this location (offline mode)')}: {city_name}")
+        return None
 
     params = {
         "city": city_name,
@@ -76,39 +221,53 @@ def get_weather_by_city_name(city_name, country_code, lang: str = "en"):
     headers = _get_proxy_headers()
 
     try:
-        response = requests.get(BASE_URL, params=params, headers=headers, timeout=120)
-        response.raise_for_status()
+        if cached is not None:
+            weather_data = cached["data"]
+        else:
+            response = _get_session().get(BASE_URL, params=params, headers=headers, timeout=PROXY_TIMEOUT)
+            response.raise_for_status()
 
-        weather_data = response.json()
+            weather_data = response.json()
+
+        # Proxy and local history are metric; only what's shown is converted.
+        shown = convert(weather_data, units)
+        temp_unit, speed_unit = LABELS[units]
 
-        main_data = weather_data.get("main", {}) or {}
+        main_data = shown.get("main", {}) or {}
         area_name = weather_data.get("name")
         temperature = main_data.get("temp")
         humidity = main_data.get("humidity")
-        wind_speed = (weather_data.get("wind") or {}).get("speed")
+        wind_speed = (shown.get("wind") or {}).get("speed")
         description = _extract_description(weather_data, lang)
 
-        # Store the exact description we displayed (JP-mapped if needed).
-        log_weather(
-            query_type="city",
-            city=(city_name or "").strip() or None,
-            postal=None,
-            country=(country_code or "").strip().upper() or "US",
-            units="metric",
-            lang=lang,
-            description_override=description,
-            data=weather_data,
-        )
+        if cached is None:
+            # Store the exact description we displayed (JP-mapped if needed).
+            log_weather(
+                query_type="city",
+                city=(city_name or "").strip() or None,
+                postal=None,
+                country=(country_code or "").strip().upper() or "US",
+                units="metric",
+                lang=lang,
+                description_override=description,
+                data=weather_data,
+                # The proxy keeps its own copy, so sync skips it.
+                proxy_logged=True,
+            )
 
         if temperature is not None and description is not None:
             print(f"\n{_t(lang, 'weather_in', 'Weather in')} {area_name}:")
-            print(f"    {_t(lang, 'temp_label', 'Temperature')}: {temperature}°C")
+            print(f"    {_t(lang, 'temp_label', 'Temperature')}: {temperature}{temp_unit}")
             print(f"    {_t(lang, 'humidity_label', 'Humidity')}: {humidity}%")
-            print(f"    {_t(lang, 'wind_label', 'Wind Speed')}: {wind_speed} m/s")
+            print(f"    {_t(lang, 'wind_label', 'Wind Speed')}: {wind_speed} {speed_unit}")
             print(f"    {_t(lang, 'desc_label', 'Description')}: {description.capitalize() if isinstance(description, str) else description}")
+            if cached is not None:
+                print(f"    ({_t(lang, 'cached_note', 'cached')}, {_format_age(cached['age_sec'])})")
         else:
             print(f"{_t(lang, 'incomplete_city', 'Could not retrieve complete weather data for')} {city_name}")
 
+        return dict(shown, cached=cached is not None)
+
     except requests.exceptions.HTTPError as http_err:
         if response.status_code == 404:
             print(f"{_t(lang, 'city_not_found', 'Error: City not found')}: '{city_name}'.")
@@ -122,14 +281,21 @@ def get_weather_by_city_name(city_name, country_code, lang: str = "en"):
         print(f"{_t(lang, 'request_error', 'An error occurred during the API request')}: {req_err}")
 
 
-def get_weather_by_postal_code(postal_code, country_code="us", lang: str = "en"):
+def get_weather_by_postal_code(postal_code, country_code="us", lang: str = "en", offline: bool = False, units: str = "metric"):
     # Gets weather from the proxy by postal code.
     # Also logs the result locally for history/search.
+    # Served from local history like get_weather_by_city_name.
 
     init_db()
 
     BASE_URL = _get_proxy_url()
     lang = _normalize_lang(lang)
+    units = _normalize_units(units)
+
+    cached = _cached_weather("postal", postal_code, country_code, lang, offline)
+    if cached is None and offline:
+        print(f"{_t(lang, 'offline_miss', 'No saved weather for this location (offline mode)')}: {postal_code}, {country_code.upper()}")
+        return None
 
     params = {
         "postal": postal_code,
@@ -141,39 +307,53 @@ def get_weather_by_postal_code(postal_code, country_code="us", lang: str = "en")
     headers = _get_proxy_headers()
 
     try:
-        response = requests.get(BASE_URL, params=params, headers=headers, timeout=120)
-        response.raise_for_status()
+        if cached is not None:
+            weather_data = cached["data"]
+        else:
+            response = _get_session().get(BASE_URL, params=params, headers=headers, timeout=PROXY_TIMEOUT)
+            response.raise_for_status()
 
-        weather_data = response.json()
+            weather_data = response.json()
+
+        # Proxy and local history are metric; only what's shown is converted.
+        shown = convert(weather_data, units)
+        temp_unit, speed_unit = LABELS[units]
 
-        main_data = weather_data.get("main", {}) or {}
+        main_data = shown.get("main", {}) or {}
         area_name = weather_data.get("name")
         temperature = main_data.get("temp")
         humidity = main_data.get("humidity")
-        wind_speed = (weather_data.get("wind") or {}).get("speed")
+        wind_speed = (shown.get("wind") or {}).get("speed")
         description = _extract_description(weather_data, lang)
 
-        # Store the exact description we displayed (JP-mapped if needed).
-        log_weather(
-            query_type="postal",
-            city=None,
-            postal=(postal_code or "").strip() or None,
-            country=(country_code or "").strip().upper() or "US",
-            units="metric",
-            lang=lang,
-            description_override=description,
-            data=weather_data,
-        )
+        if cached is None:
+            # Store the exact description we displayed (JP-mapped if needed).
+            log_weather(
+                query_type="postal",
+                city=None,
+                postal=(postal_code or "").strip() or None,
+                country=(country_code or "").strip().upper() or "US",
+                units="metric",
+                lang=lang,
+                description_override=description,
+                data=weather_data,
+                # The proxy keeps its own copy, so sync skips it.
+                proxy_logged=True,
+            )
 
         if temperature is not None and description is not None:
             print(f"\n\n{_t(lang, 'weather_in', 'Weather in')} {area_name} ({postal_code}, {country_code.upper()}):")
-            print(f"    {_t(lang, 'temp_label', 'Temperature')}: {temperature}°C")
+            print(f"    {_t(lang, 'temp_label', 'Temperature')}: {temperature}{temp_unit}")
             print(f"    {_t(lang, 'humidity_label', 'Humidity')}: {humidity}%")
-            print(f"    {_t(lang, 'wind_label', 'Wind Speed')}: {wind_speed} m/s")
+            print(f"    {_t(lang, 'wind_label', 'Wind Speed')}: {wind_speed} {speed_unit}")
             print(f"    {_t(lang, 'desc_label', 'Description')}: {description.capitalize() if isinstance(description, str) else description}")
+            if cached is not None:
+                print(f"    ({_t(lang, 'cached_note', 'cached')}, {_format_age(cached['age_sec'])})")
         else:
             print(f"{_t(lang, 'incomplete_postal', 'Incomplete weather data retrieved for')}: {postal_code}, {country_code.upper()}")
 
+        return dict(shown, cached=cached is not None)
+
     except requests.exceptions.HTTPError as http_err:
         if response.status_code == 404:
             print(f"{_t(lang, 'postal_not_found', 'Error: Postal code not found')}: '{postal_code}, {country_code.upper()}'.")
@@ -187,6 +367,82 @@ def get_weather_by_postal_code(postal_code, country_code="us", lang: str = "en")
         print(f"{_t(lang, 'request_error', 'An error occurred during the API request')}: {req_err}")
 
 
+def fetch_weather(
+    query_type: str,
+    text: str,
+    country_code: str,
+    lang: str = "en",
+    offline: bool = False,
+    etag: str | None = None,
+    units: str = "metric",
+    prefetch: bool = False,
+) -> dict | None:
+    # Quiet version of get_weather_by_* for scripts (batch/watch): prints nothing,
+    # raises instead. Same local-history cache and logging.
+    # Returns the observation dict with "cached": True/False, "description" (display
+    # text) and "etag" (proxy validator, None when cached).
+    # With etag: skips the local cache and asks the proxy conditionally;
+    # returns None if the observation hasn't changed (304).
+    # Raises LookupError offline with nothing saved; requests exceptions otherwise.
+    # units only changes the returned numbers: the proxy call and the cache stay metric.
+    # prefetch: a background refresh (see recent.py). The proxy is told not to log it,
+    # and the local row only fills the cache until the user asks for it.
+
+    init_db()
+
+    lang = _normalize_lang(lang)
+    units = _normalize_units(units)
+    country = (country_code or "").strip().upper() or "US"
+    text = (text or "").strip()
+
+    cached = None if etag else _cached_weather(query_type, text, country, lang, offline, prefetch=prefetch)
+
+    if cached is not None:
+        weather_data = cached["data"]
+    elif offline:
+        raise LookupError(f"No saved weather for {text}, {country}")
+    else:
+        params = {
+            "city" if query_type == "city" else "postal": text,
+            "country": country.lower(),
+            "units": "metric",
+            "lang": lang,
+        }
+
+        headers = _get_proxy_headers()
+        if etag:
+            headers["If-None-Match"] = etag
+        if prefetch:
+            headers["Purpose"] = "prefetch"
+
+        response = _get_session().get(_get_proxy_url(), params=params, headers=headers, timeout=PROXY_TIMEOUT)
+        if etag and response.status_code == 304:
+            return None
+
+        response.raise_for_status()
+        weather_data = response.json()
+
+        log_weather(
+            query_type=query_type,
+            city=text if query_type == "city" else None,
+            postal=text if query_type == "postal" else None,
+            country=country,
+            units="metric",
+            lang=lang,
+            description_override=_extract_description(weather_data, lang),
+            data=weather_data,
+            proxy_logged=not prefetch,
+            prefetch=prefetch,
+        )
+
+    return dict(
+        convert(weather_data, units),
+        cached=cached is not None,
+        description=_extract_description(weather_data, lang),
+        etag=None if cached is not None else response.headers.get("ETag"),
+    )
+
+
 def get_local_history(limit: int = 25) -> dict:
     # Local history (SQLite in LocalAppData).
     # No network call needed.
@@ -201,3 +457,12 @@ def search_local_history(q: str, limit: int = 25) -> dict:
 
     init_db()
     return {"items": search_history(q=q, limit=limit)}
+
+
+def query_local_history(oldest_first: bool = False, after: str | None = None, limit: int = 25, **filters) -> dict:
+    # Filtered, paginated local history (SQLite in LocalAppData).
+    # No network call needed. "next" is the cursor for the following page (None on the last).
+
+    init_db()
+    items, cursor = query_history(oldest_first=oldest_first, after=after, limit=limit, **filters)
+    return {"items": items, "next": cursor}
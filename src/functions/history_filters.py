@@ -0,0 +1,86 @@
+import re
+from datetime import date, datetime, timedelta
+from src.functions.units import convert_temp, convert_speed
+
+
+"""
+History Filters
+
+Parses the filter line typed at the history menu's [f]ilter prompt into
+query_history() keywords:
+
+    country=jp type=city since=2026-01-01 temp>=20 humidity<=60
+    lang=ja until=2026-03-31 wind>=8 sort=oldest
+
+Dates are UTC; a bare date in `until` includes that whole day.
+Measurements take >=, <= or = (ex: humidity=100), in the units shown
+(--units imperial: temp>=70 is °F); history itself is stored in metric.
+"""
+
+_TERM = re.compile(r"(\w+)\s*(>=|<=|=)\s*(\S+)")
+
+# Measurement name -> (min keyword, max keyword)
+_RANGES = {
+    "temp": ("temp_min", "temp_max"),
+    "humidity": ("humidity_min", "humidity_max"),
+    "wind": ("wind_min", "wind_max"),
+}
+
+_EQUALS = {"country": "country", "type": "query_type", "lang": "lang"}
+
+
+def _parse_date(value: str, end: bool = False) -> datetime:
+    # "2026-01-01" or a full ISO timestamp. A bare end date means "through that day".
+
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", value):
+        day = date.fromisoformat(value) + timedelta(days=1 if end else 0)
+        return datetime(day.year, day.month, day.day)
+    return datetime.fromisoformat(value)
+
+
+def parse_filters(text: str, units: str = "metric") -> tuple[dict, bool]:
+    # "country=jp temp>=20 sort=oldest" -> ({"country": "jp", "temp_min": 20.0}, True)
+    # temp and wind are read in `units` and returned in metric, like the rows.
+    # Raises ValueError on anything it can't read.
+
+    leftover = _TERM.sub("", text).strip()
+    if leftover:
+        raise ValueError(f"can't read filter: {leftover!r}")
+
+    filters, oldest_first = {}, False
+
+    for name, op, value in _TERM.findall(text):
+        name = name.lower()
+
+        if name in _RANGES:
+            low, high = _RANGES[name]
+            number = float(value)
+            if name == "temp":
+                number = convert_temp(number, units, to_canonical=True)
+            elif name == "wind":
+                number = convert_speed(number, units, to_canonical=True)
+            if op in (">=", "="):
+                filters[low] = number
+            if op in ("<=", "="):
+                filters[high] = number
+
+        elif op != "=":
+            raise ValueError(f"{name} only takes '='")
+
+        elif name in _EQUALS:
+            if name == "type" and value not in ("city", "postal"):
+                raise ValueError("type must be 'city' or 'postal'")
+            filters[_EQUALS[name]] = value
+
+        elif name in ("since", "until"):
+            filters[name] = _parse_date(value, end=name == "until")
+
+        elif name == "sort":
+            if value not in ("newest", "oldest"):
+                raise ValueError("sort must be 'newest' or 'oldest'")
+            oldest_first = value == "oldest"
+
+        else:
+            raise ValueError(f"unknown filter: {name}")
+
+    return filters, oldest_first
@@ -0,0 +1,76 @@
+import threading
+from concurrent.futures import Future
+from src.data.local_history import recent_locations
+
+
+"""
+Recent Locations
+
+The interactive CLI spends most of its time waiting at input() prompts. While
+it waits, the user's most frequent recent locations (local history) are
+refreshed in the background and offered as a numbered quick pick:
+
+    Recent locations:
+      1) London, GB
+      2) 22304, US
+
+A refresh goes through fetch_weather(), so it lands in the local-history cache
+and picking that location is answered from there, without a proxy round trip.
+Locations still fresh in the cache aren't fetched again. Refreshes are marked
+as prefetches: neither the proxy's history nor the ranking counts them, and
+sync doesn't upload them, unless the user actually picks that location.
+"""
+
+# How many locations the quick pick offers (and refreshes).
+RECENT_LOCATIONS = 5
+
+# Only lookups from the last this-many days count towards "frequent".
+RECENT_DAYS = 30
+
+
+def _refresh(future: Future, location: dict, lang: str) -> None:
+    import requests
+    from src.functions.get_weather import fetch_weather
+
+    try:
+        fetch_weather(location["query_type"], location["text"], location["country"], lang=lang, prefetch=True)
+        future.set_result(True)
+    except (requests.exceptions.RequestException, LookupError, ValueError):
+        # The pick falls back to a normal lookup, which reports the error.
+        future.set_result(False)
+
+
+def prefetch(locations: list[dict], lang: str = "en") -> list[Future]:
+    # Starts refreshing each location on its own daemon thread (a slow proxy never
+    # holds up exit). Returns one Future per location, in order: True once it's cached.
+
+    futures = []
+    for location in locations:
+        future = Future()
+        threading.Thread(target=_refresh, args=(future, location, lang), name="prefetch", daemon=True).start()
+        futures.append(future)
+    return futures
+
+
+def load_recent(lang: str = "en", offline: bool = False) -> tuple[list[dict], list[Future]]:
+    # The quick-pick locations, and their refreshes (none offline).
+
+    locations = recent_locations(limit=RECENT_LOCATIONS, days=RECENT_DAYS)
+    return locations, [] if offline else prefetch(locations, lang)
+
+
+def format_recent(locations: list[dict]) -> list[str]:
+    # ["  1) London, GB", "  2) 22304, US"]
+
+    return [f"  {i}) {loc['text']}, {loc['country']}" for i, loc in enumerate(locations, start=1)]
+
+
+def pick(locations: list[dict], answer: str) -> dict | None:
+    # The location numbered `answer`, or None (blank, not a number, out of range).
+
+    answer = (answer or "").strip()
+    if not answer.isdecimal():
+        return None
+
+    i = int(answer)
+    return locations[i - 1] if 1 <= i <= len(locations) else None
@@ -0,0 +1,128 @@
+import sys, gzip, json, requests
+from src.data import local_history
+from src.functions import wire
+from src.functions.get_weather import PROXY_TIMEOUT, _get_proxy_base_url, _get_proxy_headers, _get_session
+
+
+"""
+History Sync
+
+Sends this device's local history to the proxy DB and pulls down what other
+devices logged (see proxy/history_sync.py):
+
+    python -m src.main --sync
+
+Upload: rows past the upload mark go out as gzip NDJSON batches; the mark
+moves after each batch the proxy accepts. Download: central rows past the
+download mark are stored with the mark in one local transaction. Either way
+an interrupted sync resumes at the last finished batch, and the proxy ignores
+rows it already has, so a resent batch never duplicates anything.
+
+With `msgpack` installed (and a proxy that offers it), batches travel as
+MessagePack instead, and pages come down in the columnar layout (see wire.py).
+"""
+
+SYNC_BATCH_ROWS = 500
+
+# Past any real id: a probe that reads no rows.
+_PROBE_AFTER = 2 ** 62
+
+
+def speaks_msgpack(session, base: str) -> bool:
+    # Whether the proxy answers in MessagePack. An older one would take a
+    # MessagePack upload for (bad) NDJSON, so uploads only switch after this.
+
+    if not wire.available():
+        return False
+
+    response = session.get(
+        f"{base}/history/since",
+        params={"after": _PROBE_AFTER, "limit": 1},
+        headers=dict(_get_proxy_headers(), Accept=wire.MSGPACK),
+        timeout=PROXY_TIMEOUT,
+    )
+    response.raise_for_status()
+    return wire.is_msgpack(response.headers.get("content-type"))
+
+
+def upload(session, base: str, device: str, batch_rows: int = SYNC_BATCH_ROWS) -> int:
+    # Uploads every unsynced row. Returns how many were sent.
+
+    sent = 0
+    binary = None
+    while True:
+        rows = local_history.unsynced_rows(limit=batch_rows)
+        if not rows:
+            return sent
+
+        if binary is None:
+            binary = speaks_msgpack(session, base)
+
+        if binary:
+            body, content_type = wire.pack({"items": rows}), wire.MSGPACK
+        else:
+            body = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in rows)
+            body, content_type = body.encode("utf-8"), "application/x-ndjson"
+
+        headers = dict(_get_proxy_headers(), **{"Content-Type": content_type, "Content-Encoding": "gzip"})
+
+        response = session.post(
+            f"{base}/history/sync",
+            params={"device_id": device},
+            data=gzip.compress(body),
+            headers=headers,
+            timeout=PROXY_TIMEOUT,
+        )
+        response.raise_for_status()
+
+        local_history.mark_uploaded(rows[-1]["id"])
+        sent += len(rows)
+
+
+def download(session, base: str, device: str, batch_rows: int = SYNC_BATCH_ROWS) -> int:
+    # Pulls every central row past the download mark. Returns how many were new here.
+    # (requests asks for gzip and decompresses the pages itself.)
+
+    added = 0
+    _, after = local_history.sync_marks()
+
+    params, headers = {"limit": batch_rows, "device_id": device}, _get_proxy_headers()
+    if wire.available():
+        # A proxy without MessagePack answers in JSON rows, which decode() reads too.
+        params["layout"] = "columns"
+        headers = dict(headers, Accept=f"{wire.MSGPACK}, {wire.JSON};q=0.5")
+
+    while True:
+        response = session.get(
+            f"{base}/history/since",
+            params=dict(params, after=after),
+            headers=headers,
+            timeout=PROXY_TIMEOUT,
+        )
+        response.raise_for_status()
+        page = wire.decode(response.content, response.headers.get("content-type"))
+
+        if page["next"] <= after:
+            return added
+
+        added += local_history.add_central_rows(page["items"], page["next"])
+        after = page["next"]
+
+
+def run_sync(out=None) -> int:
+    # Both directions, with a one-line summary. Returns 0 on success, 1 on failure.
+
+    out = out or sys.stdout
+    local_history.init_db()
+
+    session, base, device = _get_session(), _get_proxy_base_url(), local_history.device_id()
+
+    try:
+        sent = upload(session, base, device)
+        added = download(session, base, device)
+    except (requests.exceptions.RequestException, ValueError) as err:
+        out.write(f"Sync stopped: {err} (it resumes from here next time)\n")
+        return 1
+
+    out.write(f"Synced: {sent} rows sent, {added} rows received.\n")
+    return 0
@@ -0,0 +1,218 @@
+import sys, math, bisect, itertools
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from src.data.local_history import TREND_COLUMNS, init_db, location_key, trend_columns
+from src.data.i18n import JP_WEATHER_ID
+from src.functions.batch import parse_location, resolve_locations
+from src.functions.units import LABELS, convert_temp
+
+try:
+    import numpy as np
+except ImportError:     # optional: the array-module path below gives the same numbers
+    np = None
+
+
+"""
+History Trends
+
+Per-location statistics over local history:
+
+    python -m src.main --trends "Tokyo,jp" --days 30
+
+- daily min / max / mean temperature (UTC days) and its moving average
+- humidity distribution in 10% buckets
+- most frequent conditions, grouped like JP_WEATHER_ID (rain, snow, clouds...)
+
+Columns are read in one pass into a flat array('d') (see trend_columns()) and
+aggregated column-wise: with NumPy when it's installed, otherwise with slices
+of the array and C-level builtins (min, max, sum, Counter). Neither walks the
+rows as Python dicts, so multi-million-row histories stay interactive.
+"""
+
+# Moving average window, in days with observations.
+MOVING_AVG_DAYS = 7
+
+HUMIDITY_BUCKETS = 10   # 0-9%, 10-19% ... 90-100%
+
+# Condition groups, following OpenWeather's id ranges (JP_WEATHER_ID's sections).
+# (first id, name, Japanese name); a group runs up to the next one's first id.
+CONDITION_GROUPS = (
+    (200, "thunderstorm", "雷雨"),
+    (300, "drizzle", "霧雨"),
+    (500, "rain", "雨"),
+    (600, "snow", "雪"),
+    (700, "atmosphere", "霧・もや"),
+    (800, "clear", "快晴"),
+    (801, "clouds", "くもり"),
+)
+_GROUP_STARTS = [g[0] for g in CONDITION_GROUPS]
+
+_DAY = 86400
+
+
+def _group(weather_id: int) -> int | None:
+    # Index into CONDITION_GROUPS, or None for ids outside every range.
+
+    i = bisect.bisect_right(_GROUP_STARTS, weather_id) - 1
+    return i if 0 <= i and weather_id < 900 else None
+
+
+def _date(day: int) -> str:
+    return (datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(days=int(day))).date().isoformat()
+
+
+def _moving_average(values: list[float], window: int) -> list[float | None]:
+    # Trailing mean over `window` values (None until there are enough).
+
+    sums = [0.0, *itertools.accumulate(values)]
+    return [
+        (sums[i + 1] - sums[i + 1 - window]) / window if i + 1 >= window else None
+        for i in range(len(values))
+    ]
+
+
+def _columns_numpy(buf):
+    cols = np.frombuffer(buf, dtype=np.float64).reshape(-1, len(TREND_COLUMNS)).T
+    time_, temp, humidity, weather_id = cols
+
+    daily = []
+    valid = np.isfinite(temp)
+    if valid.any():
+        days = (time_[valid] // _DAY).astype(np.int64)
+        t = temp[valid]
+
+        # Rows are in time order, so each day is one contiguous run.
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        counts = np.diff(np.r_[starts, len(t)])
+        daily = list(zip(
+            (_date(d) for d in days[starts]),
+            np.minimum.reduceat(t, starts).tolist(),
+            np.maximum.reduceat(t, starts).tolist(),
+            (np.add.reduceat(t, starts) / counts).tolist(),
+            counts.tolist(),
+        ))
+
+    h = humidity[np.isfinite(humidity)]
+    buckets = np.bincount(np.minimum(h // 10, HUMIDITY_BUCKETS - 1).astype(np.int64), minlength=HUMIDITY_BUCKETS)
+
+    ids, id_counts = np.unique(weather_id[np.isfinite(weather_id)], return_counts=True)
+    return daily, buckets.tolist(), dict(zip(ids.astype(int).tolist(), id_counts.tolist()))
+
+
+def _columns_array(buf):
+    width = len(TREND_COLUMNS)
+    time_, temp, humidity, weather_id = (buf[i::width] for i in range(width))
+    inf = math.inf
+
+    daily = []
+    n, i = len(temp), 0
+    while i < n:
+        # Same UTC day = times within [day start, next day start); found by bisect, not a row loop.
+        day = int(time_[i] // _DAY)
+        j = bisect.bisect_left(time_, (day + 1) * _DAY, i)
+
+        t = temp[i:j]
+        if inf in t:
+            t = [v for v in t if v != inf]
+        if t:
+            daily.append((_date(day), min(t), max(t), sum(t) / len(t), len(t)))
+        i = j
+
+    buckets = [0] * HUMIDITY_BUCKETS
+    for value, count in Counter(humidity).items():
+        if value != inf:
+            buckets[min(int(value // 10), HUMIDITY_BUCKETS - 1)] += count
+
+    ids = {int(v): c for v, c in Counter(weather_id).items() if v != inf}
+    return daily, buckets, ids
+
+
+def compute_trends(buf, window: int = MOVING_AVG_DAYS) -> dict:
+    # Statistics for one location's trend_columns() buffer.
+
+    daily, humidity, ids = (_columns_numpy if np is not None else _columns_array)(buf)
+
+    moving = _moving_average([d[3] for d in daily], window)
+
+    groups = {}
+    for weather_id, count in ids.items():
+        g = _group(weather_id)
+        if g is None:
+            continue
+        total, top = groups.get(g, (0, None))
+        if top is None or count > ids[top]:
+            top = weather_id
+        groups[g] = (total + count, top)
+
+    conditions = sorted(
+        ({"group": g, "count": total, "top_id": top} for g, (total, top) in groups.items()),
+        key=lambda c: -c["count"],
+    )
+
+    return {
+        "rows": len(buf) // len(TREND_COLUMNS),
+        "daily": [
+            {"date": d, "min": lo, "max": hi, "mean": mean, "count": count, "moving_avg": ma}
+            for (d, lo, hi, mean, count), ma in zip(daily, moving)
+        ],
+        "humidity": humidity,
+        "conditions": conditions,
+    }
+
+
+def location_trends(query_type: str, text: str, country: str, days: int | None = None) -> dict:
+    # compute_trends() for one location (alpha-2 country), optionally only the last `days` days.
+
+    init_db()
+    since = datetime.now(timezone.utc) - timedelta(days=days) if days else None
+    return compute_trends(trend_columns(location_key(query_type, text, country), since=since))
+
+
+def format_trends(name: str, trends: dict, lang: str = "en", last_days: int = 14, units: str = "metric") -> str:
+    # Plain-text report; the daily table shows the most recent `last_days` days.
+    # Trends are computed in metric (like history); temperatures are shown in `units`.
+
+    ja = lang == "ja"
+    lines = [f"\n--- {name}: {trends['rows']} {'件' if ja else 'observations'} ---"]
+
+    if not trends["rows"]:
+        return lines[0] + "\n"
+
+    header = "日付(UTC)    最低    最高    平均  移動平均" if ja else "date (UTC)    min     max    mean  moving avg"
+    lines.append(header if units == "metric" else f"{header}  ({LABELS[units][0]})")
+    for d in trends["daily"][-last_days:]:
+        low, high, mean, ma = (convert_temp(d[k], units) for k in ("min", "max", "mean", "moving_avg"))
+        ma = "" if ma is None else f"{ma:6.1f}"
+        lines.append(f"{d['date']}  {low:6.1f}  {high:6.1f}  {mean:6.1f}  {ma}")
+
+    total = sum(trends["humidity"]) or 1
+    lines.append("\n湿度" if ja else "\nhumidity")
+    for i, count in enumerate(trends["humidity"]):
+        if count:
+            label = f"{i * 10}-{i * 10 + 9 if i < HUMIDITY_BUCKETS - 1 else 100}%"
+            lines.append(f"  {label:>8}  {'#' * round(30 * count / total):<30} {count}")
+
+    if trends["conditions"]:
+        lines.append("\n天気" if ja else "\nconditions")
+        for c in trends["conditions"]:
+            _, en_name, ja_name = CONDITION_GROUPS[c["group"]]
+            top = JP_WEATHER_ID.get(c["top_id"], "") if ja else f"id {c['top_id']}"
+            lines.append(f"  {ja_name if ja else en_name:<14} {c['count']:>7}  ({top})")
+
+    return "\n".join(lines) + "\n"
+
+
+def run_trends(lines: list[str], days: int | None = None, lang: str = "en", out=None, units: str = "metric") -> int:
+    # Prints a report per location. Returns the number that couldn't be resolved.
+
+    out = out or sys.stdout
+    resolved, unknown = resolve_locations(parse_location(line) for line in lines)
+
+    for _, text, raw_country in unknown:
+        out.write(f"{text}, {raw_country}: error: unknown country\n")
+
+    for query_type, text, country in resolved:
+        trends = location_trends(query_type, text, country, days)
+        out.write(format_trends(f"{text}, {country}", trends, lang=lang, units=units))
+
+    return len(unknown)
@@ -0,0 +1,72 @@
+"""
+Display Units
+
+The proxy and local history keep every observation in metric (°C, m/s), so
+cached rows serve any units and history stays comparable. Other units are
+only a way of showing them, converted here just before printing:
+
+    python -m src.main --units imperial "London,gb"
+
+Numbers typed in those units (history filters like temp>=70) go the other
+way, to_canonical, before they're compared with stored rows.
+
+    metric     °C   m/s
+    imperial   °F   mph
+    standard   K    m/s
+
+Mirrors proxy/units.py (the client doesn't ship the proxy package);
+tests/test_proxy_weather.py checks that the two convert alike.
+"""
+
+UNITS = ("metric", "imperial", "standard")
+
+# units -> (temperature label, wind speed label)
+LABELS = {"metric": ("°C", "m/s"), "imperial": ("°F", "mph"), "standard": ("K", "m/s")}
+
+# units -> (scale, offset) from metric: out = value * scale + offset
+_TEMP = {"metric": (1.0, 0.0), "imperial": (1.8, 32.0), "standard": (1.0, 273.15)}
+_SPEED = {"metric": 1.0, "imperial": 1 / 0.44704, "standard": 1.0}
+
+TEMP_FIELDS = ("temp", "feels_like", "temp_min", "temp_max")
+SPEED_FIELDS = ("speed", "gust")
+
+
+def convert_temp(value, units: str, to_canonical: bool = False):
+    # A metric temperature in `units` (to_canonical: from `units` into metric).
+    # None (or anything non-numeric) stays as is.
+
+    if type(value) not in (int, float) or units == "metric":
+        return value
+
+    scale, offset = _TEMP[units]
+    return round((value - offset) / scale if to_canonical else value * scale + offset, 2)
+
+
+def convert_speed(value, units: str, to_canonical: bool = False):
+    # A metric wind speed in `units` (or back).
+
+    scale = _SPEED[units]
+    if type(value) not in (int, float) or scale == 1.0:
+        return value
+
+    return round(value / scale if to_canonical else value * scale, 2)
+
+
+def convert(data: dict, units: str) -> dict:
+    # A metric observation with main temperatures and wind speeds in `units`.
+    # Returns data itself for metric, else a copy.
+
+    if units == "metric" or not isinstance(data, dict):
+        return data
+
+    out = dict(data)
+
+    main = data.get("main")
+    if isinstance(main, dict):
+        out["main"] = dict(main, **{f: convert_temp(main[f], units) for f in TEMP_FIELDS if f in main})
+
+    wind = data.get("wind")
+    if isinstance(wind, dict):
+        out["wind"] = dict(wind, **{f: convert_speed(wind[f], units) for f in SPEED_FIELDS if f in wind})
+
+    return out
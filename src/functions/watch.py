@@ -0,0 +1,176 @@
+import sys, math, time, requests
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from src.functions.batch import parse_location, resolve_locations
+from src.functions.get_weather import fetch_weather
+from src.functions.units import LABELS
+
+
+"""
+Watch Mode
+
+Keeps polling a few locations and prints only what changed:
+
+    python -m src.main --watch 600 "London,gb" "22304,us"
+
+Polls are aligned to the wall clock (ex: every 10 minutes at :00:30, :10:30 ...),
+a little after OpenWeather refreshes its current conditions, instead of drifting
+from whenever the command was started.
+
+The first poll may come straight from local history. After that each location
+is asked for conditionally (If-None-Match), so an unchanged observation costs an
+empty 304. New observations are logged to local history like any other lookup.
+"""
+
+# Shortest allowed interval (seconds). OpenWeather itself refreshes about every 10 minutes.
+MIN_INTERVAL_SEC = 30
+
+# Polls happen this many seconds after each aligned boundary, once the update has landed.
+ALIGN_OFFSET_SEC = 30
+
+# Fields compared between polls.
+WATCHED = ("temp", "humidity", "wind_speed", "description")
+
+
+def _display_units(units: str) -> dict:
+    # Field -> unit suffix, ex: {"temp": "°C", "wind_speed": " m/s", ...}
+
+    temp_unit, speed_unit = LABELS[units]
+    return {"temp": temp_unit, "humidity": "%", "wind_speed": f" {speed_unit}", "description": ""}
+
+
+def next_poll(now: float, interval: float, offset: float = ALIGN_OFFSET_SEC) -> float:
+    # First aligned poll time strictly after `now` (unix seconds).
+    # Ex: interval=600, offset=30 -> hh:00:30, hh:10:30, hh:20:30 ...
+
+    return (math.floor((now - offset) / interval) + 1) * interval + offset
+
+
+def observation(data: dict) -> dict:
+    # The watched fields of one proxy response.
+
+    main = data.get("main") or {}
+    return {
+        "temp": main.get("temp"),
+        "humidity": main.get("humidity"),
+        "wind_speed": (data.get("wind") or {}).get("speed"),
+        "description": data.get("description"),
+    }
+
+
+def diff(old: dict | None, new: dict, units: str = "metric") -> list[str]:
+    # Human-readable changes, ex: ["temp 10.0 -> 11.5°C"]. Everything when old is None.
+
+    suffix = _display_units(units)
+    changes = []
+    for field in WATCHED:
+        unit = suffix[field]
+        before, after = (old or {}).get(field), new.get(field)
+        if old is None:
+            changes.append(f"{field} {after}{unit}")
+        elif before != after:
+            changes.append(f"{field} {before} -> {after}{unit}")
+    return changes
+
+
+class Watcher:
+    # Polls every location on the aligned schedule and prints one line per change.
+
+    def __init__(
+        self,
+        locations: list[tuple[str, str, str]],
+        interval: float,
+        lang: str = "en",
+        out=None,
+        units: str = "metric",
+    ):
+        # locations: (query_type, text, alpha-2) tuples
+
+        self.locations = locations
+        self.interval = max(MIN_INTERVAL_SEC, float(interval))
+        self.lang = lang
+        self.units = units
+        self.out = out or sys.stdout
+
+        # (query_type, text, country) -> {"etag", "obs", "error"}
+        self._state = {loc: {"etag": None, "obs": None, "error": None} for loc in locations}
+
+    def _poll_one(self, loc: tuple[str, str, str]) -> str | None:
+        # Returns the line to print for this location, or None if nothing changed.
+
+        query_type, text, country = loc
+        state = self._state[loc]
+
+        try:
+            data = fetch_weather(query_type, text, country, lang=self.lang, etag=state["etag"], units=self.units)
+        except (requests.exceptions.RequestException, LookupError) as err:
+            # Report an error once, not on every poll.
+            message = str(err)
+            if message == state["error"]:
+                return None
+            state["error"] = message
+            return f"{text}, {country}: error: {message}"
+
+        state["error"] = None
+
+        # 304: same observation as last time.
+        if data is None:
+            return None
+
+        # A cached first poll has no ETag; the next poll then fetches once for real.
+        state["etag"] = data.get("etag") or state["etag"]
+
+        obs = observation(data)
+        changes = diff(state["obs"], obs, self.units)
+        state["obs"] = obs
+
+        if not changes:
+            return None
+
+        return f"{data.get('name') or text}, {country}: " + ", ".join(changes)
+
+    def poll(self, pool: ThreadPoolExecutor) -> int:
+        # One round over every location. Returns the number of lines printed.
+
+        stamp = datetime.now().strftime("%H:%M:%S")
+        printed = 0
+
+        for line in pool.map(self._poll_one, self.locations):
+            if line:
+                self.out.write(f"[{stamp}] {line}\n")
+                printed += 1
+
+        self.out.flush()
+        return printed
+
+    def run(self, max_polls: int | None = None, clock=time.time, sleep=time.sleep) -> None:
+        # Polls now, then on every aligned tick until Ctrl+C (or max_polls, for tests).
+
+        polls = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(16, len(self.locations)))) as pool:
+            try:
+                while True:
+                    self.poll(pool)
+                    polls += 1
+                    if max_polls is not None and polls >= max_polls:
+                        return
+
+                    sleep(max(0.0, next_poll(clock(), self.interval) - clock()))
+            except KeyboardInterrupt:
+                return
+
+
+def run_watch(lines: list[str], interval: float, lang: str = "en", out=None, units: str = "metric") -> int:
+    # Parses and resolves the locations, then watches them.
+    # Returns the number of locations that couldn't be resolved (0 = all watched).
+
+    out = out or sys.stdout
+    resolved, unknown = resolve_locations(parse_location(line) for line in lines)
+
+    for _, text, raw_country in unknown:
+        out.write(f"{text}, {raw_country}: error: unknown country\n")
+
+    if resolved:
+        Watcher(resolved, interval, lang=lang, out=out, units=units).run()
+
+    return len(unknown)
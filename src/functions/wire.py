@@ -0,0 +1,86 @@
+import json, math
+from array import array
+
+try:
+    import msgpack
+except ImportError:     # optional: without it sync talks JSON/NDJSON, as before
+    msgpack = None
+
+
+"""
+Wire Formats (client side)
+
+With `msgpack` installed, sync pulls /history/since pages as MessagePack in
+the columnar layout and uploads batches as MessagePack; JSON and NDJSON are
+used otherwise, and whenever the proxy doesn't offer MessagePack.
+
+Mirrors the decoding half of proxy/wire.py (the client doesn't ship the proxy
+package), plus packing an upload batch; tests/test_wire_format.py checks that
+the two decode alike.
+"""
+
+JSON = "application/json"
+MSGPACK = "application/x-msgpack"
+_MSGPACK_TYPES = {MSGPACK, "application/msgpack", "application/vnd.msgpack"}
+
+FLOAT32_DECIMALS = 2
+
+
+def available() -> bool:
+    return msgpack is not None
+
+
+def is_msgpack(content_type: str | None) -> bool:
+    return (content_type or "").split(";", 1)[0].strip().lower() in _MSGPACK_TYPES
+
+
+def pack(body: dict) -> bytes:
+    # A MessagePack body (rows layout). Only call when available().
+    return msgpack.packb(body, use_bin_type=True)
+
+
+def from_columns(table: dict) -> list[dict]:
+    # The columnar layout -> row dicts. Raises ValueError if it's malformed.
+
+    count, columns = table.get("count"), table.get("columns")
+    if type(count) is not int or count < 0 or not isinstance(columns, dict):
+        raise ValueError("bad columnar table")
+
+    values = {}
+    for name, column in columns.items():
+        if isinstance(column, dict):
+            if column.get("dtype") != "f4" or not isinstance(column.get("data"), bytes):
+                raise ValueError(f"bad column {name!r}")
+            packed = array("f")
+            packed.frombytes(column["data"])
+            decimals = int(column.get("decimals", FLOAT32_DECIMALS))
+            column = [None if math.isnan(v) else round(v, decimals) for v in packed]
+        if not isinstance(column, list) or len(column) != count:
+            raise ValueError(f"column {name!r} doesn't have {count} values")
+        values[name] = column
+
+    names = list(values)
+    return [dict(zip(names, row)) for row in zip(*(values[n] for n in names))] if names else [{} for _ in range(count)]
+
+
+def decode(data: bytes, content_type: str | None = None) -> dict:
+    # A proxy response body (either format, either layout) -> dict with "items" as rows.
+    # Raises ValueError on anything malformed.
+
+    binary = is_msgpack(content_type)
+    if binary and msgpack is None:
+        raise ValueError("MessagePack body, but msgpack isn't installed")
+
+    try:
+        body = msgpack.unpackb(data, raw=False) if binary else json.loads(data)
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"bad body: {exc}") from None
+
+    if not isinstance(body, dict):
+        raise ValueError("body must be an object")
+
+    items = body.get("items")
+    if isinstance(items, dict) and items.get("layout") == "columns":
+        body["items"] = from_columns(items)
+
+    return body
@@ -1,13 +1,11 @@
-from src.functions.det_questions import location_data
-from src.functions.get_weather import (
-    get_weather_by_city_name,
-    get_weather_by_postal_code,
-    get_local_history,
-    search_local_history,
-)
-from src.data.local_history import init_db
+import sys, argparse, threading
+from src.functions.batch import FORMATS, read_locations
 from src.data.i18n import TEXT
 
+# Everything else (requests, pycountry, SQLite, NumPy...) is imported where it's
+# first used, so the first prompt shows up without waiting for any of it.
+# tests/test_startup.py holds `import src.main` to an import-time budget.
+
 
 def _t(lang: str, key: str, default: str) -> str:
     # Small helper so main doesn't crash if a key is missing.
@@ -26,8 +24,48 @@ def _t(lang: str, key: str, default: str) -> str:
 lang = "en"  # Default; we ask inside __main__ so tests can import this file safely.
 
 
-def _print_history(items: list[dict], lang: str) -> None:
+def _warm_up(proxy: bool = False) -> None:
+    # Runs on a background thread while the first prompts wait for the user:
+    # loads the country data, then the HTTP client, so neither delays a prompt later.
+    # With proxy=True it also pings the proxy, so a sleeping host is awake by the first lookup.
+
+    from src.data.country_codes import load_countries
+    load_countries()
+
+    from src.functions.get_weather import warm_up_proxy
+    if proxy:
+        warm_up_proxy()
+
+
+def _quick_pick(locations: list[dict], lang: str) -> dict | None:
+    # Numbered list of recent locations. Returns the one picked, or None for a new location.
+
+    from src.functions.recent import format_recent, pick
+
+    if not locations:
+        return None
+
+    print(_t(lang, "recent_title", "\nRecent locations:"))
+    for line in format_recent(locations):
+        print(line)
+
+    while True:
+        answer = input(_t(lang, "recent_pick", "Pick a number, or press Enter for a new location: ")).strip()
+        if not answer:
+            return None
+
+        location = pick(locations, answer)
+        if location is not None:
+            return location
+
+        print(_t(lang, "invalid_selection", "Invalid selection. Try again.\n"))
+
+
+def _print_history(items: list[dict], lang: str, units: str = "metric") -> None:
     # Prints history in a readable format (not raw JSON).
+    # Rows are stored in metric; temperatures are shown in `units`.
+
+    from src.functions.units import LABELS, convert_temp
 
     if not items:
         print(_t(lang, "no_history", "\nNo history found yet.\n"))
@@ -43,59 +81,205 @@ def _print_history(items: list[dict], lang: str) -> None:
         country = row.get("country")
         name = row.get("name")
         desc = row.get("description")
-        temp = row.get("temp")
+        temp = convert_temp(row.get("temp"), units)
 
         # Keeps the query display simple.
         query = city or postal or "?"
 
-        print(f"[{created}] {query_type}:{query} ({country}) -> {name} | {temp}° | {desc}")
+        print(f"[{created}] {query_type}:{query} ({country}) -> {name} | {temp}{LABELS[units][0]} | {desc}")
 
     print(_t(lang, "history_footer", "---------------------\n"))
 
 
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    # Command-line flags. With no locations, everything is asked interactively.
+
+    parser = argparse.ArgumentParser(description="Current weather by city or postal code.")
+    parser.add_argument(
+        "locations",
+        nargs="*",
+        help='Batch mode: locations as "<city or postal>,<country>" (ex: "London,gb" "22304,us").',
+    )
+    parser.add_argument(
+        "--file", "-f",
+        type=argparse.FileType("r", encoding="utf-8"),
+        help="Batch mode: read locations from a file, one per line ('-' for stdin).",
+    )
+    parser.add_argument("--format", choices=FORMATS, default="table", help="Batch output format.")
+    parser.add_argument("--workers", type=int, default=16, help="Batch lookups run at once.")
+    parser.add_argument("--lang", choices=("en", "ja"), default=None, help="Language (skips the prompt).")
+    parser.add_argument(
+        "--units",
+        choices=("metric", "imperial", "standard"),
+        default="metric",
+        help="Units to show (°C, °F or K; m/s or mph). Saved history stays metric.",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        metavar="INTERVAL",
+        help="Keep polling the given locations every INTERVAL seconds, printing only changes.",
+    )
+    parser.add_argument(
+        "--trends",
+        action="store_true",
+        help="Print history statistics for the given locations instead of fetching weather.",
+    )
+    parser.add_argument("--days", type=int, default=None, help="With --trends: only the last N days.")
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Send new local history to the proxy and download rows other devices logged.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Don't call the proxy; show the newest saved observation for the location.",
+    )
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
 
+    args = _parse_args()
+
+    # Sync: local history <-> proxy DB, then exit.
+    if args.sync:
+        from src.functions.sync import run_sync
+        sys.exit(run_sync())
+
+    # Trends: statistics from local history only, no proxy call.
+    if args.trends:
+        locations = read_locations(args.locations, args.file)
+        if not locations:
+            sys.exit("--trends needs at least one location (arguments or --file).")
+
+        from src.functions.trends import run_trends
+        sys.exit(1 if run_trends(locations, days=args.days, lang=args.lang or "en", units=args.units) else 0)
+
+    # Watch mode: poll the locations until Ctrl+C, printing only changes.
+    if args.watch is not None:
+        locations = read_locations(args.locations, args.file)
+        if not locations:
+            sys.exit("--watch needs at least one location (arguments or --file).")
+
+        from src.functions.watch import run_watch
+        sys.exit(1 if run_watch(locations, args.watch, lang=args.lang or "en", units=args.units) else 0)
+
+    # Batch mode: no prompts, results printed as they arrive.
+    # Exit code 1 if any lookup failed, so scripts can tell.
+    if args.locations or args.file:
+        from src.functions.batch import run_batch
+
+        locations = read_locations(args.locations, args.file)
+        failures = run_batch(
+            locations,
+            fmt=args.format,
+            lang=args.lang or "en",
+            workers=args.workers,
+            offline=args.offline,
+            units=args.units,
+        )
+        sys.exit(1 if failures else 0)
+
+    threading.Thread(target=_warm_up, args=(not args.offline,), name="warm-up", daemon=True).start()
+
     # Pick a language for prompts/output.
     # Default is English if the user types something unexpected.
-    lang = input(_t("en", "language_prompt", "Language? [en/ja] (default en): ")).strip().lower()
+    lang = args.lang or input(_t("en", "language_prompt", "Language? [en/ja] (default en): ")).strip().lower()
     if lang not in ("en", "ja"):
         lang = "en"
 
+    # Imported here, not at the top: see _warm_up().
+    from src.functions.det_questions import location_data
+    from src.functions.history_filters import parse_filters
+    from src.functions.get_weather import (
+        get_weather_by_city_name,
+        get_weather_by_postal_code,
+        get_local_history,
+        search_local_history,
+        query_local_history,
+    )
+    from src.functions.recent import load_recent
+    from src.data.local_history import init_db
+
     # Ensure our local history DB exists before we do anything.
     # This DB is stored in LocalAppData so it's free + works offline.
     init_db()
 
-    # Location prompts should match the selected language.
-    city, postal, country = location_data(interactive=True, lang=lang)
+    # Frequent recent locations start refreshing now, while the user reads the list.
+    recent, refreshes = load_recent(lang=lang, offline=args.offline)
+    picked = _quick_pick(recent, lang)
+
+    if picked is not None:
+        # Its refresh (usually done by now) leaves it in the local cache.
+        i = recent.index(picked)
+        if refreshes:
+            refreshes[i].result()
+
+        city, postal = (picked["text"], None) if picked["query_type"] == "city" else (None, picked["text"])
+        country = picked["country"].lower()
+    else:
+        # Location prompts should match the selected language.
+        city, postal, country = location_data(interactive=True, lang=lang)
 
     # Fetch weather from the proxy (still metric).
+    # Recent repeats (or anything saved, with --offline) come from local history.
     if postal:
-        get_weather_by_postal_code(postal, country_code=country, lang=lang)
+        get_weather_by_postal_code(postal, country_code=country, lang=lang, offline=args.offline, units=args.units)
     else:
-        get_weather_by_city_name(city, country_code=country, lang=lang)
+        get_weather_by_city_name(city, country_code=country, lang=lang, offline=args.offline, units=args.units)
 
     # History/search menu is local-only (no proxy needed).
-    while True:
-        choice = input(_t(lang, "history_prompt", "\n[h]istory, [s]earch, or press Enter to quit: ")).strip().lower()
+    # Ctrl+C leaves quietly; rows still queued for history are saved at exit.
+    try:
+        while True:
+            choice = input(_t(lang, "history_prompt", "\n[h]istory, [s]earch, [f]ilter, [t]rends, or press Enter to quit: ")).strip().lower()
+
+            if not choice:
+                break
+
+            if choice in ("h", "history"):
+                limit_raw = input(_t(lang, "history_count", "How many entries? (default 10): ")).strip()
+                limit = int(limit_raw) if limit_raw else 10
+
+                result = get_local_history(limit=limit)
+                _print_history(result.get("items", []), lang=lang, units=args.units)
+
+            elif choice in ("s", "search"):
+                q = input(_t(lang, "search_prompt", "Search text (ex: 'rain', 'Tokyo'): ")).strip()
+                if not q:
+                    print(_t(lang, "search_blank", "Search text can't be blank."))
+                    continue
+
+                result = search_local_history(q=q, limit=25)
+                _print_history(result.get("items", []), lang=lang, units=args.units)
 
-        if not choice:
-            break
+            elif choice in ("f", "filter"):
+                try:
+                    filters, oldest_first = parse_filters(input(_t(lang, "filter_prompt", "Filters: ")), units=args.units)
+                except ValueError as err:
+                    print(err)
+                    continue
 
-        if choice in ("h", "history"):
-            limit_raw = input(_t(lang, "history_count", "How many entries? (default 10): ")).strip()
-            limit = int(limit_raw) if limit_raw else 10
+                # One page at a time; each next page picks up after the last row shown.
+                cursor = None
+                while True:
+                    result = query_local_history(oldest_first=oldest_first, after=cursor, limit=25, **filters)
+                    _print_history(result.get("items", []), lang=lang, units=args.units)
 
-            result = get_local_history(limit=limit)
-            _print_history(result.get("items", []), lang=lang)
+                    cursor = result.get("next")
+                    if not cursor or input(_t(lang, "filter_more", "Enter for more: ")).strip():
+                        break
 
-        elif choice in ("s", "search"):
-            q = input(_t(lang, "search_prompt", "Search text (ex: 'rain', 'Tokyo'): ")).strip()
-            if not q:
-                print(_t(lang, "search_blank", "Search text can't be blank."))
-                continue
+            elif choice in ("t", "trends"):
+                location = input(_t(lang, "trends_prompt", "Location (ex: 'Tokyo,jp'): ")).strip()
+                if location:
+                    from src.functions.trends import run_trends
+                    run_trends([location], lang=lang, units=args.units)
 
-            result = search_local_history(q=q, limit=25)
-            _print_history(result.get("items", []), lang=lang)
+            else:
+                print(_t(lang, "unknown_option", "Unknown option. Use 'h', 's', 'f', 't', or Enter."))
 
-        else:
-            print(_t(lang, "unknown_option", "Unknown option. Use 'h', 's', or Enter."))
+    except KeyboardInterrupt:
+        print()
@@ -25,3 +25,30 @@ def set_proxy_env_with_token(monkeypatch):
     monkeypatch.setenv("WEATHER_PROXY_URL", "https://example.com/weather")
     monkeypatch.setenv("WEATHER_PROXY_TOKEN", "testtoken123")
     yield
+
+
+@pytest.fixture(autouse=True)
+def isolated_history_dbs(monkeypatch, tmp_path):
+    # Points both SQLite history files at a temp folder.
+    # Tests never touch the real LocalAppData DB or proxy/weather_history.sqlite.
+
+    monkeypatch.setenv("WEATHER_DB_PATH", str(tmp_path / "proxy_history.sqlite"))
+    monkeypatch.setenv("LOCALAPPDATA", str(tmp_path / "appdata"))
+
+    # Location ids and cached observations belong to the previous test's DB.
+    server = sys.modules.get("proxy.server")
+    if server is not None:
+        server._weather_cache.clear()
+        server._forecast_cache.clear()
+        server._location_ids.clear()
+
+        if server._shared is not None:
+            server._shared.close()
+            server._shared = None
+
+    yield
+
+    # Rows queued for the background history writer belong to this test's DB.
+    local_history = sys.modules.get("src.data.local_history")
+    if local_history is not None:
+        local_history.flush()
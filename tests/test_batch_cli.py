@@ -0,0 +1,89 @@
+import io, csv, json, time, requests
+from types import SimpleNamespace
+import src.functions.get_weather as get_weather
+from src.functions.batch import parse_location, read_locations, run_batch
+
+
+class DummyResponse:
+    # Mimics a basic requests.Response for tests (no network involved).
+    def __init__(self, status_code=200, json_data=None):
+        self.status_code = status_code
+        self._json_data = json_data or {}
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error", response=self)
+
+    def json(self):
+        return self._json_data
+
+
+def _patch_get(monkeypatch, fake_get):
+    monkeypatch.setattr(get_weather, "_get_session", lambda: SimpleNamespace(get=fake_get))
+
+
+def _slow_weather(url, params=None, headers=None, timeout=None):
+    # Each lookup takes 0.2s; unknown places are a 404.
+    time.sleep(0.2)
+    place = params.get("city") or params.get("postal")
+    if place == "NopeTown":
+        return DummyResponse(404, {"detail": "not found"})
+    return DummyResponse(200, {
+        "name": place,
+        "main": {"temp": 10.0, "humidity": 50},
+        "wind": {"speed": 2.5},
+        "weather": [{"description": "clear sky"}],
+    })
+
+
+def test_parse_location_forms():
+    assert parse_location("London,gb") == ("city", "London", "gb")
+    assert parse_location(" 22304 , us ") == ("postal", "22304", "us")
+    assert parse_location("Portland,OR,United States") == ("city", "Portland,OR", "United States")
+    assert parse_location("Tokyo") == ("city", "Tokyo", "US")
+
+
+def test_read_locations_skips_blanks_and_comments():
+    fh = io.StringIO("# sites\nLondon,gb\n\n  22304,us  \n")
+    assert read_locations(["Tokyo,jp"], fh) == ["Tokyo,jp", "London,gb", "22304,us"]
+
+
+def test_batch_runs_concurrently_and_reports_errors(monkeypatch, set_proxy_env):
+    _patch_get(monkeypatch, _slow_weather)
+
+    locations = [f"City{i},gb" for i in range(10)] + ["NopeTown,us", "Atlantis,Nowhereland"]
+    out = io.StringIO()
+
+    start = time.perf_counter()
+    failures = run_batch(locations, fmt="json", workers=16, out=out)
+    elapsed = time.perf_counter() - start
+
+    # Ten 0.2s lookups in parallel, not one after another.
+    assert elapsed < 1.0
+
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(rows) == 12
+    assert failures == 2
+
+    errors = {r["query"]: r["error"] for r in rows if r.get("error")}
+    assert errors == {"NopeTown": "HTTP 404", "Atlantis": "unknown country"}
+    assert all(r["country"] == "GB" for r in rows if r["query"].startswith("City"))
+
+
+def test_batch_csv_and_table_output(monkeypatch, set_proxy_env):
+    _patch_get(monkeypatch, _slow_weather)
+
+    out = io.StringIO()
+    assert run_batch(["London,gb", "22304,usa"], fmt="csv", out=out) == 0
+
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert {r["query"] for r in rows} == {"London", "22304"}
+    assert {r["country"] for r in rows} == {"GB", "US"}
+
+    # Second run comes from the local cache; table has a header line plus one per row.
+    out = io.StringIO()
+    assert run_batch(["London,gb"], fmt="table", out=out) == 0
+    lines = out.getvalue().splitlines()
+    assert lines[0].split()[:3] == ["query", "country", "name"]
+    assert "London" in lines[1] and "True" in lines[1]
@@ -1,5 +1,8 @@
-import requests, pytest
+import sqlite3, requests, pytest
+from types import SimpleNamespace
+import src.functions.get_weather as get_weather
 from src.functions.get_weather import get_weather_by_city_name, get_weather_by_postal_code
+from src.data.local_history import db_path, flush
 
 
 
@@ -17,6 +20,11 @@ class DummyResponse:
         return self._json_data
 
 
+def _patch_get(monkeypatch, fake_get):
+    # Swaps the pooled proxy session for one whose .get() is fake_get.
+    monkeypatch.setattr(get_weather, "_get_session", lambda: SimpleNamespace(get=fake_get))
+
+
 def test_city_success_prints_weather(monkeypatch, capsys, set_proxy_env):
     # Mocks a successful proxy response for a city search.
 
@@ -34,7 +42,7 @@ def test_city_success_prints_weather(monkeypatch, capsys, set_proxy_env):
         assert params["units"] == "metric"
         return DummyResponse(200, payload)
 
-    monkeypatch.setattr("src.functions.get_weather.requests.get", fake_get)
+    _patch_get(monkeypatch, fake_get)
 
     get_weather_by_city_name("London", "GB")
     out = capsys.readouterr().out
@@ -62,7 +70,7 @@ def test_postal_success_prints_weather(monkeypatch, capsys, set_proxy_env):
         assert params["units"] == "metric"
         return DummyResponse(200, payload)
 
-    monkeypatch.setattr("src.functions.get_weather.requests.get", fake_get)
+    _patch_get(monkeypatch, fake_get)
 
     get_weather_by_postal_code("22304", country_code="us")
     out = capsys.readouterr().out
@@ -76,7 +84,7 @@ def test_city_404_prints_not_found(monkeypatch, capsys, set_proxy_env):
     def fake_get(url, params=None, headers=None, timeout=None):
         return DummyResponse(404, {"detail": "not found"})
 
-    monkeypatch.setattr("src.functions.get_weather.requests.get", fake_get)
+    _patch_get(monkeypatch, fake_get)
 
     get_weather_by_city_name("NopeTown", "US")
     out = capsys.readouterr().out.lower()
@@ -90,9 +98,161 @@ def test_timeout_prints_request_error(monkeypatch, capsys, set_proxy_env):
     def fake_get(url, params=None, headers=None, timeout=None):
         raise requests.exceptions.Timeout("timed out")
 
-    monkeypatch.setattr("src.functions.get_weather.requests.get", fake_get)
+    _patch_get(monkeypatch, fake_get)
 
     get_weather_by_city_name("London", "GB")
     out = capsys.readouterr().out.lower()
 
     assert "timed out" in out or "error" in out
+
+
+def test_session_is_pooled_and_reused(monkeypatch):
+    # One keep-alive session per process, with retries that give the response back.
+
+    monkeypatch.setattr(get_weather, "_session", None)
+
+    session = get_weather._get_session()
+    assert get_weather._get_session() is session
+
+    retry = session.get_adapter("https://example.com").max_retries
+    assert isinstance(retry, get_weather._ProxyRetry)
+    assert retry.raise_on_status is False
+    assert retry.respect_retry_after_header is True
+
+
+def test_retry_only_waits_out_429_with_retry_after():
+    retry = get_weather._ProxyRetry(total=3, status_forcelist=(429, 503))
+
+    # Per-minute limit (Retry-After sent) is retried; the daily limit (none) is not.
+    assert retry.is_retry("GET", 429, has_retry_after=True)
+    assert not retry.is_retry("GET", 429, has_retry_after=False)
+    assert retry.is_retry("GET", 503)
+
+    class Headers:
+        headers = {"Retry-After": "3600"}
+
+    assert retry.get_retry_after(Headers()) == get_weather.MAX_RETRY_AFTER_SEC
+
+
+def test_requests_use_connect_and_read_timeouts(monkeypatch, capsys, set_proxy_env):
+    seen = {}
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        seen["timeout"] = timeout
+        return DummyResponse(404, {"detail": "not found"})
+
+    _patch_get(monkeypatch, fake_get)
+    get_weather_by_city_name("NopeTown", "US")
+
+    connect, read = seen["timeout"]
+    assert connect < read
+
+
+LONDON = {
+    "name": "London",
+    "main": {"temp": 10.0, "humidity": 50},
+    "wind": {"speed": 2.5},
+    "weather": [{"description": "overcast clouds"}],
+}
+
+
+def test_repeat_lookup_is_served_from_local_history(monkeypatch, capsys, set_proxy_env):
+    calls = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        calls.append(params)
+        return DummyResponse(200, LONDON)
+
+    _patch_get(monkeypatch, fake_get)
+
+    first = get_weather_by_city_name("London", "GB")
+    second = get_weather_by_city_name(" london ", "gb")
+    out = capsys.readouterr().out
+
+    assert len(calls) == 1
+    assert first["cached"] is False and second["cached"] is True
+    assert second["main"]["temp"] == 10.0
+    assert "(cached," in out
+
+    # Different lang is a different observation.
+    get_weather_by_city_name("London", "GB", lang="ja")
+    assert len(calls) == 2
+
+
+def test_cache_ttl_zero_always_calls_proxy(monkeypatch, set_proxy_env):
+    calls = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        calls.append(params)
+        return DummyResponse(200, LONDON)
+
+    _patch_get(monkeypatch, fake_get)
+    monkeypatch.setattr(get_weather, "WEATHER_CACHE_TTL_SEC", 0)
+
+    get_weather_by_city_name("London", "GB")
+    get_weather_by_city_name("London", "GB")
+    assert len(calls) == 2
+
+
+def test_offline_serves_newest_row_of_any_age(monkeypatch, capsys, set_proxy_env):
+    def fake_get(url, params=None, headers=None, timeout=None):
+        return DummyResponse(200, LONDON)
+
+    _patch_get(monkeypatch, fake_get)
+    get_weather_by_postal_code("22304", country_code="us")
+
+    # Way past the TTL, and no network allowed.
+    monkeypatch.setattr(get_weather, "WEATHER_CACHE_TTL_SEC", 1)
+    flush()
+    conn = sqlite3.connect(db_path())
+    conn.execute("UPDATE weather_history SET created_utc = '2020-01-01T00:00:00+00:00';")
+    conn.commit()
+    conn.close()
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("offline mode must not call the proxy")
+
+    _patch_get(monkeypatch, no_network)
+    capsys.readouterr()
+
+    result = get_weather_by_postal_code("22304", country_code="US", offline=True)
+    assert result["cached"] is True
+    assert "(cached," in capsys.readouterr().out
+
+    assert get_weather_by_city_name("Nowhere", "US", offline=True) is None
+    assert "offline" in capsys.readouterr().out.lower()
+
+
+def test_units_convert_display_but_request_and_store_metric(monkeypatch, capsys, set_proxy_env):
+    payload = {
+        "name": "London",
+        "main": {"temp": 10.0, "humidity": 50},
+        "wind": {"speed": 4.4704},
+        "weather": [{"id": 801, "description": "few clouds"}],
+    }
+    sent = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        sent.append(params)
+        return DummyResponse(200, payload)
+
+    _patch_get(monkeypatch, fake_get)
+
+    result = get_weather_by_city_name("London", "GB", units="imperial")
+    out = capsys.readouterr().out
+
+    assert sent[0]["units"] == "metric"
+    assert "50.0°F" in out and "10.0 mph" in out
+    assert result["main"]["temp"] == 50.0
+
+    # The cached (metric) row serves any units.
+    data = get_weather.fetch_weather("city", "London", "GB", units="standard")
+    assert data["cached"] is True
+    assert data["main"]["temp"] == 283.15
+    assert data["wind"]["speed"] == 4.4704
+    assert len(sent) == 1
+
+    flush()
+    conn = sqlite3.connect(db_path())
+    assert conn.execute("SELECT units, temp FROM weather_history;").fetchall() == [("metric", 10.0)]
+    conn.close()
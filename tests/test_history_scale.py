@@ -0,0 +1,36 @@
+from benchmarks.synthetic_history import Generator
+from benchmarks.history_scale import run, check_plan
+
+
+def test_synthetic_rows_are_deterministic_and_varied():
+    gen = Generator(seed=3, location_count=200)
+
+    rows = list(gen.proxy_rows(0, 6000))
+    assert list(gen.proxy_rows(4090, 4100)) == rows[4090:4100]
+
+    assert [r[0] for r in rows] == sorted(r[0] for r in rows)
+    assert {r[13] for r in rows} == {"en", "ja", "fr", "de", "es"}
+    assert {r[1] for r in rows} == {"city", "postal"}
+    assert len({r[12] for r in rows}) > 50
+
+    # Most lookups go to a few places.
+    london = sum(1 for r in rows if r[6] == "London")
+    assert london > len(rows) // 20
+
+
+def test_check_plan_flags_sorts_scans_and_missing_indexes():
+    assert check_plan("local.fetch_cached", [["SEARCH weather_history USING INDEX idx_wh_lookup (loc_key=?)"]]) == []
+
+    problems = check_plan("local.fetch_cached", [["SCAN weather_history"], ["USE TEMP B-TREE FOR ORDER BY"]])
+    assert len(problems) == 3
+
+
+def test_history_scale_runs_small():
+    # Keeps benchmarks/history_scale.py working and its plan checks green; sizes in the
+    # millions are run by hand (timings aren't checked here, only plans).
+    result = run(sizes=(2000, 5000), max_ms=None)
+
+    assert result["problems"] == []
+    assert set(result["sizes"]) == {2000, 5000}
+    assert "proxy.fetch_history" in result["sizes"][5000]
+    assert "local.search_history:london" in result["sizes"][5000]
@@ -0,0 +1,204 @@
+import gzip, json, sqlite3, httpx, pytest
+import proxy.server as server
+import proxy.stub_upstream as stub
+import src.functions.sync as sync
+import src.functions.get_weather as get_weather
+from fastapi.testclient import TestClient
+from proxy.server import app as proxy_app
+from proxy import history_sync
+from src.data import local_history
+from src.data.local_history import init_db, log_weather
+
+
+_RealAsyncClient = httpx.AsyncClient
+
+
+class _Session:
+    # requests-style calls routed to the proxy app in-process.
+
+    def __init__(self, client, fail_post_after=None):
+        self.client = client
+        self.posts = 0
+        self.fail_post_after = fail_post_after
+
+    def post(self, url, params=None, data=None, headers=None, timeout=None):
+        if self.fail_post_after is not None and self.posts >= self.fail_post_after:
+            raise sync.requests.exceptions.ConnectionError("network went away")
+        self.posts += 1
+        return self.client.post(url, params=params, content=data, headers=headers)
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        return self.client.get(url, params=params, headers=headers)
+
+
+@pytest.fixture
+def proxy(monkeypatch):
+    monkeypatch.setattr(server, "PROXY_TOKENS", {"tok"}, raising=False)
+    monkeypatch.setenv("WEATHER_PROXY_URL", "http://testserver/weather")
+    monkeypatch.setenv("WEATHER_PROXY_TOKEN", "tok")
+    server._db_init()
+    init_db()
+    return TestClient(proxy_app)
+
+
+def _log(city, temp=10.0):
+    log_weather(
+        query_type="city", city=city, postal=None, country="GB", units="metric", lang="en",
+        data={"name": city, "main": {"temp": temp}, "weather": [{"id": 800}]},
+    )
+
+
+def _central():
+    conn = sqlite3.connect(server._db_path())
+    try:
+        return conn.execute(
+            "SELECT city, device_id, device_row_id FROM weather_history ORDER BY id;"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def test_upload_sends_only_new_rows_and_resends_are_ignored(proxy):
+    for city in ("London", "Leeds", "York"):
+        _log(city)
+
+    session = _Session(proxy)
+    device = local_history.device_id()
+    assert sync.upload(session, "http://testserver", device, batch_rows=2) == 3
+    assert session.posts == 2
+
+    assert [(c, d) for c, d, _ in _central()] == [("London", device), ("Leeds", device), ("York", device)]
+    assert local_history.sync_marks()[0] == 3
+
+    # Nothing new: nothing sent.
+    assert sync.upload(session, "http://testserver", device) == 0
+
+    # The proxy's reply got lost: the batch goes again and is stored once.
+    with local_history._lock:
+        conn = local_history._connect()
+        with conn:
+            conn.execute("UPDATE sync_state SET value = '0' WHERE key = 'uploaded_id';")
+
+    assert sync.upload(session, "http://testserver", device) == 3
+    assert len(_central()) == 3
+
+
+def test_lookups_the_proxy_logged_are_not_uploaded_again(proxy, monkeypatch):
+    # /weather stores the observation under this device's id; sync mustn't add a second copy.
+    stub.calls.clear()
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "stubkey", raising=False)
+    monkeypatch.setattr(server, "_upstream", None)
+    monkeypatch.setattr(server, "_batcher", None)
+    monkeypatch.setattr(
+        server.httpx, "AsyncClient",
+        lambda timeout=8: _RealAsyncClient(transport=httpx.ASGITransport(app=stub.app), timeout=timeout),
+    )
+    session = _Session(proxy)
+    monkeypatch.setattr(get_weather, "_get_session", lambda: session)
+
+    assert get_weather.fetch_weather("city", "London", "GB")["cached"] is False
+    _log("Leeds")
+
+    device = local_history.device_id()
+    assert sync.upload(session, "http://testserver", device) == 1
+    assert [(c, d, r) for c, d, r in _central()] == [("London", device, None), ("Leeds", device, 2)]
+
+
+def test_interrupted_upload_resumes_after_the_last_accepted_batch(proxy):
+    for i in range(5):
+        _log(f"City{i}")
+
+    device = local_history.device_id()
+    with pytest.raises(sync.requests.exceptions.ConnectionError):
+        sync.upload(_Session(proxy, fail_post_after=1), "http://testserver", device, batch_rows=2)
+    assert local_history.sync_marks()[0] == 2
+
+    session = _Session(proxy)
+    assert sync.upload(session, "http://testserver", device, batch_rows=2) == 3
+    assert session.posts == 2
+    assert [r[2] for r in _central()] == [1, 2, 3, 4, 5]
+
+
+def test_download_pulls_other_devices_rows_once(proxy):
+    device = local_history.device_id()
+
+    # Another laptop's upload, and a /weather call this device made (already in its local history).
+    conn = server._db_connect()
+    try:
+        lines = [
+            json.dumps({"id": i, "created_utc": f"2026-01-0{i}T00:00:00+00:00", "city": "Osaka", "country": "JP",
+                        "lang": "ja", "temp": float(i), "raw": {"weather": [{"id": 500}]}})
+            for i in (1, 2, 3)
+        ]
+        result = history_sync.insert_batch(conn, "otherlaptop", "\n".join(lines).encode(), lambda *a: None)
+        assert result["inserted"] == 3
+    finally:
+        conn.close()
+    server._db_log(
+        query_type="city", city="London", postal=None, country="GB", units="metric",
+        data={"name": "London"}, lang="en", device_id=device,
+    )
+
+    session = _Session(proxy)
+    assert sync.download(session, "http://testserver", device, batch_rows=2) == 3
+    assert sync.download(session, "http://testserver", device) == 0
+    assert local_history.sync_marks()[1] == 4
+
+    rows, _ = local_history.query_history(country="JP", oldest_first=True)
+    assert [(r["temp"], r["lang"]) for r in rows] == [(1.0, "ja"), (2.0, "ja"), (3.0, "ja")]
+
+    # Downloaded rows serve as saved observations and are never uploaded back.
+    hit = local_history.fetch_cached("city", "osaka", "JP", units="metric", lang="ja")
+    assert hit["data"] == {"weather": [{"id": 500}]}
+    assert local_history.unsynced_rows() == []
+
+
+def test_run_sync_reports_both_directions(proxy, monkeypatch, capsys):
+    _log("London")
+    monkeypatch.setattr(sync, "_get_session", lambda: _Session(proxy))
+
+    assert sync.run_sync() == 0
+    assert "1 rows sent, 0 rows received" in capsys.readouterr().out
+
+
+def test_weather_calls_carry_the_device_id(monkeypatch):
+    monkeypatch.setenv("WEATHER_PROXY_TOKEN", "tok")
+    headers = sync._get_proxy_headers()
+    assert headers["Authorization"] == "Bearer tok"
+    assert headers["X-Device-Id"] == local_history.device_id()
+    assert history_sync.valid_device_id(headers["X-Device-Id"])
+
+
+def test_sync_endpoint_rejects_bad_requests(proxy, monkeypatch):
+    auth = {"Authorization": "Bearer tok"}
+    row = json.dumps({"id": 1, "created_utc": "2026-01-01T00:00:00+00:00", "city": "X", "country": "US"})
+
+    assert proxy.post("/history/sync?device_id=bad id", content=b"", headers=auth).status_code == 400
+    assert proxy.post("/history/sync?device_id=laptop-01", content=b"", headers={}).status_code == 401
+
+    # Compressed bodies are capped after decompression.
+    monkeypatch.setattr(history_sync, "SYNC_MAX_BODY_BYTES", 1000)
+    bomb = gzip.compress(b"\n" * 100000)
+    r = proxy.post("/history/sync?device_id=laptop-01", content=bomb, headers=dict(auth, **{"Content-Encoding": "gzip"}))
+    assert r.status_code == 413
+
+    # Bad lines are reported but still count toward last_id, so the device moves on.
+    body = gzip.compress((row + "\n" + json.dumps({"id": 2, "city": "X"}) + "\n").encode())
+    r = proxy.post("/history/sync?device_id=laptop-01", content=body, headers=dict(auth, **{"Content-Encoding": "gzip"}))
+    assert r.json()["inserted"] == 1 and r.json()["rejected"] == 1 and r.json()["last_id"] == 2
+
+    # Non-finite numbers (valid JSON to Python) are a rejected row, not a 500.
+    inf = json.dumps({"id": 3, "created_utc": "2026-01-01T00:00:00+00:00", "city": "X", "country": "US",
+                      "humidity": float("inf")})
+    r = proxy.post("/history/sync?device_id=laptop-01", content=inf.encode(), headers=auth)
+    assert r.status_code == 200 and r.json()["rejected"] == 1
+
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    assert proxy.post("/history/sync?device_id=laptop-01", content=b"").status_code == 403
+
+
+def test_since_is_gzipped_when_accepted(proxy):
+    r = proxy.get("/history/since?after=0", headers={"Authorization": "Bearer tok", "Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.json() == {"items": [], "next": 0}
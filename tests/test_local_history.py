@@ -0,0 +1,335 @@
+import os, sys, json, time, sqlite3, itertools, subprocess, pytest
+from pathlib import Path
+from datetime import datetime
+from src.data import local_history, search_index
+from src.data.local_history import init_db, log_weather, fetch_cached, location_key, db_path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _log(city="London", country="GB", lang="en", temp=10.0):
+    log_weather(
+        query_type="city",
+        city=city,
+        postal=None,
+        country=country,
+        units="metric",
+        lang=lang,
+        data={"name": city, "main": {"temp": temp}},
+    )
+
+
+def test_location_key_normalizes_spellings():
+    assert location_key("city", " London ", "gb") == "city:london|GB"
+    assert location_key("city", "ＬＯＮＤＯＮ", "GB") == "city:london|GB"
+    assert location_key("postal", "22304", "us") != location_key("city", "22304", "us")
+
+
+def test_fetch_cached_returns_newest_matching_row():
+    init_db()
+    _log(temp=1.0)
+    _log(temp=2.0)
+    _log(lang="ja", temp=3.0)
+
+    hit = fetch_cached("city", "london", "GB", units="metric", lang="en", max_age_sec=600)
+    assert hit["data"]["main"]["temp"] == 2.0
+    assert hit["age_sec"] < 600
+
+    assert fetch_cached("city", "Paris", "FR", units="metric", lang="en") is None
+
+
+def test_init_db_backfills_lookup_key_on_old_dbs():
+    # A DB from before loc_key existed gets the column, filled in, on first init.
+
+    path = db_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        CREATE TABLE weather_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, created_utc TEXT NOT NULL,
+            query_type TEXT NOT NULL, city TEXT, postal TEXT, country TEXT NOT NULL,
+            units TEXT NOT NULL, lang TEXT NOT NULL, name TEXT, description TEXT,
+            temp REAL, humidity INTEGER, wind_speed REAL, raw_json TEXT
+        );
+        """
+    )
+    conn.execute(
+        "INSERT INTO weather_history (created_utc, query_type, city, country, units, lang, raw_json) "
+        "VALUES ('2020-01-01T00:00:00+00:00', 'city', 'Tokyo', 'JP', 'metric', 'en', ?);",
+        (json.dumps({"lang": "en", "data": {"name": "Tokyo"}}),),
+    )
+    conn.commit()
+    conn.close()
+
+    init_db()
+
+    hit = fetch_cached("city", "tokyo", "jp", units="metric", lang="en")
+    assert hit["data"] == {"name": "Tokyo"}
+    assert fetch_cached("city", "tokyo", "jp", units="metric", lang="en", max_age_sec=60) is None
+
+
+def test_migrations_run_once_per_process(monkeypatch):
+    calls = []
+    original = local_history._migrate
+    monkeypatch.setattr(local_history, "_migrate", lambda conn: calls.append(1) or original(conn))
+
+    local_history.close_db()
+    for _ in range(5):
+        init_db()
+        fetch_cached("city", "London", "GB", units="metric", lang="en")
+
+    assert len(calls) == 1
+
+    # One connection is reused, and the DB records the schema version.
+    with local_history._lock:
+        conn = local_history._connect()
+        assert local_history._connect() is conn
+        assert conn.execute("PRAGMA user_version;").fetchone()[0] == len(local_history.MIGRATIONS)
+        assert conn.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+
+
+def test_log_weather_is_queued_and_batched(monkeypatch):
+    # While the DB is busy, logging still returns at once; the rows are then
+    # committed in a few batches, none lost.
+
+    init_db()
+    batches = []
+    original = local_history._write_batch
+    monkeypatch.setattr(local_history, "_write_batch", lambda batch: batches.append(len(batch)) or original(batch))
+
+    with local_history._lock:
+        start = time.perf_counter()
+        for i in range(50):
+            _log(city=f"City{i}")
+        assert time.perf_counter() - start < 0.5
+
+    # Reads flush first, so they see every row just logged.
+    rows = local_history.fetch_history(limit=200)
+    assert len(rows) == 50
+    assert sum(batches) == 50 and len(batches) <= 3
+
+
+def test_rows_that_cant_be_saved_yet_are_kept_and_reported(monkeypatch):
+    # A DB that stays locked past every retry: flush() says so, and nothing is dropped.
+
+    init_db()
+    original = local_history._commit
+
+    def locked(path, rows):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(local_history, "_commit", locked)
+    _log(city="Leeds")
+    _log(city="York")
+
+    with pytest.raises(sqlite3.OperationalError, match="2 history rows not saved yet: database is locked"):
+        local_history.flush()
+    assert local_history.fetch_history() == []
+
+    # Once the DB is free again, the kept rows go first, in order.
+    monkeypatch.setattr(local_history, "_commit", original)
+    _log(city="Hull")
+    local_history.flush()
+    assert [r["city"] for r in local_history.fetch_history()] == ["Hull", "York", "Leeds"]
+
+
+def test_a_bad_row_doesnt_stop_the_writer():
+    init_db()
+    _log(city="Leeds")
+    _log(city="Bad", temp={"not": "a number"})
+    _log(city="York")
+
+    with pytest.raises(sqlite3.OperationalError, match="1 history rows not saved yet"):
+        local_history.flush()
+    assert [r["city"] for r in local_history.fetch_history()] == ["York", "Leeds"]
+
+    # Later rows are still written.
+    _log(city="Hull")
+    with pytest.raises(sqlite3.OperationalError):
+        local_history.flush()
+    assert local_history.fetch_history()[0]["city"] == "Hull"
+
+    with local_history._parked_lock:
+        local_history._parked.clear()
+
+
+def test_queued_rows_survive_ctrl_c_at_exit(tmp_path):
+    # KeyboardInterrupt right after logging: the atexit flush still commits the rows.
+
+    script = (
+        "from src.data.local_history import log_weather\n"
+        "for i in range(20):\n"
+        "    log_weather(query_type='city', city=f'C{i}', postal=None, country='US',\n"
+        "                units='metric', lang='en', data={'name': f'C{i}'})\n"
+        "raise KeyboardInterrupt\n"
+    )
+    env = dict(os.environ, LOCALAPPDATA=str(tmp_path / "appdata"))
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, timeout=60)
+
+    conn = sqlite3.connect(tmp_path / "appdata" / "weather_application" / "weather_history.sqlite")
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM weather_history;").fetchone()[0] == 20
+    finally:
+        conn.close()
+
+
+def _log_desc(city, description):
+    log_weather(
+        query_type="city", city=city, postal=None, country="JP", units="metric", lang="ja",
+        description_override=description, data={"name": city},
+    )
+
+
+def test_search_ranks_exact_then_prefix_then_substring():
+    init_db()
+    _log_desc("Rainier", "clear sky")        # prefix of a word
+    _log_desc("Tokyo", "light rain")         # word prefix ("rain" starts a word)
+    _log_desc("Bahrain", "clear sky")        # substring
+    _log_desc("Rain", "clear sky")           # exact
+
+    cities = [r["city"] for r in local_history.search_history("RAIN")]
+    assert cities[0] == "Rain"
+    assert set(cities[1:3]) == {"Rainier", "Tokyo"}
+    assert cities[3] == "Bahrain"
+
+
+def test_search_finds_japanese_substrings():
+    init_db()
+    _log_desc("東京", "雷雨（小雨）")
+    _log_desc("大阪", "小雨")
+    _log_desc("札幌", "快晴")
+
+    assert [r["city"] for r in local_history.search_history("小雨")] == ["大阪", "東京"]
+    assert {r["city"] for r in local_history.search_history("雨")} == {"東京", "大阪"}
+    assert local_history.search_history("曇") == []
+
+
+def test_search_index_is_incremental_and_rebuildable():
+    init_db()
+    _log_desc("Osaka", "mist")
+    assert len(local_history.search_history("osaka")) == 1
+
+    # New rows are indexed as they're written.
+    _log_desc("Osaka", "mist")
+    assert len(local_history.search_history("osaka")) == 2
+
+    sidecar = search_index.sidecar_path(db_path())
+    assert sidecar.exists() and sidecar.parent == db_path().parent
+
+    # A lost sidecar is rebuilt from the history on next open.
+    local_history.close_db()
+    sidecar.unlink()
+    assert len(local_history.search_history("osaka")) == 2
+
+    # So is a corrupt one.
+    local_history.close_db()
+    for suffix in ("-wal", "-shm"):
+        Path(str(sidecar) + suffix).unlink(missing_ok=True)
+    sidecar.write_bytes(b"not a database" * 100)
+    assert len(local_history.search_history("osaka")) == 2
+
+
+def test_history_search_benchmark_runs_small():
+    # Keeps benchmarks/history_search.py working; the 1M-row check is run by hand.
+    from benchmarks.history_search import run
+
+    result = run(5000)
+    assert result["rows"] == 5000
+    assert result["max_ms"] < 100
+
+
+def _insert_rows(rows):
+    # (created_utc, query_type, country, lang, temp, humidity, wind_speed) rows, straight into the DB.
+
+    with local_history._lock:
+        conn = local_history._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO weather_history (created_utc, query_type, city, country, units, lang, "
+                "temp, humidity, wind_speed) VALUES (?, ?, 'X', ?, 'metric', ?, ?, ?, ?);",
+                rows,
+            )
+
+
+def test_query_history_filters_and_pages_by_keyset():
+    init_db()
+    _insert_rows(
+        [(f"2026-01-{day:02d}T12:00:00+00:00", "city", "JP", "ja", float(day), 50 + day, 1.0) for day in range(1, 31)]
+        + [("2026-01-15T12:00:00+00:00", "postal", "US", "en", 15.0, 65, 9.0)]
+    )
+
+    rows, cursor = local_history.query_history(country="jp", temp_min=10, temp_max=19.5, limit=4)
+    assert [r["temp"] for r in rows] == [19.0, 18.0, 17.0, 16.0]
+
+    # Each page starts right after the previous one's last row; the last has no cursor.
+    seen = [r["temp"] for r in rows]
+    while cursor:
+        rows, cursor = local_history.query_history(country="jp", temp_min=10, temp_max=19.5, limit=4, after=cursor)
+        seen += [r["temp"] for r in rows]
+    assert seen == [float(t) for t in range(19, 9, -1)]
+
+    rows, _ = local_history.query_history(
+        since=datetime(2026, 1, 10), until="2026-01-12T00:00:00+00:00", oldest_first=True
+    )
+    assert [r["created_utc"][:10] for r in rows] == ["2026-01-10", "2026-01-11"]
+
+    rows, _ = local_history.query_history(query_type="postal", lang="en", wind_min=5, humidity_max=70)
+    assert [r["country"] for r in rows] == ["US"]
+
+    # Ties on created_utc are split by id, so nothing is skipped or repeated across pages.
+    first, cursor = local_history.query_history(since="2026-01-15T00:00:00", until="2026-01-16T00:00:00", limit=1)
+    second, cursor2 = local_history.query_history(
+        since="2026-01-15T00:00:00", until="2026-01-16T00:00:00", limit=1, after=cursor
+    )
+    assert {first[0]["country"], second[0]["country"]} == {"JP", "US"} and cursor2 is None
+
+
+def test_no_history_filter_combination_scans_the_table():
+    # Every combination of filters (plus a page cursor, both sort orders) must be
+    # answered from an index: a SEARCH on one, or an in-order index walk that
+    # stops at LIMIT. A bare "SCAN weather_history" would read every row.
+
+    init_db()
+    sample = {
+        "since": "2026-01-01", "until": "2026-02-01", "country": "JP", "query_type": "city",
+        "lang": "ja", "temp_min": 0, "temp_max": 30, "humidity_min": 10, "humidity_max": 90,
+        "wind_min": 0, "wind_max": 20,
+    }
+    equality = {"country", "query_type", "lang"}
+
+    with local_history._lock:
+        conn = local_history._connect()
+
+        for size in range(len(sample) + 1):
+            for keys in itertools.combinations(sample, size):
+                for oldest_first in (False, True):
+                    for after in (None, "2026-01-15T00:00:00+00:00|7"):
+                        sql, params = local_history._history_query(
+                            {k: sample[k] for k in keys}, oldest_first=oldest_first, after=after
+                        )
+                        plan = [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+                        scans = [d for d in plan if d.startswith("SCAN")]
+
+                        assert all("USING INDEX idx_wh_created" in d for d in scans), (keys, plan)
+                        if equality & set(keys) or after or {"since", "until"} & set(keys):
+                            assert not scans, (keys, plan)
+
+
+def test_parse_filters():
+    from src.functions.history_filters import parse_filters
+
+    filters, oldest_first = parse_filters("country=jp type=city temp>=20 humidity = 80 until=2026-01-31 sort=oldest")
+    assert filters == {
+        "country": "jp", "query_type": "city", "temp_min": 20.0,
+        "humidity_min": 80.0, "humidity_max": 80.0, "until": datetime(2026, 2, 1),
+    }
+    assert oldest_first
+
+    for bad in ("temp>warm", "colour=red", "country>=jp", "type=town", "just words"):
+        with pytest.raises(ValueError):
+            parse_filters(bad)
+
+    # Typed in the units shown, compared in metric like the stored rows.
+    filters, _ = parse_filters("temp>=68 wind<=22.37 humidity>=50", units="imperial")
+    assert filters == {"temp_min": 20.0, "wind_max": 10.0, "humidity_min": 50.0}
@@ -0,0 +1,42 @@
+import os, json
+from benchmarks import micro
+
+
+def _doc(**ns):
+    return {"format": micro.FORMAT, "results": {name: {"ns": v} for name, v in ns.items()}}
+
+
+def test_micro_benchmarks_run_small_and_offline():
+    # Keeps benchmarks/micro.py working; real baselines are made by running it.
+    db = os.environ["WEATHER_DB_PATH"]
+
+    doc = micro.run(["describe.extract_ja", "country.alpha2", "proxy.rate_limit", "history.log_weather"],
+                    repeat=1, min_time=0.001)
+
+    assert set(doc["results"]) == {"describe.extract_ja", "country.alpha2", "proxy.rate_limit", "history.log_weather"}
+    assert all(r["ns"] > 0 and r["loops"] >= 1 for r in doc["results"].values())
+
+    # Temp DBs only, and the proxy's limits are back as they were.
+    assert os.environ["WEATHER_DB_PATH"] == db
+    import proxy.server as server
+    assert server.PROXY_WORKERS == 1 and not server._hits
+
+
+def test_compare_flags_only_slowdowns_past_the_threshold():
+    result = micro.compare(_doc(a=100, b=100, c=100, gone=5), _doc(a=109, b=125, c=70, added=1), threshold=0.10)
+
+    assert result["regressions"] == ["b"]
+    assert result["benchmarks"]["a"]["status"] == "same"
+    assert result["benchmarks"]["c"]["status"] == "faster"
+    assert result["missing"] == ["gone"] and result["new"] == ["added"]
+
+
+def test_compare_command_exits_1_on_a_regression(tmp_path):
+    base, cur = tmp_path / "base.json", tmp_path / "cur.json"
+    base.write_text(json.dumps(_doc(**{"country.alpha2": 1000})))
+
+    cur.write_text(json.dumps(_doc(**{"country.alpha2": 1300})))
+    assert micro.main(["compare", "--baseline", str(base), "--current", str(cur)]) == 1
+    assert micro.main(["compare", "--baseline", str(base), "--current", str(cur), "--threshold", "0.5"]) == 0
+
+    assert micro.main(["compare", "--baseline", str(tmp_path / "none.json")]) == 2
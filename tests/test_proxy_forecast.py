@@ -0,0 +1,172 @@
+import math, asyncio, httpx, pytest
+import proxy.server as server
+import proxy.stub_upstream as stub
+from proxy import forecast
+from proxy.server import app as proxy_app
+
+_RealAsyncClient = httpx.AsyncClient
+
+
+@pytest.fixture
+def stub_upstream(monkeypatch):
+    # The proxy's live backend, talking to the stub OpenWeather in-process.
+
+    stub.calls.clear()
+    stub._cities.clear()
+
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "stubkey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    monkeypatch.setattr(server, "DAILY_LIMIT", 10_000)
+    monkeypatch.setattr(server, "OPENWEATHER_RATE_LIMIT_PER_MIN", 10_000)
+    monkeypatch.setattr(server, "_hits", server.defaultdict(server.deque))
+    monkeypatch.setattr(server, "_usage_day", None)
+    monkeypatch.setattr(server, "_usage_count", 0)
+    monkeypatch.setattr(server, "_upstream", None)
+    monkeypatch.setattr(server, "_batcher", None)
+    monkeypatch.setattr(
+        server.httpx, "AsyncClient",
+        lambda timeout=8: _RealAsyncClient(transport=httpx.ASGITransport(app=stub.app), timeout=timeout),
+    )
+    return stub
+
+
+def _get(path, **params):
+    async def run():
+        transport = httpx.ASGITransport(app=proxy_app)
+        async with _RealAsyncClient(transport=transport, base_url="http://proxy") as client:
+            return await client.get(path, params=params)
+    return asyncio.run(run())
+
+
+def _forecast(steps):
+    # steps: [(dt, temp, wind_deg, weather id)]
+    return {
+        "city": {"id": 7, "name": "Testville", "coord": {"lat": 1.0, "lon": 2.0}, "country": "GB"},
+        "list": [
+            {
+                "dt": dt,
+                "main": {"temp": temp, "feels_like": temp, "humidity": 50, "pressure": 1000},
+                "wind": {"speed": 4.0, "deg": deg},
+                "weather": [{"id": wid, "description": {800: "clear sky", 500: "light rain"}[wid]}],
+                "pop": 0.5,
+            }
+            for dt, temp, deg, wid in steps
+        ],
+    }
+
+
+def test_compact_round_trips_every_step():
+    data = stub.forecast("London", "GB", 2643743)
+    fc = forecast.compact(data)
+
+    assert fc.dt.typecode == "q" and fc.fields["temp"].typecode == "f"
+    steps = forecast.render(fc, "metric", "en")
+    assert len(steps) == 40
+
+    for original, step in zip(data["list"], steps):
+        assert step["dt"] == original["dt"]
+        assert step["main"]["temp"] == pytest.approx(original["main"]["temp"], abs=0.01)
+        assert step["wind"]["deg"] == original["wind"]["deg"]
+        assert step["weather"][0]["description"] == original["weather"][0]["description"]
+
+
+def test_compact_rejects_a_forecast_without_steps():
+    with pytest.raises(ValueError):
+        forecast.compact({"city": {}, "list": []})
+
+
+def test_nowcast_interpolates_between_steps():
+    fc = forecast.compact(_forecast([(1000, 10.0, 350, 800), (1000 + forecast.STEP_SEC, 20.0, 10, 500)]))
+
+    now = forecast.nowcast(fc, 1000 + forecast.STEP_SEC / 4)
+    assert now["main"]["temp"] == pytest.approx(12.5)
+    # 350° -> 10° goes through north, not south.
+    assert now["wind"]["deg"] == pytest.approx(355.0)
+    assert now["weather"][0]["description"] == "clear sky"
+    assert now["name"] == "Testville" and now["id"] == 7
+
+    later = forecast.nowcast(fc, 1000 + forecast.STEP_SEC * 3 / 4)
+    assert later["wind"]["deg"] == pytest.approx(5.0)
+    assert later["weather"][0]["description"] == "light rain"
+
+    # Outside the forecast there's nothing to interpolate from.
+    assert forecast.nowcast(fc, 1000 - forecast.STEP_SEC - 1) is None
+    assert forecast.nowcast(fc, 1000 + forecast.STEP_SEC + 1) is None
+
+
+def test_missing_values_stay_missing():
+    data = _forecast([(1000, 10.0, 90, 800)])
+    del data["list"][0]["main"]["temp"]
+
+    fc = forecast.compact(data)
+    assert math.isnan(fc.fields["temp"][0])
+    assert forecast.render(fc, "imperial", "en")[0]["main"]["temp"] is None
+
+
+def test_one_upstream_forecast_serves_every_units_and_language(stub_upstream):
+    metric = _get("/forecast", city="London", country="gb")
+    assert metric.status_code == 200
+    imperial = _get("/forecast", city="london", country="GB", units="imperial", lang="ja")
+
+    assert stub_upstream.calls == {"forecast": 1}
+
+    m, i = metric.json()["list"][0], imperial.json()["list"][0]
+    assert i["main"]["temp"] == pytest.approx(m["main"]["temp"] * 1.8 + 32, abs=0.02)
+    assert metric.json()["city"]["name"] == "London"
+    assert len(metric.json()["list"]) == 40
+
+
+def test_forecast_cache_expires(stub_upstream, monkeypatch):
+    monkeypatch.setattr(server, "_forecast_cache", server.TTLCache(0.0, 10))
+
+    _get("/forecast", city="London", country="gb")
+    _get("/forecast", city="London", country="gb")
+
+    assert stub_upstream.calls == {"forecast": 2}
+
+
+def test_forecast_nowcast_is_shaped_like_weather(stub_upstream):
+    # The stub's forecast starts at the next 3-hour boundary, so "now" is always covered.
+    r = _get("/forecast", city="London", country="gb", nowcast="true")
+    assert r.status_code == 200
+
+    body = r.json()
+    assert body["nowcast"] is True
+    assert body["name"] == "London"
+    assert set(body) >= {"main", "wind", "weather", "sys", "dt"}
+
+
+def test_weather_serves_a_nowcast_when_the_daily_budget_is_nearly_spent(stub_upstream, monkeypatch):
+    monkeypatch.setattr(server, "DAILY_LIMIT", 10)
+    monkeypatch.setattr(server, "NOWCAST_AT_USAGE", 0.5)
+
+    # Learns the location (and its city id) and caches its forecast.
+    _get("/forecast", city="Paris", country="fr")
+
+    first = _get("/weather", city="Paris", country="fr")
+    assert "nowcast" not in first.json()
+    assert stub_upstream.calls == {"forecast": 1, "group": 1}
+
+    # Half the budget spent: the next miss is answered from the forecast.
+    server._weather_cache.clear()
+    monkeypatch.setattr(server, "_usage_count", 5)
+
+    second = _get("/weather", city="Paris", country="fr", units="imperial")
+    assert second.status_code == 200
+    assert second.json()["nowcast"] is True
+    assert stub_upstream.calls == {"forecast": 1, "group": 1}
+
+    # Not an observation: nothing new in history.
+    assert len(server._db_fetch_history(10)) == 1
+
+
+def test_nowcasts_can_be_turned_off(stub_upstream, monkeypatch):
+    monkeypatch.setattr(server, "DAILY_LIMIT", 10)
+    monkeypatch.setattr(server, "NOWCAST_AT_USAGE", 0)
+
+    _get("/forecast", city="Paris", country="fr")
+    monkeypatch.setattr(server, "_usage_count", 5)
+
+    r = _get("/weather", city="Paris", country="fr")
+    assert "nowcast" not in r.json()
+    assert stub_upstream.calls == {"forecast": 1, "group": 1}
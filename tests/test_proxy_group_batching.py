@@ -0,0 +1,131 @@
+import asyncio, httpx, pytest
+import proxy.server as server
+import proxy.stub_upstream as stub
+from proxy.server import app as proxy_app
+from proxy.batching import GroupBatcher
+
+CITIES = ["London,gb", "Paris,fr", "Tokyo,jp", "Lima,pe"]
+
+_RealAsyncClient = httpx.AsyncClient
+
+
+@pytest.fixture
+def stub_upstream(monkeypatch):
+    # The proxy's live backend, talking to the stub OpenWeather in-process.
+
+    stub.calls.clear()
+    stub._cities.clear()
+
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "stubkey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    monkeypatch.setattr(server, "DAILY_LIMIT", 10_000)
+    monkeypatch.setattr(server, "OPENWEATHER_RATE_LIMIT_PER_MIN", 10_000)
+    monkeypatch.setattr(server, "_hits", server.defaultdict(server.deque))
+    monkeypatch.setattr(server, "_upstream", None)
+    monkeypatch.setattr(server, "_batcher", None)
+    monkeypatch.setattr(
+        server.httpx, "AsyncClient",
+        lambda timeout=8: _RealAsyncClient(transport=httpx.ASGITransport(app=stub.app), timeout=timeout),
+    )
+    return stub
+
+
+async def _get_all(lines):
+    transport = httpx.ASGITransport(app=proxy_app)
+    async with _RealAsyncClient(transport=transport, base_url="http://proxy") as client:
+        responses = await asyncio.gather(*(
+            client.get("/weather", params={"city": c, "country": cc})
+            for c, cc in (line.split(",") for line in lines)
+        ))
+    return [r.json() for r in responses]
+
+
+def test_concurrent_misses_for_known_cities_share_one_group_call(stub_upstream):
+    # First lookups learn the city ids (one q= call each).
+    first = asyncio.run(_get_all(CITIES))
+    assert stub_upstream.calls == {"weather": 4}
+
+    # Cache cleared: the same cities again, all at once -> one group call.
+    server._weather_cache.clear()
+    stub_upstream.calls.clear()
+
+    again = asyncio.run(_get_all(CITIES))
+    assert stub_upstream.calls == {"group": 1}
+    assert [r["name"] for r in again] == [r["name"] for r in first]
+    assert [r["main"] for r in again] == [r["main"] for r in first]
+
+
+def test_unresolved_and_missing_ids_fall_back_to_single_calls(stub_upstream):
+    asyncio.run(_get_all(CITIES[:2]))
+
+    # The stub forgets Paris: the group call leaves it out, so it's asked for alone
+    # (and reported the same way as without batching).
+    server._weather_cache.clear()
+    stub_upstream.calls.clear()
+    paris_id = next(i for i, (name, _) in stub_upstream._cities.items() if name == "Paris")
+    del stub_upstream._cities[paris_id]
+
+    transport = httpx.ASGITransport(app=proxy_app)
+
+    async def run():
+        async with _RealAsyncClient(transport=transport, base_url="http://proxy") as client:
+            return await asyncio.gather(
+                client.get("/weather", params={"city": "London", "country": "gb"}),
+                client.get("/weather", params={"city": "Paris", "country": "fr"}),
+                client.get("/weather", params={"city": "Oslo", "country": "no"}),     # never seen: no id yet
+            )
+
+    london, paris, oslo = asyncio.run(run())
+    assert london.status_code == 200 and oslo.status_code == 200
+    assert paris.status_code == 404
+    assert stub_upstream.calls == {"group": 1, "weather": 2}
+
+
+def test_batching_can_be_turned_off(stub_upstream, monkeypatch):
+    monkeypatch.setattr(server, "GROUP_WINDOW_MS", 0)
+
+    asyncio.run(_get_all(CITIES))
+    server._weather_cache.clear()
+    asyncio.run(_get_all(CITIES))
+
+    assert stub_upstream.calls == {"weather": 8}
+
+
+def test_batcher_sends_full_groups_without_waiting():
+    sent = []
+
+    async def fetch_group(ids):
+        sent.append(ids)
+        return {i: {"id": i} for i in ids if i != 7}
+
+    async def run():
+        batcher = GroupBatcher(fetch_group, window=60.0, max_ids=4)
+        # A full group goes out at once; the 60 s window never matters.
+        # The same id twice is one slot, shared.
+        return await asyncio.wait_for(
+            asyncio.gather(*(batcher.get(i) for i in (9, 7, 8, 8, 6))),
+            timeout=5,
+        )
+
+    results = asyncio.run(run())
+    assert sent == [[6, 7, 8, 9]]
+    assert results == [{"id": 9}, None, {"id": 8}, {"id": 8}, {"id": 6}]
+
+
+def test_batcher_hands_errors_to_every_waiter():
+    async def fetch_group(ids):
+        raise RuntimeError("upstream down")
+
+    async def run():
+        batcher = GroupBatcher(fetch_group, window=0.001)
+        return await asyncio.gather(batcher.get(1), batcher.get(2), return_exceptions=True)
+
+    assert [str(r) for r in asyncio.run(run())] == ["upstream down", "upstream down"]
+
+
+def test_stub_requires_an_api_key_and_caps_groups():
+    from fastapi.testclient import TestClient
+
+    client = TestClient(stub.app)
+    assert client.get("/data/2.5/weather?q=London,GB").status_code == 401
+    assert client.get("/data/2.5/group", params={"appid": "k", "id": ",".join(map(str, range(21)))}).status_code == 400
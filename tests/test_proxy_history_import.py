@@ -0,0 +1,202 @@
+import io, json, sqlite3, pytest
+import proxy.server as server
+from fastapi.testclient import TestClient
+from proxy.server import app as proxy_app
+from proxy.history_import import HistoryImporter, parse_observation
+
+
+def _obs(**overrides):
+    row = {
+        "created_utc": "2025-01-01T00:00:00+00:00",
+        "city": "London",
+        "country": "gb",
+        "units": "metric",
+        "name": "London",
+        "description": "few clouds",
+        "temp": 4.2,
+        "humidity": 81,
+        "wind_speed": 3.1,
+    }
+    row.update(overrides)
+    return row
+
+
+def test_parse_observation_validates_fields():
+    row = parse_observation(_obs())
+    assert row[1] == "city"
+    assert row[4] == "GB"
+
+    for bad in (
+        _obs(created_utc="yesterday"),
+        _obs(country="GBR"),
+        _obs(city=None),
+        _obs(units="kelvin"),
+        _obs(temp="warm"),
+        _obs(humidity=True),
+        _obs(humidity=float("inf")),
+        _obs(temp=float("nan")),
+        _obs(wind_speed=10 ** 400),
+        ["not", "an", "object"],
+    ):
+        with pytest.raises(ValueError):
+            parse_observation(bad)
+
+
+def test_parse_observation_stores_canonical_units():
+    row = parse_observation(_obs(units="imperial", temp=50.0, wind_speed=10.0, raw={"main": {"temp": 50.0}}))
+    assert row[5] == "metric"
+    assert row[8] == 10.0
+    assert row[10] == 4.47
+    assert json.loads(row[11]) == {"main": {"temp": 10.0}}
+
+    row = parse_observation(_obs(units="standard", temp=273.15, wind_speed=3.1))
+    assert (row[5], row[8], row[10]) == ("metric", 0.0, 3.1)
+
+
+def test_import_requires_configured_tokens(monkeypatch):
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    client = TestClient(proxy_app)
+    assert client.post("/history/import", content=b"").status_code == 403
+
+    monkeypatch.setattr(server, "PROXY_TOKENS", {"tok"}, raising=False)
+    assert client.post("/history/import", content=b"").status_code == 401
+
+
+def test_import_endpoint_streams_progress_and_inserts(monkeypatch):
+    monkeypatch.setattr(server, "PROXY_TOKENS", {"tok"}, raising=False)
+
+    lines = [json.dumps(_obs(temp=float(i))) for i in range(5)]
+    lines.insert(2, "{not json")
+    lines.append(json.dumps(_obs(country="nowhere")))
+    body = ("\n".join(lines) + "\n").encode("utf-8")
+
+    client = TestClient(proxy_app)
+    r = client.post(
+        "/history/import?batch_rows=2&defer_indexes=true",
+        content=body,
+        headers={"Authorization": "Bearer tok"},
+    )
+    assert r.status_code == 200
+
+    progress = [json.loads(line) for line in r.text.splitlines() if line.strip()]
+    final = progress[-1]
+
+    assert final["done"] is True
+    assert final["imported"] == 5
+    assert final["rejected"] == 2
+    assert [e["line"] for e in final["errors"]] == [3, 7]
+    assert len(progress) > 2
+
+    conn = sqlite3.connect(server._db_path())
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM weather_history;").fetchone()[0] == 5
+        # Deferred indexes are back after the import.
+        names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index';")}
+        assert "idx_weather_history_created" in names
+    finally:
+        conn.close()
+
+
+def test_deferred_indexes_keep_the_sync_dedupe_index():
+    # Uploads may arrive mid-import; their unique index must stay in place.
+
+    server._db_init()
+    conn = server._db_connect()
+    try:
+        importer = HistoryImporter(conn, batch_rows=1, defer_indexes=True)
+        body = io.BytesIO(b"\n".join(json.dumps(_obs(temp=float(i))).encode() for i in range(3)))
+        importer.import_batch(body)
+        importer.import_batch(body)
+
+        names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index';")}
+        assert "idx_weather_history_device" in names
+        assert "idx_weather_history_created" not in names
+
+        assert importer.run(body)["done"] is True
+        names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index';")}
+        assert "idx_weather_history_created" in names
+    finally:
+        conn.close()
+
+
+def test_import_reports_db_failure_as_final_line(monkeypatch):
+    # A failing batch must end the stream with done=false and the error, not just stop.
+
+    monkeypatch.setattr(server, "PROXY_TOKENS", {"tok"}, raising=False)
+
+    def locked(self, fh):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(HistoryImporter, "import_batch", locked)
+
+    client = TestClient(proxy_app)
+    r = client.post("/history/import", content=json.dumps(_obs()).encode(), headers={"Authorization": "Bearer tok"})
+
+    final = json.loads(r.text.splitlines()[-1])
+    assert final["done"] is False
+    assert "database is locked" in final["error"]
+
+
+def test_importer_rejects_oversized_lines():
+    conn = server._db_connect()
+    try:
+        body = b"\n".join([
+            json.dumps(_obs()).encode(),
+            b'{"pad": "' + b"x" * 500 + b'"}',
+            json.dumps(_obs(temp=2.0)).encode(),
+        ])
+        result = HistoryImporter(conn, max_line_bytes=300).run(io.BytesIO(body))
+    finally:
+        conn.close()
+
+    assert result["imported"] == 2
+    assert result["errors"] == [{"line": 2, "error": "line longer than 300 bytes"}]
+
+
+def test_importer_counts_non_finite_values_as_rejected():
+    # JSON allows Infinity; it's one bad line, not a crashed import.
+
+    conn = server._db_connect()
+    try:
+        body = b"\n".join([
+            json.dumps(_obs()).encode(),
+            json.dumps(_obs(humidity=float("inf"))).encode(),
+        ])
+        result = HistoryImporter(conn).run(io.BytesIO(body))
+    finally:
+        conn.close()
+
+    assert result["done"] is True
+    assert result["imported"] == 1
+    assert result["errors"] == [{"line": 2, "error": "humidity must be a finite number"}]
+
+
+def test_importer_links_known_locations():
+    server._db_init()
+    server._db_learn_location("city:london|GB", {"id": 2643743, "name": "London", "coord": {"lat": 51.5, "lon": -0.12}})
+
+    body = "\n".join([
+        json.dumps(_obs(city="  LONDON ")),
+        json.dumps(_obs(city="Paris", country="fr")),
+    ]).encode()
+
+    conn = server._db_connect()
+    try:
+        result = HistoryImporter(conn).run(io.BytesIO(body))
+        ids = [r[0] for r in conn.execute("SELECT location_id FROM weather_history ORDER BY id;")]
+    finally:
+        conn.close()
+
+    assert result["done"] is True
+    assert ids[0] is not None
+    assert ids[1] is None
+
+
+def test_import_throughput_benchmark_runs_small():
+    # Keeps benchmarks/import_throughput.py working; the real target (100k rows/s) is checked by running it.
+    from benchmarks.import_throughput import run
+
+    result = run(2000, batch_rows=500)
+    assert result["done"] is True
+    assert result["imported"] == 2000
+    assert result["rows_per_sec"] > 0
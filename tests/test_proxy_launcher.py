@@ -0,0 +1,177 @@
+import time, asyncio, sqlite3, threading, pytest
+import proxy.server as server
+import proxy.__main__ as launcher
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from proxy.server import app as proxy_app
+from proxy import shared_state
+from proxy.shared_state import SharedState
+
+
+def test_build_config_falls_back_without_uvloop_or_httptools(monkeypatch):
+    monkeypatch.setattr(launcher, "_has_module", lambda name: False)
+    monkeypatch.setattr(launcher, "_cpu_count", lambda: 6)
+    monkeypatch.delenv("PROXY_WORKERS", raising=False)
+    monkeypatch.delenv("UPSTREAM_MODE", raising=False)
+
+    config = launcher.build_config([])
+
+    assert config["loop"] == "asyncio"
+    assert config["http"] == "h11"
+    assert config["workers"] == 6
+    assert config["backlog"] >= 1
+    assert config["limit_concurrency"] >= 1
+
+
+def test_build_config_uses_fast_loop_when_installed(monkeypatch):
+    monkeypatch.setattr(launcher, "_has_module", lambda name: True)
+
+    config = launcher.build_config(["--workers", "3", "--keep-alive", "20", "--port", "9000"])
+
+    assert config["loop"] == "uvloop"
+    assert config["http"] == "httptools"
+    assert config["workers"] == 3
+    assert config["timeout_keep_alive"] == 20
+    assert config["port"] == 9000
+
+
+def test_record_mode_forces_single_worker(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_MODE", "record")
+    assert launcher.build_config(["--workers", "8"])["workers"] == 1
+
+
+def test_daily_limit_is_shared_through_db_with_multiple_workers(monkeypatch):
+    # Two workers would each see the same DB counter, so the global limit holds.
+
+    monkeypatch.setattr(server, "PROXY_WORKERS", 2)
+    monkeypatch.setattr(server, "DAILY_LIMIT", 3)
+
+    for _ in range(3):
+        server._enforce_daily_limit()
+
+    with pytest.raises(HTTPException) as exc:
+        server._enforce_daily_limit()
+
+    assert exc.value.status_code == 429
+
+
+def test_quota_leases_hold_the_limit_with_few_writes(monkeypatch):
+    # Two workers drain one limit: never more than the limit in total,
+    # and SQLite is written once per leased block, not once per request.
+
+    a = SharedState(server._db_connect, workers=2)
+    b = SharedState(server._db_connect, workers=2)
+
+    leases = []
+    for state in (a, b):
+        original = state._lease
+        monkeypatch.setattr(state, "_lease", lambda *args, _f=original: leases.append(1) or _f(*args))
+
+    allowed = 0
+    for _ in range(100):
+        allowed += a.take("daily", 80, "2026-01-01", expires=time.time() + 60)
+        allowed += b.take("daily", 80, "2026-01-01", expires=time.time() + 60)
+
+    assert allowed == 80
+    assert len(leases) <= 80 // 10 + 2
+
+
+def test_small_limits_still_lease_more_than_one_request(monkeypatch):
+    # 60/min over 4 workers: blocks of MIN_LEASE, not a write per request.
+
+    state = SharedState(server._db_connect, workers=4)
+    leases = []
+    original = state._lease
+    monkeypatch.setattr(state, "_lease", lambda *args: leases.append(1) or original(*args))
+
+    allowed = sum(state.take("rate", 60, "12:00", expires=time.time() + 60) for _ in range(60))
+
+    assert allowed == 60
+    assert len(leases) <= 60 // shared_state.MIN_LEASE + 1
+
+
+def test_rate_limit_is_shared_between_workers(monkeypatch):
+    monkeypatch.setattr(server, "PROXY_WORKERS", 2)
+
+    server._enforce_rate_limit("tok:abc", 4)
+    server._enforce_rate_limit("tok:abc", 4)
+
+    # A second worker process: same DB, its own SharedState.
+    monkeypatch.setattr(server, "_shared", SharedState(server._db_connect, workers=2))
+    server._enforce_rate_limit("tok:abc", 4)
+    server._enforce_rate_limit("tok:abc", 4)
+
+    with pytest.raises(HTTPException) as exc:
+        server._enforce_rate_limit("tok:abc", 4)
+    assert exc.value.status_code == 429
+
+    # Tokens never reach the DB.
+    conn = sqlite3.connect(server._db_path())
+    try:
+        names = [r[0] for r in conn.execute("SELECT name FROM quota_leases;")]
+    finally:
+        conn.close()
+    assert names and not any("abc" in n for n in names)
+
+
+def test_unauthorized_requests_never_touch_shared_quota(monkeypatch):
+    monkeypatch.setattr(server, "PROXY_WORKERS", 2)
+    monkeypatch.setattr(server, "PROXY_TOKENS", {"goodtoken"}, raising=False)
+
+    server._db_init()
+    client = TestClient(proxy_app)
+    assert client.get("/weather?city=London").status_code == 401
+
+    conn = sqlite3.connect(server._db_path())
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM quota_leases;").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_shared_fetch_runs_once_across_workers():
+    # Two workers miss the same key at once: one fetches, the other reads its result.
+
+    a = SharedState(server._db_connect, workers=2)
+    b = SharedState(server._db_connect, workers=2)
+    calls, threads = [], set()
+
+    for state in (a, b):
+        original = state._claim
+        state._claim = lambda *args, _f=original: threads.add(threading.get_ident()) or _f(*args)
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return {"name": "London"}
+
+    async def both():
+        return await asyncio.gather(
+            a.fetch_once("k", fetch, ttl=60, poll=0.01),
+            b.fetch_once("k", fetch, ttl=60, poll=0.01),
+        )
+
+    assert asyncio.run(both()) == [{"name": "London"}, {"name": "London"}]
+    assert len(calls) == 1
+    # Polls and claims run off the event loop's thread.
+    assert threads and threading.get_ident() not in threads
+
+    # Later misses in any worker are served from the shared cache.
+    assert asyncio.run(b.fetch_once("k", fetch, ttl=60)) == {"name": "London"}
+    assert len(calls) == 1
+
+
+def test_failed_shared_fetch_releases_claim():
+    a = SharedState(server._db_connect, workers=2)
+
+    async def boom():
+        raise RuntimeError("upstream down")
+
+    async def ok():
+        return {"name": "London"}
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(a.fetch_once("k", boom, ttl=60))
+
+    # The next caller isn't stuck behind a dead claim.
+    assert asyncio.run(a.fetch_once("k", ok, ttl=60)) == {"name": "London"}
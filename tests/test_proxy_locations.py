@@ -0,0 +1,171 @@
+import asyncio, sqlite3
+import proxy.server as server
+from fastapi.testclient import TestClient
+from proxy.server import app as proxy_app
+from proxy.cache import TTLCache, Coalescer
+from proxy.locations import normalize_query
+
+
+class CountingAsyncClient:
+    # Fake httpx.AsyncClient that counts upstream calls and returns a London observation.
+    calls = []
+
+    def __init__(self, timeout=8):
+        self.timeout = timeout
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    async def get(self, url, params=None):
+        CountingAsyncClient.calls.append(dict(params or {}))
+        data = {
+            "id": 2643743,
+            "coord": {"lat": 51.5085, "lon": -0.1257},
+            "name": "London",
+            "sys": {"country": "GB"},
+            "main": {"temp": 1.0, "humidity": 90},
+            "wind": {"speed": 1.5},
+            "weather": [{"id": 801, "description": "few clouds"}],
+        }
+        return server.httpx.Response(200, json=data)
+
+
+def _setup(monkeypatch):
+    CountingAsyncClient.calls = []
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "dummykey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    monkeypatch.setattr(server, "_upstream", None)
+    monkeypatch.setattr(server, "UPSTREAM_MODE", "live")
+    monkeypatch.setattr(server.httpx, "AsyncClient", CountingAsyncClient)
+
+
+def test_normalize_query_variants_share_one_key():
+    keys = {
+        normalize_query("city", "london", "gb").key,
+        normalize_query("city", "  London ", "GB").key,
+        normalize_query("city", "LONDON,gb", "gb").key,
+        normalize_query("city", "ＬＯＮＤＯＮ", "gb").key,
+    }
+    assert keys == {"city:london|GB"}
+
+    # A trailing part that isn't the country stays in the text (US state, region...).
+    portland = normalize_query("city", "Portland,OR", "us")
+    assert (portland.text, portland.country) == ("Portland,OR", "US")
+    assert normalize_query("city", "LONDON,gb", "us").key == "city:london,gb|US"
+
+    # Postal keys are separate from city keys.
+    assert normalize_query("postal", " 22304 ", "us").key == "postal:22304|US"
+
+
+def test_city_spellings_hit_one_canonical_location(monkeypatch):
+    # After the first lookup, other spellings reuse the cached canonical observation.
+
+    _setup(monkeypatch)
+    client = TestClient(proxy_app)
+
+    for q in ("city=london&country=gb", "city=%20London%20&country=GB", "city=LONDON,gb&country=gb"):
+        r = client.get(f"/weather?{q}")
+        assert r.status_code == 200
+
+    assert len(CountingAsyncClient.calls) == 1
+    assert CountingAsyncClient.calls[0]["q"] == "london,GB"
+
+    conn = sqlite3.connect(server._db_path())
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM locations;").fetchone()[0] == 1
+        ids = {r[0] for r in conn.execute("SELECT location_id FROM weather_history;")}
+    finally:
+        conn.close()
+
+    assert len(ids) == 1 and None not in ids
+
+
+def test_known_location_is_fetched_by_city_id_after_expiry(monkeypatch):
+    _setup(monkeypatch)
+    client = TestClient(proxy_app)
+
+    assert client.get("/weather?city=London&country=gb").status_code == 200
+    server._weather_cache.clear()
+    assert client.get("/weather?city=london&country=gb").status_code == 200
+
+    # Asked for by id: through the group endpoint first (this fake doesn't answer
+    # groups, so the single call by id follows; see test_proxy_group_batching.py).
+    later = CountingAsyncClient.calls[1:]
+    assert [c["id"] for c in later] == ["2643743", 2643743]
+    assert all("q" not in c for c in later)
+
+
+def test_ttl_cache_expires_and_caps_size(monkeypatch):
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+
+    now = server.time.monotonic()
+    monkeypatch.setattr("proxy.cache.time.monotonic", lambda: now + 61)
+    assert cache.get("c") is None
+
+
+def test_coalescer_shares_one_call():
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def main():
+        c = Coalescer()
+        results = await asyncio.gather(*(c.run("k", slow) for _ in range(5)))
+        assert len(c) == 0
+        return results
+
+    assert asyncio.run(main()) == ["done"] * 5
+    assert len(calls) == 1
+
+
+def test_coalescer_waiter_takes_over_when_the_leader_is_cancelled():
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        c = Coalescer()
+        leader = asyncio.create_task(c.run("k", slow))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(c.run("k", slow)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        assert leader.cancelled()
+        return results
+
+    assert asyncio.run(main()) == ["done"] * 3
+    assert len(calls) == 2
+
+
+def test_postal_queries_stay_on_zip(monkeypatch):
+    # Even once the postal code is mapped, it's re-fetched by zip=, never by the city id.
+
+    _setup(monkeypatch)
+    client = TestClient(proxy_app)
+
+    assert client.get("/weather?postal=SW1A&country=gb").status_code == 200
+    server._weather_cache.clear()
+    assert client.get("/weather?postal=SW1A&country=gb").status_code == 200
+
+    assert [c.get("zip") for c in CountingAsyncClient.calls] == ["SW1A,GB", "SW1A,GB"]
+    assert all("id" not in c for c in CountingAsyncClient.calls)
+
+    # ...and it doesn't share the London city entry.
+    assert client.get("/weather?city=London&country=gb").status_code == 200
+    assert len(CountingAsyncClient.calls) == 3
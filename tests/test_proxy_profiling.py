@@ -0,0 +1,114 @@
+import pstats, threading
+import proxy.server as server
+from fastapi.testclient import TestClient
+from proxy.server import app as proxy_app
+from proxy.profiling import StackSampler, format_collapsed, format_server_timing
+
+
+class FakeAsyncClient:
+    # Stands in for httpx.AsyncClient so /weather never hits the network.
+    def __init__(self, timeout=8):
+        self.timeout = timeout
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    async def get(self, url, params=None):
+        data = {
+            "name": "London",
+            "main": {"temp": 1.0, "humidity": 90},
+            "wind": {"speed": 1.5},
+            "weather": [{"id": 801, "description": "few clouds"}],
+        }
+        return server.httpx.Response(200, json=data)
+
+
+def test_weather_response_has_server_timing_stages(monkeypatch):
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "dummykey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    monkeypatch.setattr(server, "_upstream", None)
+    monkeypatch.setattr(server, "UPSTREAM_MODE", "live")
+    monkeypatch.setattr(server.httpx, "AsyncClient", FakeAsyncClient)
+
+    client = TestClient(proxy_app)
+    r = client.get("/weather?city=London&country=gb")
+    assert r.status_code == 200
+
+    header = r.headers["server-timing"]
+    for name in ("auth;dur=", "ratelimit;dur=", "upstream;dur=", "parse;dur=", "db;dur=", "total;dur="):
+        assert name in header
+    assert 'cache;desc="miss"' in header
+
+
+def test_server_timing_on_error_responses(monkeypatch):
+    # Even a 400 carries the header (total at least).
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "dummykey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+
+    client = TestClient(proxy_app)
+    r = client.get("/weather")
+    assert r.status_code == 400
+    assert "total;dur=" in r.headers["server-timing"]
+
+    # ...and so does a 401 raised before any stage finishes.
+    monkeypatch.setattr(server, "PROXY_TOKENS", {"goodtoken"}, raising=False)
+    r = client.get("/weather?city=London")
+    assert r.status_code == 401
+    assert "total;dur=" in r.headers["server-timing"]
+
+
+def test_format_server_timing():
+    out = format_server_timing({"db": 1.234, "cache": "hit"}, 5.0)
+    assert out == 'db;dur=1.23, cache;desc="hit", total;dur=5.00'
+
+
+def test_admin_profile_requires_admin_token(monkeypatch):
+    client = TestClient(proxy_app)
+
+    # Disabled when no admin tokens are configured.
+    monkeypatch.setattr(server, "PROXY_ADMIN_TOKENS", set(), raising=False)
+    assert client.get("/admin/profile?seconds=0.1").status_code == 403
+
+    monkeypatch.setattr(server, "PROXY_ADMIN_TOKENS", {"admintoken"}, raising=False)
+    r = client.get("/admin/profile?seconds=0.1", headers={"Authorization": "Bearer wrong"})
+    assert r.status_code == 403
+
+
+def test_admin_profile_collapsed_and_pstats(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "PROXY_ADMIN_TOKENS", {"admintoken"}, raising=False)
+    headers = {"Authorization": "Bearer admintoken"}
+    client = TestClient(proxy_app)
+
+    r = client.get("/admin/profile?seconds=0.1&format=collapsed", headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert r.text.strip()
+
+    r = client.get("/admin/profile?seconds=0.1&format=pstats", headers=headers)
+    assert r.status_code == 200
+
+    dump = tmp_path / "proxy.pstats"
+    dump.write_bytes(r.content)
+    pstats.Stats(str(dump))
+
+    assert client.get("/admin/profile?format=svg", headers=headers).status_code == 400
+
+
+def test_stack_sampler_counts_stacks():
+    # Samples a busy helper thread; the sampler never records its own thread.
+    stop = threading.Event()
+    worker = threading.Thread(target=stop.wait, name="busy-worker")
+    worker.start()
+    try:
+        stacks = StackSampler(interval=0.001).sample(0.02)
+    finally:
+        stop.set()
+        worker.join()
+
+    text = format_collapsed(stacks)
+    assert "busy-worker" in text
+    assert text.endswith("\n")
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in text.splitlines())
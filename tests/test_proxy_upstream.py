@@ -0,0 +1,144 @@
+import gzip, json, asyncio, pytest
+import proxy.server as server
+from fastapi.testclient import TestClient
+from proxy.server import app as proxy_app
+from proxy.upstream import RecordingUpstream, ReplayUpstream, make_upstream, request_key
+
+
+class FakeAsyncClient:
+    # Stands in for httpx.AsyncClient while recording (no real network).
+    def __init__(self, timeout=8):
+        self.timeout = timeout
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    async def get(self, url, params=None):
+        data = {
+            "name": "London",
+            "sys": {"country": "GB"},
+            "main": {"temp": 1.0, "humidity": 90},
+            "wind": {"speed": 1.5},
+            "weather": [{"id": 801, "description": "few clouds"}],
+        }
+        return server.httpx.Response(200, json=data)
+
+
+def test_request_key_ignores_api_key_and_param_order():
+    # Recordings must not contain the API key, and param order shouldn't matter.
+    a = request_key("https://x/weather", {"appid": "secret", "q": "London,GB", "units": "metric"})
+    b = request_key("https://x/weather", {"units": "metric", "q": "London,GB"})
+    assert a == b
+    assert "secret" not in a
+
+
+def test_make_upstream_rejects_unknown_mode(tmp_path):
+    with pytest.raises(ValueError):
+        make_upstream("bogus", tmp_path / "rec.ndjson.gz")
+
+
+def test_record_then_replay_weather_offline(monkeypatch, tmp_path):
+    # Records one /weather call through a fake network, then replays it with no network at all.
+
+    path = tmp_path / "rec.ndjson.gz"
+
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "dummykey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    monkeypatch.setattr(server.httpx, "AsyncClient", FakeAsyncClient)
+    monkeypatch.setattr(server, "_upstream", RecordingUpstream(path))
+
+    client = TestClient(proxy_app)
+    recorded = client.get("/weather?city=London&country=gb")
+    assert recorded.status_code == 200
+    server._upstream.close()
+
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        lines = [json.loads(line) for line in fh if line.strip()]
+
+    assert len(lines) == 1
+    assert lines[0]["status"] == 200
+    assert "dummykey" not in lines[0]["key"]
+
+    # Replay: no API key and no HTTP client available.
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", None, raising=False)
+    monkeypatch.setattr(server.httpx, "AsyncClient", None)
+    monkeypatch.setattr(server, "_upstream", ReplayUpstream(path, latency_scale=0))
+
+    replayed = client.get("/weather?city=London&country=gb")
+    assert replayed.status_code == 200
+    assert replayed.json() == recorded.json()
+
+    # Anything that wasn't recorded is a clean 404, not a crash.
+    missing = client.get("/weather?city=Paris&country=fr")
+    assert missing.status_code == 404
+
+
+def test_replay_matches_city_id_and_query_forms(monkeypatch, tmp_path):
+    # A recording made before the DB knew the city id must replay after it does,
+    # and one made after must replay against a fresh DB.
+
+    path = tmp_path / "rec.ndjson.gz"
+    url = server.OPENWEATHER_URL
+    by_query = {"units": "metric", "lang": "en", "q": "London,GB"}
+    by_id = {"units": "metric", "lang": "en", "id": 2643743}
+
+    with gzip.open(path, "wt", encoding="utf-8") as fh:
+        fh.write(json.dumps({"key": request_key(url, by_query), "status": 200, "ms": 1, "json": {"n": 1}}) + "\n")
+        fh.write(json.dumps({
+            "key": request_key(url, {"units": "metric", "lang": "en", "id": 1}),
+            "alt": [request_key(url, dict(by_query, q="Paris,FR"))],
+            "status": 200, "ms": 1, "json": {"n": 2},
+        }) + "\n")
+
+    replay = ReplayUpstream(path, latency_scale=0)
+
+    r = asyncio.run(replay.get(url, by_id, (by_query,)))
+    assert r.json() == {"n": 1}
+
+    r = asyncio.run(replay.get(url, dict(by_query, q="Paris,FR")))
+    assert r.json() == {"n": 2}
+
+    assert asyncio.run(replay.get(url, by_id)).status_code == 404
+
+
+def test_replay_latency_scaling(tmp_path):
+    # Recorded latency is replayed scaled; "sampled" draws from the whole recording.
+
+    path = tmp_path / "rec.ndjson.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as fh:
+        fh.write(json.dumps({"key": "k1", "status": 200, "ms": 100.0, "json": {}}) + "\n")
+        fh.write(json.dumps({"key": "k2", "status": 200, "ms": 300.0, "json": {}}) + "\n")
+
+    replay = ReplayUpstream(path, latency_scale=0.5)
+    assert len(replay) == 2
+    assert replay._delay_seconds(replay._entries["k1"][0]) == pytest.approx(0.05)
+
+    sampled = ReplayUpstream(path, latency_scale=1.0, latency_mode="sampled", seed=1)
+    delays = {sampled._delay_seconds(sampled._entries["k1"][0]) for _ in range(50)}
+    assert delays <= {0.1, 0.3}
+
+    assert ReplayUpstream(path, latency_scale=0)._delay_seconds({"ms": 500}) == 0
+
+
+def test_startup_fails_fast_on_bad_upstream_config(monkeypatch, tmp_path):
+    # A missing replay file must stop startup, not turn every request into a 500.
+
+    monkeypatch.setattr(server, "_upstream", None)
+    monkeypatch.setattr(server, "UPSTREAM_MODE", "replay")
+    monkeypatch.setattr(server, "UPSTREAM_RECORDING", str(tmp_path / "missing.ndjson.gz"))
+
+    with pytest.raises(FileNotFoundError):
+        with TestClient(proxy_app):
+            pass
+
+
+def test_unauthorized_request_never_builds_upstream(monkeypatch):
+    monkeypatch.setattr(server, "_upstream", None)
+    monkeypatch.setattr(server, "UPSTREAM_MODE", "bogus")
+    monkeypatch.setattr(server, "PROXY_TOKENS", {"allowedtoken"}, raising=False)
+
+    r = TestClient(proxy_app).get("/weather?city=London&country=gb")
+    assert r.status_code == 401
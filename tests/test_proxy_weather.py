@@ -86,3 +86,203 @@ def test_proxy_weather_success(monkeypatch):
     assert "main" in body
     assert "wind" in body
     assert "weather" in body
+
+
+def test_prefetches_are_not_logged(monkeypatch):
+    # A client's background refresh isn't a lookup; it reports it via sync if the user asks for it.
+
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "dummykey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    monkeypatch.setattr(server.httpx, "AsyncClient", DummyAsyncClient)
+    monkeypatch.setattr(server, "_upstream", None)
+
+    client = TestClient(proxy_app)
+    assert client.get("/weather?city=London&country=gb", headers={"Purpose": "prefetch"}).status_code == 200
+    assert server._db_fetch_history(10) == []
+
+    client.get("/weather?city=London&country=gb")
+    assert len(server._db_fetch_history(10)) == 1
+
+
+def test_rate_limit_429_carries_retry_after(monkeypatch):
+    # Clients can wait out the per-minute limit instead of guessing.
+
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "dummykey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", {"retrytoken"}, raising=False)
+    monkeypatch.setattr(server, "OPENWEATHER_RATE_LIMIT_PER_MIN", 1)
+    monkeypatch.setattr(server, "_hits", server.defaultdict(server.deque))
+    monkeypatch.setattr(server.httpx, "AsyncClient", DummyAsyncClient)
+    monkeypatch.setattr(server, "_upstream", None)
+
+    client = TestClient(proxy_app)
+    headers = {"Authorization": "Bearer retrytoken"}
+    assert client.get("/weather?city=London&country=gb", headers=headers).status_code == 200
+
+    r = client.get("/weather?city=London&country=gb", headers=headers)
+    assert r.status_code == 429
+    assert 1 <= int(r.headers["retry-after"]) <= 60
+
+
+def test_weather_etag_and_conditional_304(monkeypatch):
+    # Same observation -> same ETag; If-None-Match with it gets an empty 304.
+
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "dummykey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    monkeypatch.setattr(server.httpx, "AsyncClient", DummyAsyncClient)
+    monkeypatch.setattr(server, "_upstream", None)
+
+    client = TestClient(proxy_app)
+    r = client.get("/weather?city=London&country=gb")
+    assert r.status_code == 200
+    assert "dt" in r.json()
+    etag = r.headers["etag"]
+
+    r = client.get("/weather?city=London&country=gb", headers={"If-None-Match": f'W/{etag}, "other"'})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["etag"] == etag
+
+    r = client.get("/weather?city=London&country=gb", headers={"If-None-Match": '"stale"'})
+    assert r.status_code == 200
+
+
+def test_one_upstream_call_serves_every_language(monkeypatch):
+    # en and ja share one language-neutral observation; ja text comes from the catalog.
+
+    calls = []
+
+    class CountingClient(DummyAsyncClient):
+        async def get(self, url, params=None):
+            calls.append(dict(params))
+            return DummyHTTPXResponse(200, data={
+                "id": 2643743,
+                "coord": {"lat": 51.5085, "lon": -0.1257},
+                "name": "London",
+                "sys": {"country": "GB"},
+                "main": {"temp": 1.0, "humidity": 90},
+                "wind": {"speed": 1.5},
+                "weather": [{"id": 801, "description": "few clouds"}, {"id": 999, "description": "odd sky"}],
+            })
+
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "dummykey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    monkeypatch.setattr(server.httpx, "AsyncClient", CountingClient)
+    monkeypatch.setattr(server, "_upstream", None)
+
+    client = TestClient(proxy_app)
+    en = client.get("/weather?city=London&country=gb&lang=en").json()
+    ja = client.get("/weather?city=London&country=gb&lang=ja").json()
+    fr = client.get("/weather?city=London&country=gb&lang=fr").json()
+
+    assert len(calls) == 1
+    assert "lang" not in calls[0]
+
+    assert [w["description"] for w in en["weather"]] == ["few clouds", "odd sky"]
+    assert [w["description"] for w in ja["weather"]] == ["晴れ（雲が少ない）", "odd sky"]
+    assert fr["weather"] == en["weather"]
+
+    # The cached observation itself stays English.
+    (key,) = list(server._weather_cache._items)
+    assert server._weather_cache.get(key)["weather"][0]["description"] == "few clouds"
+
+
+def test_ja_catalog_matches_client_map():
+    from proxy.descriptions import CATALOGS
+    from src.data.i18n import JP_WEATHER_ID
+
+    assert CATALOGS["ja"] == JP_WEATHER_ID
+
+
+def test_client_units_match_the_proxy():
+    # src/functions/units.py is a copy of proxy/units.py; they must convert alike.
+    from proxy import units as proxy_units
+    from src.functions import units as client_units
+
+    assert client_units.UNITS == proxy_units.UNITS
+    assert client_units.TEMP_FIELDS == proxy_units.TEMP_FIELDS
+    assert client_units.SPEED_FIELDS == proxy_units.SPEED_FIELDS
+
+    values = (None, True, "7", -40, 0, 0.5, 21.37, 300.0, -1e6)
+    for units in proxy_units.UNITS:
+        for back in (False, True):
+            for v in values:
+                assert client_units.convert_temp(v, units, back) == proxy_units.convert_temp(v, units, back)
+                assert client_units.convert_speed(v, units, back) == proxy_units.convert_speed(v, units, back)
+
+        data = {"main": {"temp": 21.5, "feels_like": 20, "humidity": 60}, "wind": {"speed": 4.2, "deg": 90}}
+        assert client_units.convert(data, units) == proxy_units.convert(data, units)
+
+
+def test_units_share_one_canonical_observation(monkeypatch):
+    # metric, imperial and standard are one upstream (metric) call, converted per response.
+
+    calls = []
+
+    class CountingClient(DummyAsyncClient):
+        async def get(self, url, params=None):
+            calls.append(dict(params))
+            return DummyHTTPXResponse(200, data={
+                "id": 2643743,
+                "name": "London",
+                "main": {"temp": 10.0, "feels_like": 8.5, "humidity": 90},
+                "wind": {"speed": 4.4704, "deg": 200},
+                "weather": [{"id": 801, "description": "few clouds"}],
+            })
+
+    monkeypatch.setattr(server, "OPENWEATHER_API_KEY", "dummykey", raising=False)
+    monkeypatch.setattr(server, "PROXY_TOKENS", set(), raising=False)
+    monkeypatch.setattr(server.httpx, "AsyncClient", CountingClient)
+    monkeypatch.setattr(server, "_upstream", None)
+
+    client = TestClient(proxy_app)
+    metric = client.get("/weather?city=London&country=gb").json()
+    imperial = client.get("/weather?city=London&country=gb&units=imperial").json()
+    standard = client.get("/weather?city=London&country=gb&units=STANDARD").json()
+
+    assert len(calls) == 1 and calls[0]["units"] == "metric"
+    assert metric["main"]["temp"] == 10.0
+    assert imperial["main"] == {"temp": 50.0, "feels_like": 47.3, "humidity": 90}
+    assert imperial["wind"] == {"speed": 10.0, "deg": 200}
+    assert standard["main"]["temp"] == 283.15 and standard["wind"]["speed"] == 4.4704
+
+    assert client.get("/weather?city=London&country=gb&units=furlongs").status_code == 400
+
+    # History stays comparable: every row is metric.
+    rows = client.get("/history?limit=10").json()["items"]
+    assert {(r["units"], r["temp"]) for r in rows} == {("metric", 10.0)}
+
+
+def test_old_rows_in_other_units_are_converted_once(tmp_path, monkeypatch):
+    import json, sqlite3
+
+    path = tmp_path / "old.sqlite"
+    monkeypatch.setenv("WEATHER_DB_PATH", str(path))
+
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE weather_history (id INTEGER PRIMARY KEY AUTOINCREMENT, created_utc TEXT NOT NULL, "
+        "query_type TEXT NOT NULL, city TEXT, postal TEXT, country TEXT NOT NULL, units TEXT NOT NULL, "
+        "name TEXT, description TEXT, temp REAL, humidity INTEGER, wind_speed REAL, raw_json TEXT);"
+    )
+    conn.executemany(
+        "INSERT INTO weather_history (created_utc, query_type, city, country, units, temp, wind_speed, raw_json) "
+        "VALUES ('2025-01-01T00:00:00+00:00', 'city', 'London', 'GB', ?, ?, ?, ?);",
+        [
+            ("imperial", 50.0, 10.0, json.dumps({"main": {"temp": 50.0}, "wind": {"speed": 10.0}})),
+            ("standard", 283.15, 3.0, None),
+            ("metric", 10.0, 3.0, None),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    server._db_init()
+
+    conn = server._db_connect()
+    rows = conn.execute("SELECT units, temp, wind_speed, raw_json FROM weather_history ORDER BY id;").fetchall()
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT id FROM weather_history WHERE units <> 'metric';").fetchall()
+    conn.close()
+
+    assert [(r[0], r[1], r[2]) for r in rows] == [("metric", 10.0, 4.47), ("metric", 10.0, 3.0), ("metric", 10.0, 3.0)]
+    assert json.loads(rows[0][3]) == {"main": {"temp": 10.0}, "wind": {"speed": 4.47}}
+    assert "idx_weather_history_units" in " ".join(r[3] for r in plan)
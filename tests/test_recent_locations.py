@@ -0,0 +1,182 @@
+from types import SimpleNamespace
+import src.main as main
+import src.functions.get_weather as get_weather
+from src.functions.recent import prefetch, load_recent, format_recent, pick
+from src.data.local_history import log_weather, add_central_rows, recent_locations, unsynced_rows
+
+
+class DummyResponse:
+    # Mimics a basic requests.Response for tests (no network involved).
+    def __init__(self, status_code=200, json_data=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self._json_data = json_data or {}
+        self.headers = {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._json_data
+
+
+def _obs(name, temp=10.0):
+    return {"name": name, "main": {"temp": temp, "humidity": 50}, "wind": {"speed": 2.5},
+            "weather": [{"id": 800, "description": "clear sky"}]}
+
+
+def _log(query_type, text, country, times=1):
+    for _ in range(times):
+        log_weather(
+            query_type=query_type,
+            city=text if query_type == "city" else None,
+            postal=text if query_type == "postal" else None,
+            country=country,
+            units="metric",
+            lang="en",
+            data=_obs(text),
+        )
+
+
+def test_recent_locations_are_most_frequent_first():
+    _log("city", "Tokyo", "JP", times=1)
+    _log("city", "London", "GB", times=3)
+    _log("postal", "22304", "US", times=2)
+    _log("city", "london ", "GB", times=1)    # same location, spelled differently
+
+    # Another device's lookups (pulled in by sync) aren't this user's.
+    add_central_rows(
+        [{"id": i, "created_utc": "2099-01-01T00:00:00+00:00", "query_type": "city", "city": "Paris",
+          "country": "FR", "raw": _obs("Paris")} for i in range(1, 6)],
+        next_id=5,
+    )
+
+    recent = recent_locations(limit=2)
+    assert [(r["query_type"], r["text"], r["country"], r["count"]) for r in recent] == [
+        ("city", "london ", "GB", 4),
+        ("postal", "22304", "US", 2),
+    ]
+
+
+def test_recent_locations_ignores_old_lookups():
+    _log("city", "London", "GB")
+    assert recent_locations(days=0) == []
+
+
+def test_prefetch_fills_the_cache_so_a_pick_needs_no_request(monkeypatch, capsys, set_proxy_env):
+    _log("city", "London", "GB")
+    monkeypatch.setattr(get_weather, "WEATHER_CACHE_TTL_SEC", 0)    # history is stale: refetch
+
+    calls = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        calls.append(params)
+        return DummyResponse(200, _obs("London", temp=21.5))
+
+    monkeypatch.setattr(get_weather, "_get_session", lambda: SimpleNamespace(get=fake_get))
+
+    recent, refreshes = load_recent(lang="en")
+    assert [r["text"] for r in recent] == ["London"]
+    assert refreshes[0].result(timeout=10) is True
+    assert len(calls) == 1
+
+    monkeypatch.setattr(get_weather, "WEATHER_CACHE_TTL_SEC", 600)
+    result = get_weather.get_weather_by_city_name("London", "gb")
+
+    assert result["cached"] is True
+    assert result["main"]["temp"] == 21.5
+    assert len(calls) == 1
+    assert "cached" in capsys.readouterr().out
+
+
+def test_prefetches_count_only_once_picked(monkeypatch, set_proxy_env):
+    _log("city", "London", "GB")
+    monkeypatch.setattr(get_weather, "WEATHER_CACHE_TTL_SEC", 0)
+
+    sent = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        sent.append(headers)
+        return DummyResponse(200, _obs("London", temp=21.5))
+
+    monkeypatch.setattr(get_weather, "_get_session", lambda: SimpleNamespace(get=fake_get))
+
+    (future,) = prefetch([{"query_type": "city", "text": "London", "country": "GB"}])
+    assert future.result(timeout=10) is True
+    assert sent[0]["Purpose"] == "prefetch"
+
+    # A refresh isn't a lookup: no extra weight in the ranking, nothing new to upload.
+    assert recent_locations()[0]["count"] == 1
+    assert len(unsynced_rows()) == 1
+
+    monkeypatch.setattr(get_weather, "WEATHER_CACHE_TTL_SEC", 600)
+    assert get_weather.fetch_weather("city", "London", "GB")["cached"] is True
+
+    # Served to the user: now it is one.
+    assert recent_locations()[0]["count"] == 2
+    assert len(unsynced_rows()) == 2
+
+
+def test_prefetch_reports_failures_without_raising(monkeypatch, set_proxy_env):
+    import requests
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        raise requests.exceptions.ConnectionError("proxy down")
+
+    monkeypatch.setattr(get_weather, "_get_session", lambda: SimpleNamespace(get=fake_get))
+
+    (future,) = prefetch([{"query_type": "city", "text": "London", "country": "GB"}])
+    assert future.result(timeout=10) is False
+
+
+def test_offline_lists_recent_without_fetching():
+    _log("city", "London", "GB")
+
+    recent, refreshes = load_recent(offline=True)
+    assert len(recent) == 1 and refreshes == []
+
+
+def test_pick_and_format():
+    locations = [{"query_type": "city", "text": "London", "country": "GB"},
+                 {"query_type": "postal", "text": "22304", "country": "US"}]
+
+    assert format_recent(locations) == ["  1) London, GB", "  2) 22304, US"]
+    assert pick(locations, "2") is locations[1]
+    assert pick(locations, " 1 ") is locations[0]
+    for answer in ("", "0", "3", "x", "-1"):
+        assert pick(locations, answer) is None
+
+
+def test_quick_pick_reprompts_on_bad_input(monkeypatch, capsys):
+    locations = [{"query_type": "city", "text": "London", "country": "GB"}]
+    answers = iter(["9", "1"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+
+    assert main._quick_pick(locations, "en") is locations[0]
+    out = capsys.readouterr().out
+    assert "1) London, GB" in out
+    assert "Invalid selection" in out
+
+    monkeypatch.setattr("builtins.input", lambda prompt="": "")
+    assert main._quick_pick(locations, "en") is None
+    assert main._quick_pick([], "en") is None
+
+
+def test_warm_up_pings_the_proxy_root(monkeypatch, set_proxy_env):
+    urls = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        urls.append(url)
+        return DummyResponse(200, {"status": "ok"})
+
+    monkeypatch.setattr(get_weather, "_get_session", lambda: SimpleNamespace(get=fake_get))
+
+    main._warm_up(proxy=True)
+    assert urls == ["https://example.com/"]
+
+    # Failures are left for the first real lookup to report.
+    def down(url, params=None, headers=None, timeout=None):
+        raise get_weather.requests.exceptions.ConnectionError("asleep")
+
+    monkeypatch.setattr(get_weather, "_get_session", lambda: SimpleNamespace(get=down))
+    assert get_weather.warm_up_proxy() is False
@@ -50,4 +50,57 @@ def test_prompt_country_code_reject_then_accept(monkeypatch, capsys):
     assert code == "JP"
 
     out = capsys.readouterr().out
-    assert "Okay" in out
\ No newline at end of file
+    assert "Okay" in out
+
+def test_resolve_country_returns_plain_records():
+    best, _ = resolve_country("jp")
+    assert best == ("JP", "JPN", "Japan", "日本")
+    assert (best.alpha_2, best.alpha_3, best.name, best.name_ja) == ("JP", "JPN", "Japan", "日本")
+
+
+def test_resolve_country_japanese_and_common_names():
+    for text, code in (("日本", "JP"), ("ドイツ", "DE"), ("アメリカ", "US"), ("South Korea", "KR"),
+                       ("Côte d'Ivoire", "CI"), ("cote divoire", None), ("UK", "GB"), ("Ｊａｐａｎ", "JP")):
+        best, candidates = resolve_country(text, allow_fuzzy=False)
+        assert (best.alpha_2 if best else None) == code, text
+
+
+def test_resolve_country_fuzzy_candidates():
+    best, candidates = resolve_country("germny")
+    assert best.alpha_2 == "DE"
+
+    best, candidates = resolve_country("korea")
+    assert {c.alpha_2 for c in candidates[:2]} == {"KP", "KR"}
+
+    assert resolve_country("zzzzzz") == (None, [])
+
+
+def test_country_index_is_cached_on_disk(monkeypatch):
+    # Built from pycountry once; later processes load the cache instead.
+    from src.data import country_index
+
+    monkeypatch.setattr(country_index, "_index", None)
+    country_index.get_index()
+    assert country_index.cache_path().exists()
+
+    def no_pycountry():
+        raise AssertionError("index rebuilt instead of read from disk")
+
+    monkeypatch.setattr(country_index, "_index", None)
+    monkeypatch.setattr(country_index, "build", no_pycountry)
+    assert country_index.get_index().lookup("japan").alpha_2 == "JP"
+
+    # A cache from another index version is ignored and rebuilt.
+    monkeypatch.setattr(country_index, "_index", None)
+    monkeypatch.setattr(country_index, "INDEX_VERSION", country_index.INDEX_VERSION + 1)
+    with pytest.raises(AssertionError):
+        country_index.get_index()
+
+
+def test_prompt_shows_japanese_names(monkeypatch, capsys):
+    inputs = iter(["korea", "2", "y"])
+    monkeypatch.setattr(builtins, "input", lambda _: next(inputs))
+
+    code = prompt_country_code(confirm=True, allow_fuzzy=True, lang="ja")
+    assert code in ("KP", "KR")
+    assert "大韓民国" in capsys.readouterr().out
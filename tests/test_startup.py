@@ -0,0 +1,24 @@
+import sys
+import src.main as main
+from benchmarks.startup_imports import run
+
+# Time-to-first-prompt budget for `import src.main` (median of fresh interpreters).
+# It measures ~20 ms locally; the slack covers slow CI machines.
+STARTUP_BUDGET_MS = 100
+
+
+def test_cli_import_stays_within_budget():
+    result = run(runs=3)
+
+    assert result["heavy_imported"] == [], result
+    assert result["median_ms"] < STARTUP_BUDGET_MS, result
+
+
+def test_warm_up_loads_countries_and_http_client(monkeypatch):
+    from src.data import country_index
+    monkeypatch.setattr(country_index, "_index", None)
+
+    main._warm_up()
+
+    assert country_index._index is not None
+    assert "requests" in sys.modules
@@ -0,0 +1,138 @@
+import io, json, sqlite3, pytest
+from src.data import local_history
+from src.data.local_history import init_db, log_weather, location_key, trend_columns, db_path
+from src.functions import trends
+from src.functions.trends import compute_trends, format_trends, run_trends
+
+
+def _insert(rows):
+    # (created_utc, temp, humidity, weather_id) rows for Tokyo, straight into the DB.
+
+    with local_history._lock:
+        conn = local_history._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO weather_history (created_utc, query_type, city, country, units, lang, "
+                "temp, humidity, weather_id, loc_key) VALUES (?, 'city', 'Tokyo', 'JP', 'metric', 'en', ?, ?, ?, ?);",
+                [(*r, location_key("city", "Tokyo", "JP")) for r in rows],
+            )
+
+
+def _sample():
+    init_db()
+    _insert([
+        ("2026-01-01T01:00:00+00:00", 2.0, 40, 800),
+        ("2026-01-01T13:00:00+00:00", 8.0, 55, 801),
+        ("2026-01-01T23:59:59.900000+00:00", 5.0, 100, 803),
+        ("2026-01-02T06:00:00+00:00", None, None, None),
+        ("2026-01-02T12:00:00+00:00", 10.0, 95, 500),
+        ("2026-01-03T12:00:00+00:00", 12.0, 91, 501),
+        ("2026-01-03T18:00:00+00:00", 14.0, 3, 501),
+    ])
+    return trend_columns(location_key("city", "tokyo", "jp"))
+
+
+@pytest.fixture(params=["numpy", "array"])
+def backend(request, monkeypatch):
+    # Runs a test with NumPy (when installed) and with the array-module fallback.
+
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(trends, "np", None)
+    return request.param
+
+
+def test_trends_daily_stats_humidity_and_conditions(backend):
+    result = compute_trends(_sample(), window=2)
+
+    assert result["rows"] == 7
+    assert [(d["date"], d["min"], d["max"], d["count"]) for d in result["daily"]] == [
+        ("2026-01-01", 2.0, 8.0, 3),
+        ("2026-01-02", 10.0, 10.0, 1),
+        ("2026-01-03", 12.0, 14.0, 2),
+    ]
+    assert [d["mean"] for d in result["daily"]] == pytest.approx([5.0, 10.0, 13.0])
+    assert result["daily"][0]["moving_avg"] is None
+    assert [d["moving_avg"] for d in result["daily"][1:]] == pytest.approx([7.5, 11.5])
+
+    # 100% goes in the top bucket; the empty row counts nowhere.
+    assert result["humidity"] == [1, 0, 0, 0, 1, 1, 0, 0, 0, 3]
+
+    assert result["conditions"] == [
+        {"group": 2, "count": 3, "top_id": 501},
+        {"group": 6, "count": 2, "top_id": 801},
+        {"group": 5, "count": 1, "top_id": 800},
+    ]
+
+
+def test_trends_of_a_location_without_history(backend):
+    init_db()
+    result = compute_trends(trend_columns(location_key("city", "Nowhere", "US")))
+    assert result == {"rows": 0, "daily": [], "humidity": [0] * 10, "conditions": []}
+    assert "0 observations" in format_trends("Nowhere, US", result)
+
+
+def test_trends_read_only_the_covering_index():
+    init_db()
+    with local_history._lock:
+        conn = local_history._connect()
+        plan = [r["detail"] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT created_utc, temp, humidity, weather_id FROM weather_history "
+            "INDEXED BY idx_wh_trends WHERE loc_key = ? ORDER BY created_utc;", ("x",)
+        )]
+    assert plan == ["SEARCH weather_history USING COVERING INDEX idx_wh_trends (loc_key=?)"]
+
+
+def test_log_weather_records_condition_id_and_old_rows_are_backfilled():
+    # Rows from before weather_id existed get it from their saved JSON.
+
+    path = db_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    for migration in local_history.MIGRATIONS[:3]:
+        migration(conn)
+    conn.execute("PRAGMA user_version = 3;")
+    conn.execute(
+        "INSERT INTO weather_history (created_utc, query_type, city, country, units, lang, raw_json) "
+        "VALUES ('2026-01-01T00:00:00+00:00', 'city', 'Tokyo', 'JP', 'metric', 'en', ?);",
+        (json.dumps({"lang": "en", "data": {"weather": [{"id": 611}]}}),),
+    )
+    conn.commit()
+    conn.close()
+
+    init_db()
+    log_weather(
+        query_type="city", city="Tokyo", postal=None, country="JP", units="metric", lang="en",
+        data={"main": {"temp": 1.0}, "weather": [{"id": 600}]},
+    )
+    local_history.flush()
+
+    with local_history._lock:
+        ids = [r[0] for r in local_history._connect().execute("SELECT weather_id FROM weather_history ORDER BY id;")]
+    assert ids == [611, 600]
+
+
+def test_run_trends_prints_a_report(monkeypatch):
+    _sample()
+    monkeypatch.setattr(trends, "resolve_locations", lambda parsed: ([("city", "Tokyo", "JP")], []))
+
+    out = io.StringIO()
+    assert run_trends(["Tokyo,jp"], lang="ja", out=out) == 0
+
+    report = out.getvalue()
+    assert "Tokyo, JP: 7 件" in report
+    assert "2026-01-03" in report and "(雨)" in report and "(快晴)" in report
+
+
+def test_run_trends_shows_temperatures_in_the_chosen_units(monkeypatch):
+    _sample()
+    monkeypatch.setattr(trends, "resolve_locations", lambda parsed: ([("city", "Tokyo", "JP")], []))
+
+    out = io.StringIO()
+    run_trends(["Tokyo,jp"], out=out, units="imperial")
+
+    report = out.getvalue()
+    assert "(°F)" in report
+    # 2026-01-03: min 12 °C, max 14 °C.
+    assert "2026-01-03    53.6    57.2" in report
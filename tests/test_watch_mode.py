@@ -0,0 +1,89 @@
+import io, sqlite3
+from types import SimpleNamespace
+import src.functions.get_weather as get_weather
+from src.functions.watch import Watcher, next_poll, diff, observation
+from src.data.local_history import db_path, flush
+
+
+class DummyResponse:
+    # Mimics a basic requests.Response for tests (no network involved).
+    def __init__(self, status_code=200, json_data=None, etag=None):
+        self.status_code = status_code
+        self._json_data = json_data or {}
+        self.headers = {"ETag": etag} if etag else {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._json_data
+
+
+def _london(temp):
+    return {
+        "name": "London",
+        "main": {"temp": temp, "humidity": 50},
+        "wind": {"speed": 2.5},
+        "weather": [{"description": "clear sky"}],
+    }
+
+
+def test_next_poll_is_aligned_to_the_clock():
+    # 10-minute interval, 30s after each boundary.
+    assert next_poll(1000.0, 600, 30) == 1230.0
+    assert next_poll(1230.0, 600, 30) == 1830.0
+    assert next_poll(1229.9, 600, 30) == 1230.0
+
+
+def test_diff_lists_only_changes():
+    old = observation(dict(_london(10.0), description="clear sky"))
+    new = observation(dict(_london(11.5), description="clear sky"))
+
+    assert diff(old, new) == ["temp 10.0 -> 11.5°C"]
+    assert diff(old, old) == []
+    assert len(diff(None, new)) == 4
+
+    imperial = observation(dict(_london(50.0), wind={"speed": 10.0}, description="clear sky"))
+    assert diff(None, imperial, "imperial")[:1] == ["temp 50.0°F"]
+    assert diff(None, imperial, "imperial")[2] == "wind_speed 10.0 mph"
+
+
+def test_watch_uses_conditional_requests_and_prints_deltas(monkeypatch, set_proxy_env):
+    # Poll 1: new -> full line. Poll 2: 304 -> nothing. Poll 3: temp changed -> delta only.
+
+    responses = [
+        DummyResponse(200, _london(10.0), etag='"v1"'),
+        DummyResponse(304),
+        DummyResponse(200, _london(11.0), etag='"v2"'),
+    ]
+    sent = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        sent.append(dict(headers or {}))
+        return responses[len(sent) - 1]
+
+    monkeypatch.setattr(get_weather, "_get_session", lambda: SimpleNamespace(get=fake_get))
+    monkeypatch.setattr(get_weather, "WEATHER_CACHE_TTL_SEC", 0)
+
+    out = io.StringIO()
+    waits = []
+    watcher = Watcher([("city", "London", "GB")], interval=600, out=out)
+    watcher.run(max_polls=3, clock=lambda: 1000.0, sleep=waits.append)
+
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 2
+    assert "temp 10.0°C" in lines[0]
+    assert lines[1].endswith("London, GB: temp 10.0 -> 11.0°C")
+
+    assert "If-None-Match" not in sent[0]
+    assert sent[1]["If-None-Match"] == '"v1"'
+    assert sent[2]["If-None-Match"] == '"v1"'
+
+    # Aligned sleeps, and only the two real observations were logged.
+    assert waits == [230.0, 230.0]
+    flush()
+    conn = sqlite3.connect(db_path())
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM weather_history;").fetchone()[0] == 2
+    finally:
+        conn.close()
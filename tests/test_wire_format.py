@@ -0,0 +1,206 @@
+import re, gzip, json, pytest
+import proxy.server as server
+import src.functions.sync as sync
+from fastapi.testclient import TestClient
+from proxy import wire
+from proxy.server import app as proxy_app
+from src.data import local_history
+from src.data.local_history import init_db, log_weather
+from src.functions import wire as client_wire
+
+msgpack = pytest.importorskip("msgpack")
+
+AUTH = {"Authorization": "Bearer tok"}
+
+
+@pytest.fixture
+def proxy(monkeypatch):
+    monkeypatch.setattr(server, "PROXY_TOKENS", {"tok"}, raising=False)
+    monkeypatch.setenv("WEATHER_PROXY_URL", "http://testserver/weather")
+    monkeypatch.setenv("WEATHER_PROXY_TOKEN", "tok")
+    server._db_init()
+    init_db()
+    return TestClient(proxy_app)
+
+
+class _Session:
+    # requests-style calls routed to the proxy app in-process.
+
+    def __init__(self, client):
+        self.client = client
+        self.accepts = []
+
+    def post(self, url, params=None, data=None, headers=None, timeout=None):
+        return self.client.post(url, params=params, content=data, headers=headers)
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.accepts.append((headers or {}).get("Accept"))
+        return self.client.get(url, params=params, headers=headers)
+
+
+def _log(city, temp=10.0):
+    log_weather(
+        query_type="city", city=city, postal=None, country="GB", units="metric", lang="en",
+        data={"name": city, "main": {"temp": temp}, "weather": [{"id": 800}]},
+    )
+
+
+def _proxy_log(city, temp):
+    server._db_log(
+        query_type="city", city=city, postal=None, country="GB", units="metric",
+        data={"name": city, "main": {"temp": temp, "humidity": 70}, "wind": {"speed": 3.5},
+              "weather": [{"id": 500, "description": "light rain"}]},
+    )
+
+
+def test_negotiate_follows_accept_quality():
+    assert wire.negotiate(None) == wire.JSON
+    assert wire.negotiate("application/json") == wire.JSON
+    assert wire.negotiate("application/x-msgpack") == wire.MSGPACK
+    assert wire.negotiate("application/msgpack, application/json;q=0.5") == wire.MSGPACK
+    assert wire.negotiate("application/x-msgpack;q=0.2, */*") == wire.JSON
+    assert wire.negotiate("application/x-msgpack;q=0") == wire.JSON
+
+
+def test_columns_round_trip_with_float32_and_missing_values():
+    items = [
+        {"city": "London", "temp": 11.25, "humidity": 70, "raw": {"a": 1}},
+        {"city": "Paris", "temp": None, "humidity": None, "raw": None},
+        {"city": "東京", "temp": -3.5, "humidity": 40, "raw": None},
+    ]
+
+    packed = wire.encode({"items": items, "next": 9}, wire.MSGPACK, "columns")
+    columns = msgpack.unpackb(packed, raw=False)["items"]["columns"]
+    assert columns["temp"]["dtype"] == "f4" and len(columns["temp"]["data"]) == 12
+    assert columns["humidity"] == [70, None, 40]
+
+    for decode in (wire.decode, client_wire.decode):
+        assert decode(packed, wire.MSGPACK) == {"items": items, "next": 9}
+
+    # More decimals than float32 keeps: sent as doubles, unchanged.
+    exact = [{"temp": 11.257}, {"temp": 2.0}]
+    packed = wire.encode({"items": exact}, wire.MSGPACK, "columns")
+    assert wire.decode(packed, wire.MSGPACK)["items"] == exact
+
+    # JSON columns are plain lists.
+    as_json = wire.encode({"items": items}, wire.JSON, "columns")
+    assert json.loads(as_json)["items"]["columns"]["city"] == ["London", "Paris", "東京"]
+    assert wire.decode(as_json)["items"] == items
+
+
+def test_decode_rejects_malformed_bodies():
+    with pytest.raises(ValueError):
+        wire.decode(b"\xc1", wire.MSGPACK)
+    with pytest.raises(ValueError):
+        wire.decode(msgpack.packb([1, 2]), wire.MSGPACK)
+    with pytest.raises(ValueError):
+        bad = {"items": {"layout": "columns", "count": 2, "columns": {"city": ["x"]}}}
+        wire.decode(msgpack.packb(bad), wire.MSGPACK)
+
+
+def test_client_wire_decodes_like_the_proxy():
+    # src/functions/wire.py is a copy of proxy/wire.py's decoding; they must agree,
+    # on good bodies and on malformed ones.
+
+    assert (client_wire.JSON, client_wire.MSGPACK) == (wire.JSON, wire.MSGPACK)
+    assert client_wire._MSGPACK_TYPES == wire._MSGPACK_TYPES
+    assert client_wire.FLOAT32_DECIMALS == wire.FLOAT32_DECIMALS
+
+    items = [{"city": "London", "temp": 11.25, "wind": 3.5, "raw": {"a": [1]}},
+             {"city": "Paris", "temp": None, "wind": 1.123, "raw": None}]
+    bodies = [
+        (wire.encode({"items": items, "next": 2}, media_type, layout), media_type)
+        for media_type in (wire.JSON, wire.MSGPACK)
+        for layout in wire.LAYOUTS
+    ]
+    bad_tables = [
+        {"layout": "columns", "count": 2, "columns": {"city": ["x"]}},
+        {"layout": "columns", "count": -1, "columns": {}},
+        {"layout": "columns", "count": 1, "columns": {"t": {"dtype": "f8", "data": b"\0" * 8}}},
+        {"layout": "columns", "count": 2, "columns": {"t": {"dtype": "f4", "data": b"\0" * 4}}},
+    ]
+    bodies += [(msgpack.packb({"items": t}), wire.MSGPACK) for t in bad_tables]
+    bodies += [(b"\xc1", wire.MSGPACK), (b"[1]", wire.JSON), (b"{", None)]
+
+    for data, content_type in bodies:
+        try:
+            expected = wire.decode(data, content_type)
+        except ValueError as exc:
+            with pytest.raises(ValueError, match=re.escape(str(exc))):
+                client_wire.decode(data, content_type)
+        else:
+            assert client_wire.decode(data, content_type) == expected
+
+
+def test_history_and_search_answer_in_the_negotiated_format(proxy):
+    _proxy_log("London", 11.5)
+    _proxy_log("Leeds", 9.25)
+
+    plain = proxy.get("/history", headers=AUTH)
+    assert plain.headers["content-type"].startswith("application/json")
+    assert plain.headers["vary"] == "Accept"
+
+    binary = proxy.get("/history?layout=columns", headers=dict(AUTH, Accept=wire.MSGPACK))
+    assert binary.headers["content-type"] == wire.MSGPACK
+    assert wire.decode(binary.content, binary.headers["content-type"]) == plain.json()
+
+    found = proxy.get("/search?q=leeds", headers=dict(AUTH, Accept=wire.MSGPACK))
+    assert [r["city"] for r in wire.decode(found.content, wire.MSGPACK)["items"]] == ["Leeds"]
+
+    assert proxy.get("/history?layout=sideways", headers=AUTH).status_code == 400
+
+
+def test_since_can_be_gzipped_msgpack_columns(proxy):
+    _proxy_log("York", 8.75)
+
+    headers = dict(AUTH, Accept=wire.MSGPACK, **{"Accept-Encoding": "gzip"})
+    r = proxy.get("/history/since?after=0&layout=columns", headers=headers)
+    assert r.headers["content-type"] == wire.MSGPACK
+    assert r.headers["vary"] == "Accept, Accept-Encoding"
+
+    page = wire.decode(r.content, r.headers["content-type"])
+    assert page["next"] == 1
+    assert page["items"][0]["city"] == "York" and page["items"][0]["temp"] == 8.75
+
+
+def test_sync_endpoint_takes_msgpack_batches(proxy):
+    rows = [
+        {"id": 1, "created_utc": "2026-01-01T00:00:00+00:00", "city": "X", "country": "US", "temp": 1.5},
+        {"id": 2, "city": "X"},
+    ]
+    headers = dict(AUTH, **{"Content-Type": wire.MSGPACK, "Content-Encoding": "gzip"})
+
+    body = gzip.compress(msgpack.packb({"items": rows}))
+    r = proxy.post("/history/sync?device_id=laptop-01", content=body, headers=headers)
+    assert r.json()["inserted"] == 1 and r.json()["rejected"] == 1 and r.json()["last_id"] == 2
+
+    bad = gzip.compress(msgpack.packb({"items": "nope"}))
+    assert proxy.post("/history/sync?device_id=laptop-01", content=bad, headers=headers).status_code == 400
+
+
+def test_sync_round_trip_uses_msgpack(proxy):
+    _log("London", 12.5)
+    _log("Leeds")
+
+    session = _Session(proxy)
+    assert sync.upload(session, "http://testserver", local_history.device_id()) == 2
+    # One probe before the first batch.
+    assert session.accepts == [wire.MSGPACK]
+
+    _proxy_log("Paris", 14.25)
+    assert sync.download(session, "http://testserver", local_history.device_id()) == 1
+    assert "Paris" in [r["city"] for r in local_history.fetch_history(10)]
+
+
+def test_client_falls_back_to_ndjson_for_a_proxy_without_msgpack(proxy, monkeypatch):
+    monkeypatch.setattr(wire, "msgpack", None)
+    _log("London")
+
+    session = _Session(proxy)
+    assert sync.upload(session, "http://testserver", local_history.device_id()) == 1
+
+    conn = server._db_connect()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM weather_history;").fetchone()[0] == 1
+    finally:
+        conn.close()